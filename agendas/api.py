@@ -7,9 +7,10 @@ import tastypie.fields as fields
 from avatar.templatetags.avatar_tags import avatar_url
 from django.contrib.auth.models import User
 
-from models import Agenda, AgendaVote
+from models import Agenda, AgendaVote, dateMonthTruncate
+from scoring import AgendaScoreMatrix
 from apis.resources.base import BaseResource
-from mks.models import Member, Party
+from mks.models import Member, Party, Knesset
 
 from operator import itemgetter
 
@@ -87,15 +88,31 @@ class AgendaResource(BaseResource):
         excludes = ['is_public']
         list_fields = ['name', 'id', 'description', 'public_owner_name']
 
+    def _get_ranges(self, bundle):
+        """Parse the ranges parameter.
+
+        Either comma separated YYYYMM-YYYYMM ranges (each side optional),
+        'knessets' for a range per knesset or 'years' for a range per year
+        of the agenda's votes (a single open range if it has none). Returns
+        None when no ranges were requested.
+        """
+        rangesString = bundle.request.GET.get('ranges', None)
+        if rangesString is None:
+            return None
+        if rangesString == 'knessets':
+            return [[dateMonthTruncate(knesset.start_date) if knesset.start_date else None, knesset.end_date]
+                    for knesset in Knesset.objects.order_by('number')]
+        if rangesString == 'years':
+            return AgendaScoreMatrix.for_agenda(bundle.obj.id).year_ranges()
+        return map(lambda rangeString: [datetime.strptime(val, "%Y%m") if val else None
+                                        for val in rangeString.split('-')],
+                   rangesString.split(','))
+
     def dehydrate_members(self, bundle):
-        rangesString = bundle.request.GET.get('ranges',None)
-        fullRange = rangesString is None
-        if not fullRange:
-            ranges = map(   lambda rangeString:[datetime.strptime(val,"%Y%m") if val else None for val in rangeString.split('-')],
-                            rangesString.split(','))
-            mks_values = dict(bundle.obj.get_mks_values(ranges))
-        else:
-            mks_values = dict(bundle.obj.get_mks_values())
+        ranges = self._get_ranges(bundle)
+        mks_values = bundle.obj.get_mks_values(ranges)
+        if type(mks_values) is not dict:
+            mks_values = dict(mks_values)
         members = []
         for mk in Member.objects.filter(pk__in=mks_values.keys(),
                                         current_party__isnull=False).select_related('current_party'):
@@ -151,15 +168,13 @@ class AgendaResource(BaseResource):
         ]
 
     def dehydrate_ranges(self, bundle):
-        rangesString = bundle.request.GET.get('ranges','-')
-        ranges = map(   lambda rangeString:[int(val) if val else None for val in rangeString.split('-')],
-                        rangesString.split(','))
+        ranges = self._get_ranges(bundle) or [[None, None]]
         results = []
-        for start,end in ranges:
+        for start, end in ranges:
             rangeResult = {}
             if start:
-                rangeResult['from']=datetime(year=start/100,month=start%100,day=1)
+                rangeResult['from'] = datetime(year=start.year, month=start.month, day=1)
             if end:
-                rangeResult['to']=datetime(year=end/100,month=end%100,day=1)
+                rangeResult['to'] = datetime(year=end.year, month=end.month, day=1)
             results.append(rangeResult)
         return results
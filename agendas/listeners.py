@@ -5,9 +5,10 @@ from django.contrib.contenttypes.models import ContentType
 from planet.models import Feed, Post
 from actstream import action
 from actstream.models import Follow
-from knesset.utils import cannonize, disable_for_loaddata
+from knesset.utils import cannonize, disable_for_loaddata, defer, deferred_when_suppressed
 from agendas.models import AgendaVote, AgendaMeeting, AgendaBill, Agenda
 from links.models import Link, LinkType
+from laws.models import Vote, VoteAction
 
 @disable_for_loaddata
 def record_agenda_ascription_action(sender, created, instance, **kwargs):
@@ -97,3 +98,31 @@ def update_num_followers(sender, instance, **kwargs):
 
 post_delete.connect(update_num_followers, sender=Follow)
 post_save.connect(update_num_followers, sender=Follow)
+
+
+@disable_for_loaddata
+def update_summaries_for_agenda_vote_removal(sender, instance, **kwargs):
+    from agendas.summaries import refresh_summary_bucket
+    try:
+        vote_time = instance.vote.time
+    except Vote.DoesNotExist:
+        # the vote itself is being deleted, its actions are gone as well
+        vote_time = None
+    if vote_time:
+        refresh_summary_bucket(instance.agenda_id, vote_time)
+post_delete.connect(update_summaries_for_agenda_vote_removal, sender=AgendaVote)
+
+
+def defer_update_summaries_for_vote_action(sender, instance, **kwargs):
+    from agendas.summaries import refresh_summaries_for_vote_actions
+    defer(refresh_summaries_for_vote_actions, (instance.vote_id, instance.member_id))
+
+
+@deferred_when_suppressed(defer_update_summaries_for_vote_action)
+def update_summaries_for_vote_action(sender, instance, **kwargs):
+    from agendas.summaries import refresh_summaries_for_vote_action
+    refresh_summaries_for_vote_action(instance)
+post_save.connect(update_summaries_for_vote_action, sender=VoteAction,
+                  dispatch_uid='vote_action_update_agenda_summaries')
+post_delete.connect(update_summaries_for_vote_action, sender=VoteAction,
+                    dispatch_uid='vote_action_delete_agenda_summaries')
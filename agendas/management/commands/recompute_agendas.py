@@ -1,25 +1,52 @@
 from __future__ import division
 
-from django.core.management.base import NoArgsCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
+from optparse import make_option
+import datetime
 
-from agendas.models import SummaryAgenda,AgendaVote
-
-class Command(NoArgsCommand):
-
-    @transaction.commit_manually
-    def handle_noargs(self, **options):
-        print('Deleting existing summary objects')
-        SummaryAgenda.objects.all().delete()
-        numAgendaVotes = AgendaVote.objects.count()
-        print('Summary agenda objects deleted, recalculating for %d votes' % \
-                    numAgendaVotes)
-        try:
-            AgendaVote.objects.compute_all()
-        except Exception as e:
-            transaction.rollback()
-            print(e)
-            print('Failed to recompute transaction, no worries I rolled back')
-        else:
-            transaction.commit()
-            print('Completed recalculation of agenda votes')
+from agendas.models import AgendaVote
+from agendas.summaries import refresh_summaries, compare_with_full_recompute
+
+
+class Command(BaseCommand):
+    help = "Bring the agenda summaries (SummaryAgenda) in line with the ascribed votes"
+
+    option_list = BaseCommand.option_list + (
+        make_option('--since', dest='since', default=None,
+                    help='Only refresh months starting at this date (YYYY-MM-DD), '
+                         'used to catch up after bulk imports'),
+        make_option('--agenda', dest='agenda_ids', action='append', type='int', default=None,
+                    help='Only refresh the given agenda id (can be given more than once)'),
+        make_option('--verify', action='store_true', dest='verify', default=False,
+                    help='Change nothing, only report the differences between the stored '
+                         'summaries and a full recompute by the original summary queries'),
+    )
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = datetime.datetime.strptime(options['since'], '%Y-%m-%d')
+            except ValueError:
+                raise CommandError('--since should be in the format YYYY-MM-DD')
+
+        print('Refreshing agenda summaries for %d agenda votes' % AgendaVote.objects.count())
+        if options['verify']:
+            diff = compare_with_full_recompute(agenda_ids=options['agenda_ids'], since=since)
+            for summary in diff.created:
+                print('missing: %s' % summary)
+            for summary in diff.updated:
+                print('outdated: %s' % summary)
+            for summary in diff.deleted:
+                print('redundant: %s' % summary)
+            if diff.created or diff.updated or diff.deleted:
+                raise CommandError('Agenda summaries differ from a full recompute (%d missing, %d outdated, '
+                                   '%d redundant)' % (len(diff.created), len(diff.updated), len(diff.deleted)))
+            print('Agenda summaries match a full recompute')
+            return
+
+        with transaction.atomic():
+            diff = refresh_summaries(agenda_ids=options['agenda_ids'], since=since)
+        print('Completed refreshing agenda summaries: %d created, %d updated, %d deleted' % (
+            len(diff.created), len(diff.updated), len(diff.deleted)))
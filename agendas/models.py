@@ -2,6 +2,7 @@ from __future__ import division
 from itertools import chain
 from operator import itemgetter, attrgetter
 from collections import defaultdict
+import datetime
 import math
 
 from django.db import connection
@@ -69,6 +70,27 @@ class AgendaVoteManager(models.Manager):
         party_query = queries.BASE_PARTY_QUERY % db_functions
         cursor.execute(party_query)
 
+    def compute_rows(self):
+        """The AG and MK rows compute_all inserts, computed without inserting
+        them, as a dict of (agenda_id, month, summary_type, mk_id) to a
+        [score, votes, for_votes, against_votes] list"""
+        db_engine = settings.DATABASES['default']['ENGINE']
+        db_functions = self.db_month_trunc_functions[db_engine.split('.')[-1]]
+        cursor = connection.cursor()
+        rows = {}
+
+        # with (empty) params the backend turns the %% of monthfunc into %
+        cursor.execute(queries.BASE_AGENDA_SELECT % db_functions, [])
+        for row in cursor.fetchall():
+            month, summary_type, agenda_id = row[:3]
+            rows[(agenda_id, db_month(month), summary_type, None)] = [float(row[3])] + list(row[4:7])
+
+        cursor.execute(queries.BASE_MK_SELECT % db_functions, [])
+        for row in cursor.fetchall():
+            summary_type, agenda_id, mk_id, month = row[:4]
+            rows[(agenda_id, db_month(month), summary_type, mk_id)] = [float(row[4])] + list(row[5:8])
+        return rows
+
 
 class AgendaVote(models.Model):
     agenda = models.ForeignKey('Agenda', related_name='agendavotes')
@@ -95,57 +117,26 @@ class AgendaVote(models.Model):
         return u"%s %s" % (self.agenda, self.vote)
 
     def update_monthly_counters(self):
-        agendaScore = float(self.score) * float(self.importance)
-        objMonth = dateMonthTruncate(self.vote.time)
-
-        summaryObjects = list(SummaryAgenda.objects.filter(agenda=self.agenda,
-                                                           month=objMonth).all())
-
-        agendaSummary = None
-        if not filter(lambda summary: summary.summary_type == 'AG', summaryObjects):
-            agendaSummary = SummaryAgenda(month=objMonth,
-                                          agenda=self.agenda,
-                                          summary_type='AG',
-                                          score=abs(agendaScore),
-                                          votes=1)
-        else:
-            existingAgenda = filter(lambda summary: summary.summary_type == 'AG', summaryObjects)[0]
-            existingAgenda.votes += 1
-            existingAgenda.score += abs(agendaScore)
-            existingAgenda.save()
-
-        agendasByMk = dict(map(lambda summary: (summary.mk_id, summary),
-                               filter(lambda summary: summary.summary_type == 'MK',
-                                      summaryObjects)))
-        newObjects = []
-        if agendaSummary:
-            newObjects.append(agendaSummary)
-        voters = defaultdict(list)
-        for vote_action in self.vote.actions.all():
-            mkSummary = agendasByMk.get(vote_action.member_id, None)
-            if not mkSummary:
-                mkSummary = SummaryAgenda(month=objMonth,
-                                          agenda=self.agenda,
-                                          summary_type='MK',
-                                          mk_id=vote_action.member_id,
-                                          votes=1,
-                                          score=agendaScore * (1 if vote_action.type == 'for' else -1),
-                                          for_votes=(1 if vote_action.type == 'for' else 0),
-                                          against_votes=(1 if vote_action.type == 'against' else 0))
-                newObjects.append(mkSummary)
-            else:
-                voters[vote_action.type].append(vote_action.member_id)
+        """Refresh the SummaryAgenda rows of the month this vote falls into.
 
-        SummaryAgenda.objects.filter(agenda=self.agenda, mk_id__in=voters['for'], month=objMonth).update(
-            votes=F('votes') + 1, score=F('score') + agendaScore, for_votes=F('for_votes') + 1)
-        SummaryAgenda.objects.filter(agenda=self.agenda, mk_id__in=voters['against'], month=objMonth).update(
-            votes=F('votes') + 1, score=F('score') - agendaScore, against_votes=F('against_votes') + 1)
-        if newObjects:
-            SummaryAgenda.objects.bulk_create(newObjects)
+        Safe to call any number of times, see agendas.summaries.
+        """
+        from agendas.summaries import refresh_summary_bucket
+        refresh_summary_bucket(self.agenda_id, self.vote.time)
 
     def save(self, *args, **kwargs):
+        previous = None
+        if self.pk:
+            previous = AgendaVote.objects.filter(pk=self.pk).values_list('agenda_id', 'vote__time').first()
         super(AgendaVote, self).save(*args, **kwargs)
         self.update_monthly_counters()
+        if previous:
+            previous_agenda_id, previous_time = previous
+            if previous_agenda_id != self.agenda_id or \
+                    dateMonthTruncate(previous_time) != dateMonthTruncate(self.vote.time):
+                # the vote or agenda was changed, so the old bucket lost a vote
+                from agendas.summaries import refresh_summary_bucket
+                refresh_summary_bucket(previous_agenda_id, previous_time)
 
 
 class AgendaMeeting(models.Model):
@@ -227,9 +218,22 @@ def get_top_bottom(lst, top, bottom):
 class AgendaManager(models.Manager):
     def get_selected_for_instance(self, instance, user=None, top=3, bottom=3):
         # Returns interesting agendas for model instances such as: member, party
-        agendas = list(self.get_relevant_for_user(user))
+        agendas = self.get_relevant_for_user(user)
+        if isinstance(instance, Member):
+            # members are scored against all agendas at once, which also
+            # gives the vote type totals of each agenda
+            from agendas.scoring import members_agenda_values, empty_member_values
+            values = members_agenda_values([instance.id])[instance.id]
+            agendas = list(agendas.prefetch_related(None))
+            for agenda in agendas:
+                agenda_values = values.get(agenda.id) or empty_member_values()
+                agenda.score = agenda_values['score']
+                agenda.totals = agenda_values['totals']
+        else:
+            agendas = list(agendas)
+            for agenda in agendas:
+                agenda.score = agenda.__getattribute__('%s_score' % instance.__class__.__name__.lower())(instance)
         for agenda in agendas:
-            agenda.score = agenda.__getattribute__('%s_score' % instance.__class__.__name__.lower())(instance)
             agenda.significance = agenda.score * agenda.num_followers
         agendas.sort(key=attrgetter('significance'))
         agendas = get_top_bottom(agendas, top, bottom)
@@ -496,80 +500,27 @@ class Agenda(models.Model):
         return qs
 
     def get_mks_values(self, ranges=None, mks=None):
+        """Score, rank, volume and vote counts of MKs on this agenda.
+
+        ranges is a list of [start, end) month ranges (None for open ends),
+        defaulting to the current knesset. With a single range a list of
+        (mk_id, values) sorted by rank is returned, otherwise a dict of
+        mk_id to a list of values per range. See agendas.scoring.
+        """
+        from agendas.scoring import AgendaScoreMatrix
         if ranges is None:
             only_current_mks = True
             ranges = [[dateMonthTruncate(Knesset.objects.current_knesset().start_date), None]]
         else:
             only_current_mks = False
-        mks_values = False
-        mk_ids = [mk.id for mk in mks] if mks else []
 
-        fullRange = ranges == [[None, None]]
-        if fullRange:
-            mks_values = cache.get('agenda_%d_mks_values' % self.id)
-            if mks_values and mks:
-                mks_values = [(mk_id, values)
-                              for (mk_id, values) in mks_values
-                              if mk_id in mk_ids]
+        if mks:
+            mk_ids = [mk.id for mk in mks]
+        else:
+            # None means no filtering, i.e. all mks that voted on the agenda
+            mk_ids = Membership.objects.membership_in_range(ranges, only_current_mks=only_current_mks)
 
-        if not mks_values:
-            # get list of mk ids
-            mk_ids = mk_ids or Membership.objects.membership_in_range(ranges, only_current_mks=only_current_mks)
-
-            # generate summary query
-            filters_folded = self.generateSummaryFilters(ranges, 'month', 'month')
-
-            # query summary
-            baseQuerySet = SummaryAgenda.objects.filter(agenda=self)
-            if filters_folded:
-                baseQuerySet.filter(filters_folded)
-            summaries = list(baseQuerySet)
-            # group summaries for respective ranges
-            summariesForRanges = []
-            for r in ranges:
-                summariesForRange = defaultdict(list)
-                for s in summaries:
-                    if (not r[0] or s.month >= r[0]) and \
-                            (not r[1] or s.month < r[1]):
-                        summariesForRange[s.summary_type].append(s)
-                summariesForRanges.append(summariesForRange)
-
-            # compute agenda measures, store results per MK
-            mk_results = dict(map(lambda mk_id: (mk_id, []), mk_ids))
-            for summaries in summariesForRanges:
-                agenda_data = summaries['AG']
-                total_votes = sum(map(attrgetter('votes'), agenda_data))
-                total_for_votes = sum(map(attrgetter('for_votes'), agenda_data))
-                total_against_votes = sum(map(attrgetter('against_votes'), agenda_data))
-                total_score = sum(map(attrgetter('score'), agenda_data))
-                current_mks_data = indexby(summaries['MK'], attrgetter('mk_id'))
-                # calculate results per mk
-                rangeMkResults = []
-                for mk_id in mk_results.keys():
-                    mk_data = current_mks_data[mk_id]
-                    if mk_data:
-                        mk_votes = sum(map(attrgetter('votes'), mk_data))
-                        mk_for_votes = sum(map(attrgetter('for_votes'), mk_data))
-                        mk_against_votes = sum(map(attrgetter('against_votes'), mk_data))
-                        mk_volume = 100 * mk_votes / total_votes
-                        mk_score = 100 * sum(map(attrgetter('score'), mk_data)) / total_score if total_score != 0 else 0
-                        rangeMkResults.append((mk_id, mk_votes, mk_for_votes, mk_against_votes, mk_score, mk_volume))
-                    else:
-                        rangeMkResults.append(tuple([mk_id] + [0] * 5))
-                # sort results by score descending
-                for rank, (mk_id, mk_votes, mk_for_votes, mk_against_votes, mk_score, mk_volume) in enumerate(
-                        sorted(rangeMkResults, key=itemgetter(4, 0), reverse=True)):
-                    mk_range_data = dict(score=mk_score, rank=rank, volume=mk_volume, numvotes=mk_votes,
-                                         numforvotes=mk_for_votes, numagainstvotes=mk_against_votes)
-                    if len(ranges) == 1:
-                        mk_results[mk_id] = mk_range_data
-                    else:
-                        mk_results[mk_id].append(mk_range_data)
-            if fullRange:
-                cache.set('agenda_%d_mks_values' % self.id, mks_values, 1800)
-        if len(ranges) == 1:
-            mk_results = sorted(mk_results.items(), key=lambda (k, v): v['rank'])
-        return mk_results
+        return AgendaScoreMatrix.for_agenda(self.id).mks_values(ranges, mk_ids)
 
     def get_mks_values_old(self, knesset_number=None):
         """Return mks values.
@@ -660,8 +611,10 @@ def dateMonthTruncate(dt):
     return dt
 
 
-def indexby(data, fieldFunc):
-    d = defaultdict(list)
-    for k, v in map(lambda d: (fieldFunc(d), d), data):
-        d[k].append(v)
-    return d
+def db_month(value):
+    """A month computed by the monthfunc of AgendaVoteManager, a string on
+    sqlite, as a naive datetime"""
+    if isinstance(value, basestring):
+        return datetime.datetime.strptime(value[:10], '%Y-%m-%d')
+    return dateMonthTruncate(value).replace(tzinfo=None)
+
@@ -186,8 +186,9 @@ def getAgendaEditorIds():
                        groupby(cursor.fetchall(),key=itemgetter(0))))
     return results
 
-BASE_AGENDA_QUERY = """ 
-INSERT INTO agendas_summaryagenda (month,summary_type,agenda_id,score,votes,for_votes,against_votes,db_created,db_updated)
+# the AG rows, as (month, summary_type, agenda_id, score, votes, for_votes,
+# against_votes, db_created, db_updated)
+BASE_AGENDA_SELECT = """
 SELECT  %(monthfunc)s,v.time) as month,
         'AG' as summary_type,
         a.agenda_id               agid,
@@ -200,8 +201,13 @@ FROM   agendas_agendavote a
 INNER JOIN laws_vote v ON a.vote_id = v.id
 GROUP  BY %(monthfunc)s,v.time),a.agenda_id """
 
-BASE_MK_QUERY = """
-INSERT INTO agendas_summaryagenda (summary_type,agenda_id,mk_id,month,score,votes,for_votes,against_votes,db_created,db_updated)
+BASE_AGENDA_QUERY = """
+INSERT INTO agendas_summaryagenda (month,summary_type,agenda_id,score,votes,for_votes,against_votes,db_created,db_updated)""" + \
+    BASE_AGENDA_SELECT
+
+# the MK rows, as (summary_type, agenda_id, mk_id, month, score, votes,
+# for_votes, against_votes, db_created, db_updated)
+BASE_MK_SELECT = """
 SELECT 'MK' as summary_type,
        agenda_id,
        memberid,
@@ -257,6 +263,10 @@ GROUP BY agenda_id,
          %(monthfunc)s,time)
 """
 
+BASE_MK_QUERY = """
+INSERT INTO agendas_summaryagenda (summary_type,agenda_id,mk_id,month,score,votes,for_votes,against_votes,db_created,db_updated)""" + \
+    BASE_MK_SELECT
+
 BASE_PARTY_QUERY = """
 INSERT INTO agendas_summaryagenda (summary_type,agenda_id,party_id,month,score,votes,for_votes,against_votes,db_created,db_updated)
 SELECT 'PR' as summary_type,
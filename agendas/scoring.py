@@ -0,0 +1,275 @@
+# encoding: utf-8
+"""
+Vectorized agenda scoring over arbitrary date ranges.
+
+An agenda's SummaryAgenda rows are loaded once into a month x MK matrix of
+(votes, for_votes, against_votes, score) with cumulative sums along the month
+axis, so the totals of any [start, end) range are the difference of two rows.
+Scores, volumes and ranks for all MKs in a range are then computed with a few
+array operations instead of per-MK loops. The matrix is cached as its
+monthly rows only, and rebuilt when loaded.
+
+The other way around, members_agenda_values scores a few MKs against every
+agenda at once, from a single query over the AG rows and the MKs' own rows.
+"""
+from __future__ import division
+import cPickle as pickle
+import datetime
+import logging
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Q
+
+from agendas.models import SummaryAgenda, dateMonthTruncate
+from mks.models import Knesset
+
+logger = logging.getLogger("open-knesset.agendas.scoring")
+
+VOTES, FOR_VOTES, AGAINST_VOTES, SCORE = range(4)
+
+MATRIX_CACHE_TIMEOUT = 1800
+# memcached doesn't store values over 1MB, larger matrices aren't cached
+MATRIX_CACHE_MAX_SIZE = 1000 * 1000
+
+# member agenda values are cached under the current version token, which is
+# replaced whenever any SummaryAgenda row changes
+MEMBER_VALUES_VERSION_KEY = 'agenda_member_values_version'
+MEMBER_VALUES_VERSION_TIMEOUT = 60 * 60 * 24 * 30
+
+
+def matrix_cache_key(agenda_id):
+    return 'agenda_%d_score_matrix' % agenda_id
+
+
+def member_values_cache_key(member_id, start, version):
+    return 'agenda_member_values_%d_%s_%s' % (member_id, start.strftime('%Y%m') if start else 'all', version)
+
+
+def _member_values_version():
+    version = cache.get(MEMBER_VALUES_VERSION_KEY)
+    if version is None:
+        version = _new_member_values_version()
+    return version
+
+
+def _new_member_values_version():
+    version = repr(time.time())
+    cache.set(MEMBER_VALUES_VERSION_KEY, version, MEMBER_VALUES_VERSION_TIMEOUT)
+    return version
+
+
+def invalidate_score_matrices(agenda_ids):
+    cache.delete_many([matrix_cache_key(agenda_id) for agenda_id in agenda_ids])
+    _new_member_values_version()
+
+
+def _to_datetime(value):
+    if value is None or isinstance(value, datetime.datetime):
+        return value
+    return datetime.datetime(value.year, value.month, value.day)
+
+
+class AgendaScoreMatrix(object):
+    """Cumulative month x MK totals of a single agenda.
+
+    Pickles as the monthly rows it was built from, as (month index, mk index
+    or -1 for the agenda, values) arrays, so its size grows with the number
+    of rows and not with months x MKs.
+    """
+
+    def __init__(self, agenda_id, rows):
+        """rows are (summary_type, month, mk_id, votes, for_votes, against_votes, score) tuples"""
+        self.agenda_id = agenda_id
+        self.months = sorted(set(dateMonthTruncate(row[1]) for row in rows))
+        self.mk_ids = np.array(sorted(set(row[2] for row in rows if row[0] == 'MK')), dtype=np.int64)
+        month_index = dict((month, i) for i, month in enumerate(self.months))
+        mk_index = dict((mk_id, i) for i, mk_id in enumerate(self.mk_ids.tolist()))
+
+        rows = [row for row in rows if row[0] in ('AG', 'MK')]
+        self.monthly = (
+            np.array([month_index[dateMonthTruncate(row[1])] for row in rows], dtype=np.int32),
+            np.array([mk_index[row[2]] if row[0] == 'MK' else -1 for row in rows], dtype=np.int32),
+            np.array([row[3:] for row in rows], dtype=np.float64).reshape(-1, 4))
+        self._accumulate()
+
+    def _accumulate(self):
+        month_indices, mk_indices, values = self.monthly
+        agenda_rows = mk_indices < 0
+        # row 0 stays zero so that cumulative[end] - cumulative[start] covers [start, end)
+        agenda_totals = np.zeros((len(self.months) + 1, 4))
+        np.add.at(agenda_totals, month_indices[agenda_rows] + 1, values[agenda_rows])
+        mk_totals = np.zeros((len(self.months) + 1, len(self.mk_ids), 4))
+        np.add.at(mk_totals, (month_indices[~agenda_rows] + 1, mk_indices[~agenda_rows]), values[~agenda_rows])
+        self.agenda_totals = agenda_totals.cumsum(axis=0)
+        self.mk_totals = mk_totals.cumsum(axis=0)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['agenda_totals'], state['mk_totals']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._accumulate()
+
+    @classmethod
+    def for_agenda(cls, agenda_id):
+        pickled = cache.get(matrix_cache_key(agenda_id))
+        if pickled is not None:
+            return pickle.loads(pickled)
+        rows = SummaryAgenda.objects.filter(agenda_id=agenda_id).values_list(
+            'summary_type', 'month', 'mk_id', 'votes', 'for_votes', 'against_votes', 'score')
+        matrix = cls(agenda_id, list(rows))
+        pickled = pickle.dumps(matrix, pickle.HIGHEST_PROTOCOL)
+        if len(pickled) <= MATRIX_CACHE_MAX_SIZE:
+            cache.set(matrix_cache_key(agenda_id), pickled, MATRIX_CACHE_TIMEOUT)
+        else:
+            logger.warning('score matrix of agenda %d is too large to cache (%d bytes)' % (agenda_id, len(pickled)))
+        return matrix
+
+    def _month_bounds(self, start, end):
+        start, end = _to_datetime(start), _to_datetime(end)
+        lo = 0 if start is None else bisect_left(self.months, start)
+        hi = len(self.months) if end is None else bisect_left(self.months, end)
+        return lo, max(lo, hi)
+
+    def year_ranges(self):
+        """A [start, end) range for every calendar year the agenda has votes
+        in, or a single open range if it has none"""
+        if not self.months:
+            return [[None, None]]
+        return [[datetime.datetime(year, 1, 1), datetime.datetime(year + 1, 1, 1)]
+                for year in range(self.months[0].year, self.months[-1].year + 1)]
+
+    def range_totals(self, start, end):
+        """Agenda totals and per MK totals (aligned with self.mk_ids) of [start, end)"""
+        lo, hi = self._month_bounds(start, end)
+        return self.agenda_totals[hi] - self.agenda_totals[lo], self.mk_totals[hi] - self.mk_totals[lo]
+
+    def range_values(self, start, end, mk_ids):
+        """Score, rank, volume and vote counts of the given MKs in [start, end).
+
+        Returns a dict of mk_id to the same per MK dict Agenda.get_mks_values
+        returns. MKs that did not vote on the agenda in the range get zeros.
+        """
+        agenda_totals, mk_totals = self.range_totals(start, end)
+        mk_ids = np.array(mk_ids, dtype=np.int64)
+        # MKs without any summary rows are mapped to an extra all-zero row
+        mk_totals = np.vstack([mk_totals, np.zeros((1, 4))])
+        positions = np.searchsorted(self.mk_ids, mk_ids)
+        known = positions < len(self.mk_ids)
+        known[known] = self.mk_ids[positions[known]] == mk_ids[known]
+        positions[~known] = len(self.mk_ids)
+        totals = mk_totals[positions]
+
+        votes = totals[:, VOTES]
+        total_votes = agenda_totals[VOTES]
+        total_score = agenda_totals[SCORE]
+        volumes = 100 * votes / total_votes if total_votes else np.zeros(len(mk_ids))
+        scores = 100 * totals[:, SCORE] / total_score if total_score else np.zeros(len(mk_ids))
+        scores[votes == 0] = 0
+
+        # rank by score and then by mk id, both descending
+        order = np.lexsort((mk_ids, scores))[::-1]
+        ranks = np.empty(len(mk_ids), dtype=np.int64)
+        ranks[order] = np.arange(len(mk_ids))
+
+        results = {}
+        for mk_id, score, rank, volume, numvotes, numforvotes, numagainstvotes in zip(
+                mk_ids.tolist(), scores.tolist(), ranks.tolist(), volumes.tolist(), votes.astype(int).tolist(),
+                totals[:, FOR_VOTES].astype(int).tolist(), totals[:, AGAINST_VOTES].astype(int).tolist()):
+            results[mk_id] = dict(score=score, rank=rank, volume=volume, numvotes=numvotes,
+                                  numforvotes=numforvotes, numagainstvotes=numagainstvotes)
+        return results
+
+    def mks_values(self, ranges, mk_ids=None):
+        """Compute Agenda.get_mks_values for many ranges with one pass per range.
+
+        With a single range a list of (mk_id, values) sorted by rank is
+        returned, otherwise a dict of mk_id to a list of values, one per range.
+        mk_ids of None means every MK that ever voted on the agenda.
+        """
+        if mk_ids is None:
+            mk_ids = self.mk_ids.tolist()
+        else:
+            mk_ids = sorted(set(mk_ids))
+        per_range = [self.range_values(start, end, mk_ids) for start, end in ranges]
+        if len(ranges) == 1:
+            return sorted(per_range[0].items(), key=lambda (mk_id, values): values['rank'])
+        return dict((mk_id, [range_values[mk_id] for range_values in per_range]) for mk_id in mk_ids)
+
+
+def empty_member_values():
+    """The values of an MK on an agenda without any votes"""
+    return dict(score=0.0, numvotes=0, numforvotes=0, numagainstvotes=0,
+                totals=[{'type': 'no-vote', 'total': 0}])
+
+
+def _compute_members_agenda_values(member_ids, start):
+    # agenda id -> [score in range, votes ever]
+    agendas = defaultdict(lambda: [0.0, 0])
+    # (mk id, agenda id) -> [score, votes, for votes, against votes] in range
+    in_range = defaultdict(lambda: [0.0, 0, 0, 0])
+    # (mk id, agenda id) -> [for votes, against votes] ever
+    ever = defaultdict(lambda: [0, 0])
+    rows = SummaryAgenda.objects.filter(Q(summary_type='AG') | Q(summary_type='MK', mk_id__in=member_ids))
+    for agenda_id, summary_type, month, mk_id, votes, for_votes, against_votes, score in rows.values_list(
+            'agenda_id', 'summary_type', 'month', 'mk_id', 'votes', 'for_votes', 'against_votes', 'score'):
+        counted = start is None or month >= start
+        if summary_type == 'AG':
+            agendas[agenda_id][1] += votes
+            if counted:
+                agendas[agenda_id][0] += score
+        elif summary_type == 'MK':
+            ever[(mk_id, agenda_id)][0] += for_votes
+            ever[(mk_id, agenda_id)][1] += against_votes
+            if counted:
+                totals = in_range[(mk_id, agenda_id)]
+                totals[0] += score
+                totals[1] += votes
+                totals[2] += for_votes
+                totals[3] += against_votes
+
+    results = dict((member_id, {}) for member_id in member_ids)
+    for member_id in member_ids:
+        for agenda_id, (agenda_score, agenda_votes) in agendas.iteritems():
+            score, votes, for_votes, against_votes = in_range.get((member_id, agenda_id), (0.0, 0, 0, 0))
+            ever_for, ever_against = ever.get((member_id, agenda_id), (0, 0))
+            # the same vote type counts Agenda.get_mks_totals returns
+            totals = [{'type': vote_type, 'total': total}
+                      for vote_type, total in (('for', ever_for), ('against', ever_against)) if total]
+            totals.append({'type': 'no-vote', 'total': agenda_votes - ever_for - ever_against})
+            results[member_id][agenda_id] = dict(
+                score=100 * score / agenda_score if agenda_score and votes else 0.0,
+                numvotes=votes, numforvotes=for_votes, numagainstvotes=against_votes, totals=totals)
+    return results
+
+
+def members_agenda_values(member_ids):
+    """Score and vote counts of MKs on every agenda in the current knesset,
+    like Agenda.get_mks_values (without ranks), and their vote type totals
+    on it, like Agenda.get_mks_totals.
+
+    Returns a dict of mk_id to a dict of agenda_id to values. Agendas
+    without votes are left out, see empty_member_values. The values of each
+    MK are cached until SummaryAgenda changes.
+    """
+    member_ids = sorted(set(member_ids))
+    knesset = Knesset.objects.current_knesset()
+    start = dateMonthTruncate(knesset.start_date) if knesset else None
+    version = _member_values_version()
+    keys = dict((member_id, member_values_cache_key(member_id, start, version)) for member_id in member_ids)
+    cached = cache.get_many(keys.values())
+
+    results = dict((member_id, cached[key]) for member_id, key in keys.iteritems() if key in cached)
+    missing = [member_id for member_id in member_ids if member_id not in results]
+    if missing:
+        computed = _compute_members_agenda_values(missing, start)
+        cache.set_many(dict((keys[member_id], computed[member_id]) for member_id in missing),
+                       MATRIX_CACHE_TIMEOUT)
+        results.update(computed)
+    return results
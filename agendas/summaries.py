@@ -0,0 +1,225 @@
+# encoding: utf-8
+"""
+Incremental maintenance of the SummaryAgenda table.
+
+SummaryAgenda holds one 'AG' row per (agenda, month) and one 'MK' row per
+(agenda, month, member). Instead of deleting the table and re-running the
+BASE_*_QUERY statements, changes are applied per bucket: the expected rows of
+the affected (agenda, month) buckets are computed from AgendaVote and
+VoteAction, compared with the stored rows, and only the difference is written.
+Refreshing a bucket twice is a no-op, so re-saving an AgendaVote no longer
+double counts.
+
+The computed values follow the same rules as BASE_AGENDA_QUERY and
+BASE_MK_QUERY, so a full refresh is equivalent to a full recompute, which
+compare_with_full_recompute checks against the queries themselves.
+"""
+from __future__ import division
+import datetime
+import logging
+from collections import defaultdict, namedtuple
+from itertools import chain
+
+from laws.models import Vote, VoteAction
+from agendas.models import AgendaVote, SummaryAgenda, dateMonthTruncate
+from agendas.scoring import invalidate_score_matrices
+
+logger = logging.getLogger("open-knesset.agendas.summaries")
+
+SCORE_EPSILON = 1e-9
+DELETE_CHUNK_SIZE = 500
+
+SummaryDiff = namedtuple('SummaryDiff', ['created', 'updated', 'deleted'])
+
+
+def next_month(month):
+    if month.month == 12:
+        return month.replace(year=month.year + 1, month=1)
+    return month.replace(month=month.month + 1)
+
+
+def _month_ceiling(dt):
+    if not isinstance(dt, datetime.datetime):
+        dt = datetime.datetime(dt.year, dt.month, dt.day)
+    month = dateMonthTruncate(dt)
+    return month if month == dt else next_month(month)
+
+
+def _summary_key(agenda_id, month, summary_type, mk_id):
+    return agenda_id, month, summary_type, mk_id
+
+
+def compute_summary_rows(agenda_votes, member_ids=None):
+    """Compute the expected SummaryAgenda values for an AgendaVote queryset.
+
+    Returns a dict of (agenda_id, month, summary_type, mk_id) to a
+    [score, votes, for_votes, against_votes] list. When member_ids is given
+    only the MK rows of those members are computed.
+    """
+    rows = {}
+    agenda_vote_rows = list(agenda_votes.values_list('agenda_id', 'vote_id', 'score', 'importance', 'vote__time'))
+    if not agenda_vote_rows:
+        return rows
+
+    vote_actions = VoteAction.objects.filter(vote__agendavotes__in=agenda_votes,
+                                             type__in=('for', 'against'))
+    if member_ids is not None:
+        vote_actions = vote_actions.filter(member_id__in=member_ids)
+    voters = defaultdict(set)
+    for vote_id, member_id, action_type in vote_actions.values_list('vote_id', 'member_id', 'type').distinct():
+        voters[vote_id].add((member_id, action_type))
+
+    for agenda_id, vote_id, score, importance, vote_time in agenda_vote_rows:
+        month = dateMonthTruncate(vote_time)
+        value = float(score) * float(importance)
+        if member_ids is None:
+            ag_row = rows.setdefault(_summary_key(agenda_id, month, 'AG', None), [0.0, 0, 0, 0])
+            ag_row[0] += abs(value)
+            # BASE_AGENDA_QUERY counts every ascribed vote in all three counters
+            ag_row[1] += 1
+            ag_row[2] += 1
+            ag_row[3] += 1
+        for member_id, action_type in voters[vote_id]:
+            mk_row = rows.setdefault(_summary_key(agenda_id, month, 'MK', member_id), [0.0, 0, 0, 0])
+            mk_row[1] += 1
+            if action_type == 'for':
+                mk_row[0] += value
+                mk_row[2] += 1
+            else:
+                mk_row[0] -= value
+                mk_row[3] += 1
+    return rows
+
+
+def _differs(stored, expected):
+    return (abs(stored.score - expected[0]) > SCORE_EPSILON or
+            stored.votes != expected[1] or
+            stored.for_votes != expected[2] or
+            stored.against_votes != expected[3])
+
+
+def _diff_summaries(summaries, expected):
+    """The SummaryDiff of the stored summaries and the expected rows, the
+    updated summaries hold the expected values"""
+    created, updated, deleted = [], [], []
+    seen = set()
+    for summary in summaries.order_by('pk'):
+        key = _summary_key(summary.agenda_id, summary.month, summary.summary_type, summary.mk_id)
+        if key in seen or key not in expected:
+            # duplicates were left behind by the old double-counting code
+            deleted.append(summary)
+            continue
+        seen.add(key)
+        values = expected[key]
+        if _differs(summary, values):
+            summary.score, summary.votes, summary.for_votes, summary.against_votes = values
+            updated.append(summary)
+
+    for key, values in expected.iteritems():
+        if key in seen:
+            continue
+        agenda_id, month, summary_type, mk_id = key
+        created.append(SummaryAgenda(agenda_id=agenda_id, month=month, summary_type=summary_type, mk_id=mk_id,
+                                     score=values[0], votes=values[1], for_votes=values[2],
+                                     against_votes=values[3]))
+    return SummaryDiff(created, updated, deleted)
+
+
+def refresh_summaries(agenda_ids=None, since=None, until=None, member_ids=None, dry_run=False):
+    """Bring the stored SummaryAgenda rows in line with AgendaVote/VoteAction.
+
+    The refreshed window is [since, until), widened to whole months. agenda_ids
+    and member_ids optionally narrow it further (member_ids limits the refresh
+    to MK rows). With dry_run nothing is written.
+
+    Returns a SummaryDiff of the created, updated and deleted rows.
+    """
+    agenda_votes = AgendaVote.objects.all()
+    summaries = SummaryAgenda.objects.all()
+    if agenda_ids is not None:
+        agenda_votes = agenda_votes.filter(agenda_id__in=agenda_ids)
+        summaries = summaries.filter(agenda_id__in=agenda_ids)
+    if since:
+        since = dateMonthTruncate(since)
+        agenda_votes = agenda_votes.filter(vote__time__gte=since)
+        summaries = summaries.filter(month__gte=since)
+    if until:
+        until = _month_ceiling(until)
+        agenda_votes = agenda_votes.filter(vote__time__lt=until)
+        summaries = summaries.filter(month__lt=until)
+    if member_ids is not None:
+        summaries = summaries.filter(summary_type='MK', mk_id__in=member_ids)
+
+    expected = compute_summary_rows(agenda_votes, member_ids=member_ids)
+    created, updated, deleted = _diff_summaries(summaries, expected)
+
+    logger.debug('summary refresh: %d created, %d updated, %d deleted', len(created), len(updated), len(deleted))
+    if not dry_run:
+        deleted_ids = [s.pk for s in deleted]
+        for i in range(0, len(deleted_ids), DELETE_CHUNK_SIZE):
+            SummaryAgenda.objects.filter(pk__in=deleted_ids[i:i + DELETE_CHUNK_SIZE]).delete()
+        for summary in updated:
+            SummaryAgenda.objects.filter(pk=summary.pk).update(
+                score=summary.score, votes=summary.votes, for_votes=summary.for_votes,
+                against_votes=summary.against_votes, db_updated=datetime.datetime.now())
+        if created:
+            SummaryAgenda.objects.bulk_create(created)
+        changed_agenda_ids = set(s.agenda_id for s in chain(created, updated, deleted))
+        if changed_agenda_ids:
+            invalidate_score_matrices(changed_agenda_ids)
+
+    return SummaryDiff(created, updated, deleted)
+
+
+def compare_with_full_recompute(agenda_ids=None, since=None):
+    """Compare the stored AG and MK rows with the rows the BASE_AGENDA_QUERY
+    and BASE_MK_QUERY statements of AgendaVoteManager.compute_all insert.
+
+    Returns a SummaryDiff of the missing, outdated and redundant rows, like a
+    dry run of refresh_summaries does against compute_summary_rows.
+    """
+    expected = AgendaVote.objects.compute_rows()
+    summaries = SummaryAgenda.objects.filter(summary_type__in=('AG', 'MK'))
+    if agenda_ids is not None:
+        expected = dict((key, values) for key, values in expected.iteritems() if key[0] in agenda_ids)
+        summaries = summaries.filter(agenda_id__in=agenda_ids)
+    if since:
+        since = dateMonthTruncate(since)
+        expected = dict((key, values) for key, values in expected.iteritems() if key[1] >= since)
+        summaries = summaries.filter(month__gte=since)
+    return _diff_summaries(summaries, expected)
+
+
+def refresh_summary_bucket(agenda_id, vote_time, member_ids=None):
+    """Refresh the (agenda, month) bucket that a vote taken at vote_time falls into"""
+    month = dateMonthTruncate(vote_time)
+    return refresh_summaries(agenda_ids=[agenda_id], since=month, until=next_month(month),
+                             member_ids=member_ids)
+
+
+def refresh_summaries_for_vote_action(vote_action):
+    """Refresh the MK rows of a single member for every agenda ascribed to the vote"""
+    agenda_ids = list(AgendaVote.objects.filter(vote_id=vote_action.vote_id).values_list('agenda_id', flat=True))
+    if not agenda_ids:
+        return
+    month = dateMonthTruncate(vote_action.vote.time)
+    refresh_summaries(agenda_ids=agenda_ids, since=month, until=next_month(month),
+                      member_ids=[vote_action.member_id])
+
+
+def refresh_summaries_for_vote_actions(vote_members):
+    """Refresh the MK rows of the members for every agenda ascribed to the
+    votes, for a list of (vote id, member id) of changed vote actions"""
+    members_by_vote = defaultdict(set)
+    for vote_id, member_id in vote_members:
+        members_by_vote[vote_id].add(member_id)
+    agendas_by_vote = defaultdict(list)
+    for vote_id, agenda_id in AgendaVote.objects.filter(vote__in=list(members_by_vote)).values_list(
+            'vote', 'agenda'):
+        agendas_by_vote[vote_id].append(agenda_id)
+    if not agendas_by_vote:
+        return
+    for vote_id, time in Vote.objects.filter(id__in=list(agendas_by_vote)).values_list('id', 'time'):
+        month = dateMonthTruncate(time)
+        refresh_summaries(agenda_ids=agendas_by_vote[vote_id], since=month, until=next_month(month),
+                          member_ids=list(members_by_vote[vote_id]))
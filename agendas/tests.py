@@ -1,3 +1,4 @@
+import cPickle as pickle
 import datetime
 import json
 
@@ -8,7 +9,9 @@ from django.contrib.sites.models import Site
 from django.utils import translation
 from django.conf import settings
 
-from models import Agenda, AgendaVote, AgendaBill, AgendaMeeting
+from models import Agenda, AgendaVote, AgendaBill, AgendaMeeting, SummaryAgenda
+from scoring import AgendaScoreMatrix, members_agenda_values
+from summaries import refresh_summaries, compare_with_full_recompute
 from laws.models import Vote, VoteAction, Bill
 from mks.models import Party, Member, Membership, Knesset
 from committees.models import Committee, CommitteeMeeting
@@ -410,3 +413,113 @@ I have a deadline''')
         self.agenda_1.delete()
         self.agenda_2.delete()
         self.agenda_3.delete()
+
+
+class SummaryAgendaTestCase(TestCase):
+    def setUp(self):
+        self.knesset = Knesset.objects.create(number=1,
+                                              start_date=datetime.date(2010, 1, 1))
+        self.party_1 = Party.objects.create(name='party 1', number_of_seats=2,
+                                            knesset=self.knesset)
+        self.mk_1 = Member.objects.create(name='mk_1', current_party=self.party_1)
+        self.mk_2 = Member.objects.create(name='mk_2', current_party=self.party_1)
+        self.agenda = Agenda.objects.create(name='agenda', public_owner_name='owner', is_public=True)
+        self.vote_1 = Vote.objects.create(title='vote 1', time=datetime.datetime(2012, 3, 4))
+        self.vote_2 = Vote.objects.create(title='vote 2', time=datetime.datetime(2012, 3, 20))
+        self.voteaction_1 = VoteAction.objects.create(vote=self.vote_1, member=self.mk_1, type='for',
+                                                      party=self.party_1)
+        self.voteaction_2 = VoteAction.objects.create(vote=self.vote_1, member=self.mk_2, type='against',
+                                                      party=self.party_1)
+        self.voteaction_3 = VoteAction.objects.create(vote=self.vote_2, member=self.mk_1, type='for',
+                                                      party=self.party_1)
+        self.agendavote_1 = AgendaVote.objects.create(agenda=self.agenda, vote=self.vote_1, score=1.0,
+                                                      importance=0.5)
+        self.agendavote_2 = AgendaVote.objects.create(agenda=self.agenda, vote=self.vote_2, score=-0.5)
+
+    def _summaries(self):
+        return dict(((s.summary_type, s.mk_id), (s.score, s.votes, s.for_votes, s.against_votes))
+                    for s in SummaryAgenda.objects.filter(agenda=self.agenda))
+
+    def _assertMatchesFullRecompute(self):
+        diff = compare_with_full_recompute()
+        self.assertEqual((diff.created, diff.updated, diff.deleted), ([], [], []))
+
+    def test_created(self):
+        self.assertEqual(self._summaries(), {
+            ('AG', None): (1.0, 2, 2, 2),
+            ('MK', self.mk_1.id): (0.0, 2, 2, 0),
+            ('MK', self.mk_2.id): (-0.5, 1, 0, 1),
+        })
+        self._assertMatchesFullRecompute()
+
+    def test_resave_is_idempotent(self):
+        before = self._summaries()
+        self.agendavote_1.save()
+        self.agendavote_1.save()
+        self.assertEqual(self._summaries(), before)
+
+    def test_edit_and_delete(self):
+        self.agendavote_1.score = -1.0
+        self.agendavote_1.save()
+        self.assertEqual(self._summaries()[('MK', self.mk_2.id)], (0.5, 1, 0, 1))
+        self.agendavote_2.delete()
+        self.assertEqual(self._summaries(), {
+            ('AG', None): (0.5, 1, 1, 1),
+            ('MK', self.mk_1.id): (-0.5, 1, 1, 0),
+            ('MK', self.mk_2.id): (0.5, 1, 0, 1),
+        })
+        self._assertMatchesFullRecompute()
+
+    def test_vote_action_changes(self):
+        self.voteaction_2.type = 'for'
+        self.voteaction_2.save()
+        self.assertEqual(self._summaries()[('MK', self.mk_2.id)], (0.5, 1, 1, 0))
+        self.voteaction_2.delete()
+        self.assertNotIn(('MK', self.mk_2.id), self._summaries())
+        self._assertMatchesFullRecompute()
+
+    def test_refresh_repairs_table(self):
+        SummaryAgenda.objects.filter(summary_type='MK', mk=self.mk_1).update(votes=17)
+        SummaryAgenda.objects.create(agenda=self.agenda, month=datetime.datetime(2012, 3, 1), summary_type='AG',
+                                     score=1.0, votes=2, for_votes=2, against_votes=2)
+        diff = refresh_summaries(since=datetime.date(2012, 3, 15))
+        self.assertEqual(len(diff.updated), 1)
+        self.assertEqual(len(diff.deleted), 1)
+        self._assertMatchesFullRecompute()
+
+    def test_mks_values_for_ranges(self):
+        values = self.agenda.get_mks_values(ranges=[[None, datetime.datetime(2012, 3, 1)],
+                                                    [datetime.datetime(2012, 3, 1), None]],
+                                            mks=[self.mk_1, self.mk_2])
+        self.assertEqual(values[self.mk_2.id][0]['numvotes'], 0)
+        self.assertEqual(values[self.mk_2.id][1]['score'], -50)
+        self.assertEqual(values[self.mk_2.id][1]['numagainstvotes'], 1)
+        self.assertEqual(values[self.mk_1.id][1]['rank'], 0)
+        self.assertEqual(values[self.mk_1.id][1]['volume'], 100)
+
+    def test_score_matrix_pickles_monthly_rows(self):
+        matrix = AgendaScoreMatrix.for_agenda(self.agenda.id)
+        unpickled = pickle.loads(pickle.dumps(matrix, pickle.HIGHEST_PROTOCOL))
+        self.assertNotIn('mk_totals', matrix.__getstate__())
+        self.assertEqual(unpickled.mk_totals.tolist(), matrix.mk_totals.tolist())
+        self.assertEqual(unpickled.agenda_totals.tolist(), matrix.agenda_totals.tolist())
+        self.assertEqual(matrix.year_ranges(), [[datetime.datetime(2012, 1, 1), datetime.datetime(2013, 1, 1)]])
+
+        empty_agenda = Agenda.objects.create(name='empty', public_owner_name='owner', is_public=True)
+        self.assertEqual(AgendaScoreMatrix.for_agenda(empty_agenda.id).year_ranges(), [[None, None]])
+
+    def test_members_agenda_values(self):
+        values = members_agenda_values([self.mk_1.id, self.mk_2.id])
+        for mk in (self.mk_1, self.mk_2):
+            mk_values = values[mk.id][self.agenda.id]
+            self.assertEqual(mk_values['score'], self.agenda.member_score(mk))
+            self.assertEqual(sorted(mk_values['totals']), sorted(self.agenda.get_mks_totals(mk)))
+        self.assertEqual(values[self.mk_2.id][self.agenda.id]['score'], -50)
+
+        Agenda.objects.filter(pk=self.agenda.pk).update(num_followers=1)
+        other_agenda = Agenda.objects.create(name='other', public_owner_name='owner', is_public=True,
+                                             num_followers=1)
+        selected = Agenda.objects.get_selected_for_instance(self.mk_2, top=1, bottom=1)
+        self.assertEqual([agenda.id for agenda in selected['top'] + selected['bottom']],
+                         [other_agenda.id, self.agenda.id])
+        self.assertEqual(selected['bottom'][0].totals, values[self.mk_2.id][self.agenda.id]['totals'])
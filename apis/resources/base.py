@@ -1,11 +1,18 @@
 import csv
 
 from django.conf import settings
+from django.conf.urls import url
+from django.core.urlresolvers import NoReverseMatch
+from django.db.models.fields import FieldDoesNotExist
+from django.db.models.query import QuerySet
 from django.http import HttpResponse
 from tastypie.cache import SimpleCache
 from tastypie.resources import ModelResource, Resource
 from tastypie.throttle import CacheThrottle
 from tastypie.serializers import Serializer
+from tastypie.utils import trailing_slash
+
+from knesset.exports import csv_lines, get_since_id, iterate_by_key, json_array, streaming_response, wants_gzip
 
 import ujson
 import StringIO
@@ -92,12 +99,25 @@ class BaseResource(ModelResource):
     """Adds to Meta the following options:
 
     * ``list_fields``: The fields to display in resources listing
+    * ``list_from_values``: Serialize list pages from ``values()`` rows
+      instead of model instances when all the listed fields allow it (see
+      below)
 
     For list mode, on may add to ``extra_fields`` to GET params to get
     addtional comma separated field in case one need more fields than those
     specified in ``list_fields``. e.g:
 
         GET /api/v2/some_resource/?extra_fields=img_url,number_of_children
+
+    Bulk dehydration: in list mode a ``bulk_dehydrate_<field>(pks, request)``
+    method, if defined, is used instead of ``dehydrate_<field>``. It gets the
+    primary keys of the whole page and returns a dict of pk -> value, so the
+    extra data of a page is fetched with one query instead of one per object.
+
+    With ``list_from_values``, a page whose fields are all either bulk
+    dehydrated or plain model fields (possibly across foreign keys, without
+    a ``dehydrate_<field>`` method) is read with a single ``values()`` query,
+    and no model instances or bundles are built.
     """
 
     class Meta(BaseNonModelResource.Meta):
@@ -108,6 +128,17 @@ class BaseResource(ModelResource):
             super(BaseResource, self).create_response(request, *args, **kwargs),
             self.determine_format(request))
 
+    def prepend_urls(self):
+        if not getattr(self._meta, 'allow_export', False):
+            return []
+        return [
+            url(r'^(?P<resource_name>%s)/export%s$' % (self._meta.resource_name, trailing_slash()),
+                self.wrap_view('get_export'), name='api_export'),
+        ]
+
+    def bulk_dehydrate_resource_uri(self, pks, request):
+        return dict((pk, _detail_uri(self, pk)) for pk in pks)
+
     def _get_list_fields(self, request):
         """Helper to return list and extra fields for list mode.
 
@@ -157,18 +188,111 @@ class BaseResource(ModelResource):
         to_be_serialized = paginator.page()
 
         fields = self._get_list_fields(request)
+        if fields is None:
+            fields = self.fields
+        objects = to_be_serialized[self._meta.collection_name]
 
-        # Dehydrate the bundles in preparation for serialization.
-        bundles = []
-
-        for obj in to_be_serialized[self._meta.collection_name]:
-            bundle = self.build_bundle(obj=obj, request=request)
-            bundles.append(self.full_dehydrate(bundle, fields=fields))
+        value_paths = self._get_value_paths(fields) if getattr(self._meta, 'list_from_values', False) else None
+        if value_paths is not None and isinstance(objects, QuerySet):
+            to_be_serialized[self._meta.collection_name] = self._dehydrate_values(
+                request, objects, fields, value_paths)
+        else:
+            to_be_serialized[self._meta.collection_name] = self._dehydrate_objects(request, objects, fields)
 
-        to_be_serialized[self._meta.collection_name] = bundles
         to_be_serialized = self.alter_list_data_to_serialize(request, to_be_serialized)
         return self.create_response(request, to_be_serialized)
 
+    def _get_bulk_hooks(self, fields):
+        """A dict of field name -> bulk_dehydrate_<field> method"""
+        hooks = {}
+        for field_name in fields:
+            method = getattr(self, 'bulk_dehydrate_{}'.format(field_name), None)
+            if method:
+                hooks[field_name] = method
+        return hooks
+
+    def _bulk_dehydrate(self, request, pks, hooks):
+        """A dict of field name -> {pk: value} of the bulk dehydrated fields"""
+        return dict((field_name, method(pks, request)) for field_name, method in hooks.iteritems())
+
+    def _dehydrate_objects(self, request, objects, fields):
+        """Dehydrate a page of model instances into bundles. Bulk dehydrated
+        fields are left out of full_dehydrate and filled in per page."""
+        objects = list(objects)
+        hooks = self._get_bulk_hooks(fields)
+        if hooks:
+            fields = dict((name, field) for name, field in fields.iteritems() if name not in hooks)
+            bulk_values = self._bulk_dehydrate(request, [obj.pk for obj in objects], hooks)
+
+        bundles = []
+        for obj in objects:
+            bundle = self.build_bundle(obj=obj, request=request)
+            bundle = self.full_dehydrate(bundle, fields=fields)
+            if hooks:
+                for field_name, values in bulk_values.iteritems():
+                    bundle.data[field_name] = values.get(obj.pk)
+            bundles.append(bundle)
+        return bundles
+
+    def _get_value_paths(self, fields):
+        """A dict of field name -> (values() lookup, convert function) of the
+        fields that are not bulk dehydrated (lookup is None for fields without
+        an attribute), or None if a field requires a model instance."""
+        if self.dehydrate.__func__ is not ModelResource.dehydrate.__func__:
+            return None
+        hooks = self._get_bulk_hooks(fields)
+        paths = {}
+        for field_name, field_object in fields.iteritems():
+            if field_name in hooks:
+                continue
+            if getattr(self, 'dehydrate_{}'.format(field_name), None):
+                return None
+            if callable(getattr(field_object, 'use_in', 'all')):
+                return None
+            attribute = field_object.attribute
+            if getattr(field_object, 'dehydrated_type', None) == 'related':
+                # not full to-one fields are the URI of the related object,
+                # which only takes its primary key
+                if field_object.is_m2m or field_object.full or not isinstance(attribute, basestring) or \
+                        not _is_value_path(self._meta.object_class, attribute, related=True):
+                    return None
+                related_resource = field_object.to_class()()
+                paths[field_name] = (attribute, lambda pk, resource=related_resource: _detail_uri(resource, pk))
+            elif attribute is None:
+                paths[field_name] = (None, field_object.convert)
+            elif isinstance(attribute, basestring) and _is_value_path(self._meta.object_class, attribute):
+                paths[field_name] = (attribute, field_object.convert)
+            else:
+                return None
+        return paths
+
+    def _dehydrate_values(self, request, objects, fields, value_paths, pk_key=None):
+        """Dehydrate a page of a queryset into plain dicts read with values().
+        The primary key of each object is added as pk_key, if given."""
+        # full_dehydrate is called in detail mode by get_list, so are we
+        names = [name for name in value_paths if getattr(fields[name], 'use_in', 'all') in ('all', 'detail')]
+        lookups = set(value_paths[name][0] for name in names if value_paths[name][0])
+        rows = list(objects.prefetch_related(None).values('pk', *lookups))
+        hooks = self._get_bulk_hooks(fields)
+        bulk_values = self._bulk_dehydrate(request, [row['pk'] for row in rows], hooks)
+
+        data = []
+        for row in rows:
+            item = {}
+            for name in names:
+                field_object = fields[name]
+                lookup, convert = value_paths[name]
+                value = row[lookup] if lookup else None
+                if value is None and field_object.has_default():
+                    value = field_object.default
+                item[name] = convert(value) if value is not None else None
+            for field_name, values in bulk_values.iteritems():
+                item[field_name] = values.get(row['pk'])
+            if pk_key:
+                item[pk_key] = row['pk']
+            data.append(item)
+        return data
+
     def full_dehydrate(self, bundle, for_list=False, fields=None):
         """
         Given a bundle with an object instance, extract the information from it
@@ -208,3 +332,74 @@ class BaseResource(ModelResource):
 
         bundle = self.dehydrate(bundle)
         return bundle
+
+    def get_export(self, request, **kwargs):
+        """
+        Streams all the objects of the list (with the list filters) as CSV or
+        as a JSON array, in primary key order. Every object includes its
+        primary key as ``id``, and the ``since_id`` GET param resumes the
+        export after that primary key. See ``knesset.exports``.
+
+        Enabled with ``allow_export`` in Meta, at ``<resource>/export/``.
+        """
+        self.method_check(request, allowed=['get'])
+        self.is_authenticated(request)
+        self.throttle_check(request)
+        self.log_throttled_access(request)
+
+        base_bundle = self.build_bundle(request=request)
+        objects = self.obj_get_list(bundle=base_bundle, **self.remove_api_resource_names(kwargs))
+        fields = self._get_list_fields(request) or self.fields
+        items = self._export_items(request, objects, fields)
+
+        filename = self._meta.resource_name
+        if self.determine_format(request) == 'text/csv':
+            columns = ['id'] + sorted(name for name in fields if name != 'id')
+            rows = ([u'' if item.get(column) is None else item[column] for column in columns] for item in items)
+            return streaming_response(csv_lines(columns, rows), 'text/csv', filename=filename + '.csv',
+                                      compress=wants_gzip(request))
+        return streaming_response(json_array(items), 'application/json', filename=filename + '.json',
+                                  compress=wants_gzip(request))
+
+    def _export_items(self, request, objects, fields):
+        """Serializable dicts of all objects, dehydrated a chunk at a time"""
+        value_paths = self._get_value_paths(fields)
+        serializer = self._meta.serializer
+        for pks, chunk in iterate_by_key(objects, since_id=get_since_id(request)):
+            if value_paths is not None:
+                items = self._dehydrate_values(request, chunk, fields, value_paths, pk_key='id')
+            else:
+                items = self._dehydrate_objects(request, chunk, fields)
+                for bundle in items:
+                    bundle.data['id'] = bundle.obj.pk
+            for item in items:
+                yield serializer.to_simple(item, {})
+
+
+def _is_value_path(model, path, related=False):
+    """Whether path is a values() lookup of a concrete field of model,
+    possibly through foreign keys. The field is a foreign key if related,
+    otherwise a non relational field."""
+    opts = model._meta
+    parts = path.split('__')
+    for i, part in enumerate(parts):
+        try:
+            field = opts.get_field(part, many_to_many=False)
+        except FieldDoesNotExist:
+            return False
+        if i == len(parts) - 1:
+            return (field.rel is not None) == related
+        if field.rel is None:
+            return False
+        opts = field.rel.to._meta
+    return False
+
+
+def _detail_uri(resource, pk):
+    """The detail URI of the object of resource with primary key pk"""
+    kwargs = resource.resource_uri_kwargs()
+    kwargs[resource._meta.detail_uri_name] = pk
+    try:
+        return resource._build_reverse_url('api_dispatch_detail', kwargs=kwargs)
+    except NoReverseMatch:
+        return ''
@@ -12,6 +12,7 @@ from events.models import Event
 from django.core import cache
 from voting.models import Vote as UserVote
 import apis
+from apis.resources.base import _is_value_path
 
 class TestAPIV2(TestCase):
     """
@@ -107,6 +108,63 @@ I have a deadline''')
                 )
 
 
+class BulkDehydrationTest(TestCase):
+
+    def setUp(self):
+        self.knesset = Knesset.objects.create(number=1, start_date=datetime.date(2010, 1, 1))
+        self.party = Party.objects.create(name='party', knesset=self.knesset)
+        self.mks = [Member.objects.create(name='mk %d' % i, current_party=self.party) for i in range(3)]
+        self.vote = Vote.objects.create(title='vote', time=datetime.datetime(2012, 1, 1), for_votes_count=2)
+        VoteAction.objects.create(vote=self.vote, member=self.mks[0], party=self.party, type='for')
+
+    def _objects(self, url, from_values):
+        resource = apis.resources.v2_api._registry[url.strip('/').split('/')[-1]]
+        old_value, resource._meta.list_from_values = resource._meta.list_from_values, from_values
+        try:
+            res = self.client.get(url, {'format': 'json', 'extra_fields': 'votes_count'})
+        finally:
+            resource._meta.list_from_values = old_value
+        self.assertEqual(res.status_code, 200)
+        return json.loads(res.content)['objects']
+
+    def test_values_match_instances(self):
+        for url in ('/api/v2/member/', '/api/v2/vote/'):
+            self.assertEqual(self._objects(url, True), self._objects(url, False))
+
+    def test_bulk_hooks(self):
+        members = dict((member['id'], member) for member in self._objects('/api/v2/member/', True))
+        self.assertEqual(members[self.mks[0].id]['votes_count'], 1)
+        self.assertEqual(members[self.mks[1].id]['mmms_count'], 0)
+        self.assertEqual(members[self.mks[1].id]['absolute_url'], self.mks[1].get_absolute_url())
+        self.assertEqual(members[self.mks[1].id]['resource_uri'], '/api/v2/member/%d/' % self.mks[1].id)
+
+    def test_values_match_instances_for_related_fields(self):
+        self.assertEqual(self._objects('/api/v2/voteaction/', True), self._objects('/api/v2/voteaction/', False))
+
+    def test_value_paths(self):
+        self.assertTrue(_is_value_path(VoteAction, 'member__name'))
+        self.assertTrue(_is_value_path(VoteAction, 'member', related=True))
+        # not concrete field names
+        self.assertFalse(_is_value_path(VoteAction, 'member_id', related=True))
+        self.assertFalse(_is_value_path(Member, 'name_with_dashes'))
+        self.assertFalse(_is_value_path(VoteAction, 'member__name_with_dashes'))
+
+    def test_export(self):
+        VoteAction.objects.create(vote=self.vote, member=self.mks[1], party=self.party, type='against')
+        vote_actions = list(VoteAction.objects.order_by('id'))
+        res = self.client.get('/api/v2/voteaction/export/', {'format': 'json'})
+        self.assertEqual(res.status_code, 200)
+        exported = json.loads(''.join(res.streaming_content))
+        self.assertEqual([item['id'] for item in exported], [vote_action.id for vote_action in vote_actions])
+        self.assertEqual(exported[0]['member'], '/api/v2/member/%d/' % self.mks[0].id)
+        self.assertEqual(exported[1]['member_title'], self.mks[1].name)
+
+        res = self.client.get('/api/v2/voteaction/export/', {'format': 'csv', 'since_id': vote_actions[0].id})
+        rows = list(csv.reader(''.join(res.streaming_content).splitlines()))
+        self.assertEqual(rows[0][0], '\xef\xbb\xbfid')
+        self.assertEqual([row[0] for row in rows[1:]], [str(vote_actions[1].id)])
+
+
 class SwaggerTest(TestCase):
     def testSwaggerUI(self):
         "Swagger UI static resources should be properly mounted and served"
@@ -47,7 +47,7 @@ class PostResource(BaseResource):
                 member = Member.objects.get(pk=filters['member_id'])
             except Member.DoesNotExist:
                 raise InvalidFilterError("Could not find member id %s" % filters['member_id'])
-            links = Link.objects.for_model(member)
+            links = Link.objects.for_objects([member])[member]
             feeds = Feed.objects.filter(url__in=map(lambda x: x.url, links), is_active=True)
 
             orm_filters["feed__in"] = feeds
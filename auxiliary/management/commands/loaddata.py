@@ -0,0 +1,12 @@
+from django.core.management.commands import loaddata
+
+from knesset.utils import suppress_signals
+
+
+class Command(loaddata.Command):
+    """loaddata, without the signal handlers decorated with
+    disable_for_loaddata (the loaded data already has what they create)"""
+
+    def handle(self, *fixture_labels, **options):
+        with suppress_signals():
+            return super(Command, self).handle(*fixture_labels, **options)
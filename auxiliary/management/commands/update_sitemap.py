@@ -1,15 +1,19 @@
+from optparse import make_option
+
 from django.core.management.base import NoArgsCommand
-from django.http import HttpRequest
-from django.contrib.sitemaps.views import sitemap
-from knesset.sitemap import sitemaps
-from django.conf import settings
-import os
+
+from knesset.sitemap import write_sitemap_files
+
 
 class Command(NoArgsCommand):
+    help = "Write the sitemap files of the pages that changed, and the sitemap index"
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--force', action='store_true', dest='force', default=False,
+                    help='Write all the sitemap pages'),
+    )
+
     def handle_noargs(self, **options):
-        h = HttpRequest()
-        s = sitemap(h, sitemaps=sitemaps)
-        f = open(os.path.join(settings.MEDIA_ROOT,
-                              'sitemap.xml'),'wt')
-        f.write(s.content)
-        f.close()
+        written = write_sitemap_files(force=options['force'])
+        if int(options.get('verbosity', 1)) > 1:
+            self.stdout.write('wrote %d sitemap pages' % written)
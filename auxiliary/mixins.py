@@ -1,10 +1,13 @@
-import csv
 import json
+from itertools import chain
 
+from django.db.models.query import QuerySet
 from django.http import HttpResponse, Http404
 from django.views.generic import ListView
 from django.views.generic.list import BaseListView
 
+from knesset.exports import csv_lines, get_since_id, iterate_by_key, streaming_response, wants_gzip
+
 
 class GetMoreView(ListView):
     """A base view for feeding data to 'get more...' type of links
@@ -67,29 +70,44 @@ class CsvView(BaseListView):
         The attribute can be a attribute on the CsvView child or the model
         instance itself. If it's a callable it'll be called with (obj, attr)
         for the CsvView attribute or without params for the model attribute.
+      * export_by_key -- read the queryset in primary key order, a chunk at a
+        time (see knesset.exports), instead of in its own order. Allows
+        resuming with the since_id GET param, and keeps prefetch_related
+        working per chunk.
+
+    The CSV is streamed as it is written. With the gzip=1 GET param it is
+    downloaded compressed.
     """
 
     filename = None
     list_display = None
+    export_by_key = False
 
     def dispatch(self, request):
         if None in (self.filename, self.list_display, self.model):
             raise Http404()
+        return streaming_response(self.csv_content(request), 'text/csv', filename=self.filename,
+                                  compress=wants_gzip(request))
+
+    def csv_content(self, request):
+        """The (uncompressed) lines of the CSV, for writing it to a file"""
         self.request = request
-        response = HttpResponse(mimetype='text/csv')
-        response['Content-Disposition'] = \
-            'attachment; filename="{}"'.format(self.filename)
-
-        object_list = self.get_queryset()
-        self.prepare_csv_for_utf8(response)
-        writer = csv.writer(response, dialect='excel')
-        writer.writerow([title.encode('utf8')
-                         for _, title in self.list_display])
-        for obj in object_list:
-            row = [self.get_display_attr(obj, attr)
-                   for attr, _ in self.list_display]
-            writer.writerow([unicode(item).encode('utf8') for item in row])
-        return response
+        header = [title for _, title in self.list_display]
+        rows = ([self.get_display_attr(obj, attr) for attr, _ in self.list_display]
+                for obj in self.iter_objects(self.get_queryset()))
+        return csv_lines(header, rows)
+
+    def iter_objects(self, object_list):
+        """The objects of object_list, without holding them all in memory"""
+        if not isinstance(object_list, QuerySet):
+            return iter(object_list)
+        if self.export_by_key:
+            since_id = get_since_id(self.request)
+            return chain.from_iterable(chunk for pks, chunk in iterate_by_key(object_list, since_id=since_id))
+        if object_list._prefetch_related_lookups:
+            # iterator() would skip the prefetching
+            return iter(object_list)
+        return object_list.iterator()
 
     def get_display_attr(self, obj, attr):
         """Return the display string for an attr, calling it if necessary."""
@@ -104,12 +122,3 @@ class CsvView(BaseListView):
         if display_attr is None:
             return ""
         return display_attr
-
-    @staticmethod
-    def prepare_csv_for_utf8(fileobj):
-        """Prepend a byte order mark (BOM) to a file.
-
-        When Excel opens a CSV file, it assumes the encoding is ASCII. The BOM
-        directs it to decode the file with utf-8.
-        """
-        fileobj.write('\xef\xbb\xbf')
\ No newline at end of file
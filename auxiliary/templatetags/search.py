@@ -1,6 +1,5 @@
 from django import template
 from django.core import urlresolvers
-from django.conf import settings
 from auxiliary.forms import SearchForm
 
 register = template.Library()
@@ -13,7 +12,5 @@ def search_form(context, search_form_id='search', span_size="span5"):
         'form': SearchForm(initial=request.GET, auto_id=auto_id),
         'search_form_id': search_form_id,
         'action': urlresolvers.reverse('site-search'),
-        'lang': 'he',
-        'cx' : settings.GOOGLE_CUSTOM_SEARCH,
         'span_size': span_size,
     }
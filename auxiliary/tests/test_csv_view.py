@@ -1,7 +1,11 @@
 # -*- coding: utf-8 -*
+import zlib
+
+from django.test.client import RequestFactory
 from django.test.testcases import TestCase
 
 from auxiliary.mixins import CsvView
+from mks.models import Party
 
 
 class CsvViewTest(TestCase):
@@ -22,7 +26,23 @@ class CsvViewTest(TestCase):
         view.model = self.TestModel
         view.queryset = [self.TestModel(2), self.TestModel(3)]
         response = view.dispatch(None)
-        rows = response.content.splitlines()
+        rows = ''.join(response.streaming_content).splitlines()
         self.assertEqual(len(rows), 3)
         self.assertEqual(rows[1], '2,4')
-        self.assertEqual(rows[2], '3,9')
\ No newline at end of file
+        self.assertEqual(rows[2], '3,9')
+
+    def test_export_by_key(self):
+        parties = [Party.objects.create(name='party %d' % i) for i in range(3)]
+
+        class PartyCsvView(CsvView):
+            model = Party
+            filename = 'parties.csv'
+            list_display = (("id", "id"), ("name", "name"))
+            export_by_key = True
+
+        request = RequestFactory().get('/', {'since_id': parties[0].id, 'gzip': '1'})
+        response = PartyCsvView().dispatch(request)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="parties.csv.gz"')
+        content = zlib.decompress(''.join(response.streaming_content), zlib.MAX_WBITS | 16)
+        rows = content.splitlines()[1:]
+        self.assertEqual(rows, ['%d,%s' % (party.id, party.name) for party in parties[1:]])
@@ -1,8 +1,16 @@
 # -*- coding: utf-8 -*
+import gzip
+import os
+import shutil
+import tempfile
+from datetime import datetime
+
 from django.core.urlresolvers import reverse
 from django.test.testcases import TestCase
 
-from knesset.sitemap import sitemaps
+from knesset.sitemap import sitemaps, write_sitemap_files, URLS_PER_PAGE
+from laws.models import Vote
+from mks.models import Member
 
 
 class SiteMapTest(TestCase):
@@ -15,4 +23,46 @@ class SiteMapTest(TestCase):
         for s in sitemaps.keys():
             res = self.client.get(reverse('sitemaps', kwargs={'section': s}))
             self.assertEqual(res.status_code, 200, 'sitemap %s returned %d' %
-                             (s, res.status_code))
\ No newline at end of file
+                             (s, res.status_code))
+
+class SitemapFilesTest(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.mk = Member.objects.create(name=u'משה כהן')
+        self.vote = Vote.objects.create(title='vote', time=datetime(2015, 1, 1))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _page(self, file_name):
+        f = gzip.open(os.path.join(self.root, 'sitemaps', file_name))
+        try:
+            return f.read()
+        finally:
+            f.close()
+
+    def test_write_sitemap_files(self):
+        written = write_sitemap_files(self.root)
+        self.assertEqual(written, 3)  # members, votes and the index pages
+        with open(os.path.join(self.root, 'sitemap.xml')) as f:
+            index = f.read()
+        self.assertIn('/media/sitemaps/votes-0.xml.gz</loc><lastmod>2015-01-01</lastmod>', index)
+        self.assertIn(self.vote.get_absolute_url(), self._page('votes-0.xml.gz'))
+        self.assertIn(self.mk.get_absolute_url(), self._page('members-0.xml.gz'))
+
+        # only changed pages are written
+        self.assertEqual(write_sitemap_files(self.root), 0)
+        other_vote = Vote.objects.create(id=URLS_PER_PAGE + 1, title='vote 2', time=datetime(2015, 2, 1))
+        self.assertEqual(write_sitemap_files(self.root), 1)
+        self.assertIn(other_vote.get_absolute_url(), self._page('votes-1.xml.gz'))
+        other_vote.delete()
+        self.assertEqual(write_sitemap_files(self.root), 0)
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'sitemaps', 'votes-1.xml.gz')))
+        self.assertEqual(write_sitemap_files(self.root, force=True), 3)
+
+        # forcing removes pages with no rows too
+        other_vote = Vote.objects.create(id=URLS_PER_PAGE + 1, title='vote 2', time=datetime(2015, 2, 1))
+        write_sitemap_files(self.root)
+        other_vote.delete()
+        self.assertEqual(write_sitemap_files(self.root, force=True), 3)
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'sitemaps', 'votes-1.xml.gz')))
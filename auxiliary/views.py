@@ -188,22 +188,6 @@ def post_annotation(request):
         return HttpResponseForbidden(_("Sorry, you do not have the permission to annotate."))
 
 
-def search(request, lang='he'):
-    # remove the 'cof' get variable from the query string so that the page
-    # linked to by the javascript fallback doesn't think its inside an iframe.
-    mutable_get = request.GET.copy()
-    if 'cof' in mutable_get:
-        del mutable_get['cof']
-
-    return render_to_response('search/search.html', RequestContext(request, {
-        'query': request.GET.get('q'),
-        'query_string': mutable_get.urlencode(),
-        'has_search': True,
-        'lang': lang,
-        'cx': settings.GOOGLE_CUSTOM_SEARCH,
-    }))
-
-
 def post_details(request, post_id):
     ''' patching django-planet's post_detail view so it would update the
         hitcount and redirect to the post's url
@@ -0,0 +1,20 @@
+# encoding: utf-8
+"""
+Autocomplete index of committee meetings, see knesset.autocomplete.
+"""
+from knesset.autocomplete import AutocompleteIndex
+from committees.models import CommitteeMeeting
+
+
+class CommitteeMeetingAutocomplete(AutocompleteIndex):
+    """Committee meetings by date string or topics"""
+    name = 'committee_meeting'
+    models = (CommitteeMeeting,)
+
+    def entries(self):
+        for cm_id, date_string, topics in CommitteeMeeting.objects.values_list('id', 'date_string', 'topics'):
+            yield u'%s\n%s' % (date_string, topics or u''), (cm_id, u'{0} - {1}'.format(date_string, topics)), ()
+
+
+committee_meeting_autocomplete = CommitteeMeetingAutocomplete()
+committee_meeting_autocomplete.connect()
@@ -1,4 +1,4 @@
-from django.db.models.signals import post_save,m2m_changed, pre_delete
+from django.db.models.signals import post_save,m2m_changed, pre_delete, post_delete
 from django.contrib.comments.signals import comment_was_posted
 from django.contrib.comments.models import Comment
 from django.contrib.contenttypes.models import ContentType
@@ -6,9 +6,11 @@ from planet.models import Feed, Post
 from actstream import action, follow
 from actstream.models import Action, Follow
 from annotatetext.models import Annotation
+from knesset.activity import record_actions, pending_action
 from knesset.utils import disable_for_loaddata
 from mks.models import Member
-from models import CommitteeMeeting, Topic
+from models import CommitteeMeeting, Topic, ProtocolPart, ProtocolArtifacts
+from committees.autocomplete import committee_meeting_autocomplete
 
 cm_ct = None
 member_ct = None
@@ -25,34 +27,32 @@ def get_ct():
     user_ct = ContentType.objects.get(app_label="auth", model="user")
     annotation_ct = ContentType.objects.get(app_label="annotatetext", model="annotation")
 
+def attendance_actions(meeting, member_ids):
+    return [pending_action(Member, member_id, 'attended', CommitteeMeeting, meeting.id,
+                           description='committee meeting', timestamp=meeting.date)
+            for member_id in member_ids]
+
 @disable_for_loaddata
 def handle_cm_save(sender, created, instance, **kwargs):
-    if not cm_ct:
-        get_ct()
-    for m in instance.mks_attended.all():
-        if Action.objects.filter(actor_object_id=m.id,
-                                 actor_content_type=member_ct,
-                                 verb='attended',
-                                 target_object_id=instance.id,
-                                 target_content_type=cm_ct).count()==0:
-            action.send(m, verb='attended', target=instance, description='committee meeting', timestamp=instance.date)
+    if created:
+        # a new meeting has no attendance yet
+        return
+    record_actions(attendance_actions(instance, instance.mks_attended.values_list('id', flat=True)))
 post_save.connect(handle_cm_save, sender=CommitteeMeeting)
 
 @disable_for_loaddata
 def record_committee_presence(**kwargs):
-    if not member_ct:
-        get_ct()
     if kwargs['action'] != "post_add":
         return
-    meeting = kwargs['instance']
-    for mk_id in kwargs['pk_set']:
-        m = Member.objects.get(pk=mk_id)
-        if Action.objects.filter(actor_object_id=m.id,
-                                 actor_content_type=member_ct,
-                                 verb='attended',
-                                 target_object_id=meeting.id,
-                                 target_content_type=cm_ct).count()==0:
-            action.send(m, verb='attended', target=meeting, description='committee meeting', timestamp=meeting.date)
+    if kwargs['reverse']:
+        # meetings were added to a member
+        member_id = kwargs['instance'].id
+        actions = []
+        for meeting in CommitteeMeeting.objects.filter(id__in=kwargs['pk_set']).only('id', 'date'):
+            actions.extend(attendance_actions(meeting, [member_id]))
+    else:
+        actions = attendance_actions(kwargs['instance'], kwargs['pk_set'])
+    record_actions(actions)
 m2m_changed.connect(record_committee_presence, sender=CommitteeMeeting.mks_attended.through)
 
 @disable_for_loaddata
@@ -95,3 +95,9 @@ def delete_related_activities(sender, instance, **kwargs):
     Action.objects.filter(target_object_id=instance.id, verb__in=('annotated', 'comment-added')).delete()
 pre_delete.connect(delete_related_activities, sender=Annotation)
 pre_delete.connect(delete_related_activities, sender=Comment)
+
+@disable_for_loaddata
+def invalidate_protocol_artifacts(sender, instance, **kwargs):
+    ProtocolArtifacts.objects.filter(meeting=instance.meeting_id).delete()
+post_save.connect(invalidate_protocol_artifacts, sender=ProtocolPart)
+post_delete.connect(invalidate_protocol_artifacts, sender=ProtocolPart)
@@ -0,0 +1,26 @@
+# encoding: utf-8
+import logging
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from committees.models import CommitteeMeeting
+from ok_tag.tag_suggestions import update_meetings_tag_suggestions
+
+logger = logging.getLogger("open-knesset.committees.update_meeting_tag_suggestions")
+
+
+class Command(BaseCommand):
+    help = "Find the tags in the meetings protocols and store them as the meetings tag suggestions"
+
+    option_list = BaseCommand.option_list + (
+        make_option('--all', action='store_true', dest='all', default=False,
+                    help='update all the meetings, not only those without suggestions'),
+    )
+
+    def handle(self, *args, **options):
+        meetings = CommitteeMeeting.objects.all()
+        if not options['all']:
+            meetings = meetings.filter(suggested_tags__isnull=True)
+        updated = update_meetings_tag_suggestions(meetings)
+        logger.info('updated tag suggestions of %d meetings' % updated)
@@ -1,6 +1,9 @@
 # encoding: utf-8
 import re
+import json
 import logging
+import colorsys
+from collections import OrderedDict
 from datetime import datetime, timedelta, date
 from django.db import models
 from django.db.models.query_utils import Q
@@ -223,6 +226,9 @@ class CommitteeMeeting(models.Model):
         related_name='committee_meetings', blank=True)
     datetime = models.DateTimeField(db_index=True, null=True, blank=True)
     knesset_id = models.IntegerField(null=True, blank=True)
+    # json list of [tag name, occurrences] of the tags found in the topics
+    # and protocol, see update_tag_suggestions
+    suggested_tags = models.TextField(null=True, blank=True, editable=False)
 
     objects = CommitteeMeetingManager()
 
@@ -272,9 +278,35 @@ class CommitteeMeeting(models.Model):
     def save(self, **kwargs):
         super(CommitteeMeeting, self).save(**kwargs)
 
+    def update_tag_suggestions(self):
+        from ok_tag.tag_suggestions import update_meetings_tag_suggestions
+        update_meetings_tag_suggestions(CommitteeMeeting.objects.filter(pk=self.pk))
+        self.suggested_tags = CommitteeMeeting.objects.filter(pk=self.pk).values_list(
+            'suggested_tags', flat=True)[0]
+
+    def get_tag_suggestions(self):
+        """(tag name, occurrences) of the tags found in the meeting, which
+        it is not tagged with yet, most occurring first. The tags found are
+        stored on first use, if update_meeting_tag_suggestions didn't yet."""
+        from ok_tag.tag_suggestions import sort_suggested_tags
+        if self.suggested_tags is None:
+            self.update_tag_suggestions()
+        if not self.suggested_tags:
+            return []
+        return sort_suggested_tags(self.tags, dict(json.loads(self.suggested_tags)))
+
+    def protocol_parts_changed(self):
+        """Update what is computed from the protocol parts, after they were
+        created or parsed again"""
+        from search.indexer import index_meeting
+        index_meeting(self)
+        self.update_tag_suggestions()
+        ProtocolArtifacts.objects.build(self)
+
     def create_protocol_parts(self, delete_existing=False, mks=None, mk_names=None):
         from knesset_data_django.committees.meetings import create_protocol_parts
         create_protocol_parts(self, delete_existing, mks, mk_names)
+        self.protocol_parts_changed()
 
     def redownload_protocol(self):
         from knesset_data_django.committees.meetings import redownload_protocol
@@ -283,6 +315,7 @@ class CommitteeMeeting(models.Model):
     def reparse_protocol(self, redownload=True, mks=None, mk_names=None):
         from knesset_data_django.committees.meetings import reparse_protocol
         reparse_protocol(self, redownload, mks, mk_names)
+        self.protocol_parts_changed()
 
     def update_from_dataservice(self, dataservice_object=None):
         # TODO: obviousely broken, not sure what was here originaly and where it moved
@@ -401,6 +434,10 @@ class ProtocolPartManager(models.Manager):
     def list(self):
         return self.order_by("order")
 
+    def after(self, order, limit=COMMITTEE_PROTOCOL_PAGINATE_BY):
+        """Up to limit parts following the part of the given order"""
+        return self.filter(order__gt=order).order_by("order")[:limit]
+
 
 class ProtocolPart(models.Model):
     meeting = models.ForeignKey(CommitteeMeeting, related_name='parts')
@@ -436,6 +473,95 @@ class ProtocolPart(models.Model):
                               self.body)
 
 
+class ProtocolArtifactsManager(models.Manager):
+    def build(self, meeting):
+        """Compute and save the protocol artifacts of meeting"""
+        speakers = OrderedDict()
+        parts_lengths = {}
+        orders = []
+        parts = meeting.parts.order_by('order', 'id').values_list('id', 'order', 'header', 'speaker__mk', 'body')
+        for part_id, order, header, mk_id, body in parts.iterator():
+            length = len(body) if body else 0
+            parts_lengths[part_id] = length
+            orders.append(order)
+            speaker = speakers.setdefault((header, mk_id), [header, mk_id, 0, 0])
+            speaker[2] += 1
+            speaker[3] += length
+        artifacts = ProtocolArtifacts(
+            meeting=meeting,
+            protocol_parts_update_date=meeting.protocol_parts_update_date,
+            speakers=json.dumps(speakers.values()),
+            parts_lengths=json.dumps(parts_lengths),
+            pages=json.dumps(orders[::COMMITTEE_PROTOCOL_PAGINATE_BY]))
+        artifacts.save()
+        return artifacts
+
+    def for_meeting(self, meeting):
+        """The protocol artifacts of meeting, built if they are missing or
+        older than its protocol parts"""
+        try:
+            artifacts = self.get(meeting=meeting)
+        except ProtocolArtifacts.DoesNotExist:
+            return self.build(meeting)
+        if artifacts.protocol_parts_update_date != meeting.protocol_parts_update_date:
+            return self.build(meeting)
+        return artifacts
+
+
+class ProtocolArtifacts(models.Model):
+    """
+    What the meeting page shows about the protocol as a whole, computed once
+    when the protocol is parsed (protocol parts don't change afterwards)
+    instead of on every page view. The tag suggestions are kept in
+    CommitteeMeeting.suggested_tags.
+    """
+    meeting = models.OneToOneField(CommitteeMeeting, primary_key=True, related_name='protocol_artifacts')
+    # CommitteeMeeting.protocol_parts_update_date when the artifacts were built
+    protocol_parts_update_date = models.DateField(blank=True, null=True)
+    # json list of [header, mk id, number of parts, total length], by first part
+    speakers = models.TextField()
+    # json object of part id to body length, used by the annotations js
+    parts_lengths = models.TextField()
+    # json list of the order of the first part in every protocol page
+    pages = models.TextField()
+
+    objects = ProtocolArtifactsManager()
+
+    def get_speakers(self):
+        return json.loads(self.speakers)
+
+    def get_pages(self):
+        return json.loads(self.pages)
+
+    def parts_count(self):
+        return sum(parts for header, mk_id, parts, length in self.get_speakers())
+
+    def page_parts(self, page, with_body=True):
+        """The protocol parts of page (1 based), found by the order of its
+        first part and of the next page's, without loading the other
+        pages. Use with_body=False for navigation, the bodies are long."""
+        pages = self.get_pages()
+        if not 1 <= page <= len(pages):
+            return ProtocolPart.objects.none()
+        parts = ProtocolPart.objects.filter(meeting=self.meeting_id, order__gte=pages[page - 1])
+        if page < len(pages):
+            parts = parts.filter(order__lt=pages[page])
+        if not with_body:
+            parts = parts.defer('body')
+        return parts.order_by('order')
+
+    def speaker_colors(self):
+        """Background color of every speaker header, mks more saturated"""
+        colors = {}
+        speakers = sorted(set((header, mk_id) for header, mk_id, parts, length in self.get_speakers()),
+                          key=lambda speaker: (speaker[1], speaker[0]))
+        n = len(speakers)
+        for (i, (header, mk_id)) in enumerate(speakers):
+            (r, g, b) = colorsys.hsv_to_rgb(float(i) / n, 0.5 if mk_id else 0.3, 255)
+            colors[header] = 'rgb(%i, %i, %i)' % (r, g, b)
+        return colors
+
+
 TOPIC_PUBLISHED, TOPIC_FLAGGED, TOPIC_REJECTED, \
 TOPIC_ACCEPTED, TOPIC_APPEAL, TOPIC_DELETED = range(6)
 PUBLIC_TOPIC_STATUS = (TOPIC_PUBLISHED, TOPIC_ACCEPTED)
@@ -0,0 +1,45 @@
+from datetime import datetime
+
+from actstream.models import Action
+from django.test import TestCase
+
+from committees.models import Committee
+from knesset.activity import pending_action, record_actions
+from knesset.utils import suppress_signals
+from mks.models import Member
+
+
+class AttendanceActionsTest(TestCase):
+    def setUp(self):
+        self.committee = Committee.objects.create(name='c1')
+        self.meeting = self.committee.meetings.create(date=datetime(2015, 1, 1))
+        self.mk_1 = Member.objects.create(name='mk 1')
+        self.mk_2 = Member.objects.create(name='mk 2')
+
+    def _attended(self):
+        return sorted(Action.objects.filter(verb='attended').values_list('actor_object_id', 'target_object_id'))
+
+    def test_recorded_once(self):
+        self.meeting.mks_attended.add(self.mk_1)
+        self.meeting.save()
+        self.meeting.mks_attended.add(self.mk_2)
+        self.meeting.save()
+        self.assertEqual(self._attended(), sorted([(str(self.mk_1.id), str(self.meeting.id)),
+                                                   (str(self.mk_2.id), str(self.meeting.id))]))
+
+    def test_added_from_member(self):
+        self.mk_1.committee_meetings.add(self.meeting)
+        self.assertEqual(self._attended(), [(str(self.mk_1.id), str(self.meeting.id))])
+
+    def test_record_actions_in_bulk(self):
+        actions = [pending_action(Member, mk.id, 'attended', self.meeting, self.meeting.id,
+                                  timestamp=self.meeting.date)
+                   for mk in (self.mk_1, self.mk_2, self.mk_1)]
+        with suppress_signals():
+            record_actions(actions)
+            self.assertEqual(self._attended(), [])
+            record_actions(actions)
+        self.assertEqual(len(self._attended()), 2)
+        with self.assertNumQueries(1):
+            record_actions(actions)
+        self.assertEqual(len(self._attended()), 2)
@@ -1,3 +1,4 @@
+import json
 import unittest
 from datetime import datetime, timedelta
 
@@ -11,7 +12,7 @@ from django.core.urlresolvers import reverse
 from tagging.models import Tag
 from waffle import testutils as waffle_testutils
 
-from committees.models import Committee
+from committees.models import Committee, ProtocolArtifacts
 from committees.tests.base import BaseCommitteeTestCase
 from laws.models import Bill
 from mks.models import Member, Knesset
@@ -85,6 +86,46 @@ I have a deadline''')
         self.assertEqual(parts_list[1].header, u'adrian')
         self.assertEqual(parts_list[1].body, 'I have a deadline')
 
+    def test_protocol_artifacts(self):
+        artifacts = ProtocolArtifacts.objects.get(meeting=self.meeting_1)
+        self.assertEqual(artifacts.get_speakers(), [[u'jacob', None, 1, 20], [u'adrian', None, 1, 17]])
+        self.assertEqual(artifacts.get_pages(), [1])
+        # committee meeting pages moved to a static site, plenum meetings use the same view
+        url = reverse('plenum-meeting', kwargs={'pk': self.meeting_1.id})
+        res = self.client.get(url)
+        self.assertEqual(set(res.context['colors']), set([u'jacob', u'adrian']))
+        parts = self.meeting_1.parts.list()
+        self.assertEqual(json.loads(res.context['parts_lengths']), {str(parts[0].id): 20, str(parts[1].id): 17})
+        # changing a part invalidates the artifacts, they are rebuilt on the next view
+        parts[1].delete()
+        self.assertFalse(ProtocolArtifacts.objects.filter(meeting=self.meeting_1).exists())
+        res = self.client.get(url)
+        self.assertEqual(json.loads(res.context['parts_lengths']), {str(parts[0].id): 20})
+
+    def test_protocol_pages(self):
+        artifacts = ProtocolArtifacts.objects.get(meeting=self.meeting_1)
+        self.assertEqual([part.header for part in artifacts.page_parts(1)], [u'jacob', u'adrian'])
+        self.assertEqual(list(artifacts.page_parts(2)), [])
+        url = reverse('plenum-meeting', kwargs={'pk': self.meeting_1.id})
+        res = self.client.get(url)
+        self.assertEqual([part.header for part in res.context['parts']], [u'jacob', u'adrian'])
+        self.assertEqual(res.context['page_obj'].number, 1)
+        res = self.client.get(url, {'page': 2})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.context['parts'], [])
+
+    def test_protocol_parts_json(self):
+        url = reverse('committee-meeting-parts', kwargs={'pk': self.meeting_1.id})
+        res = json.loads(self.client.get(url, {'limit': 1}).content)
+        self.assertEqual([part['body'] for part in res['parts']], ['I am a perfectionist'])
+        res = json.loads(self.client.get(url, {'after': res['next'], 'body': 0}).content)
+        self.assertEqual([part['header'] for part in res['parts']], [u'adrian'])
+        self.assertNotIn('body', res['parts'][0])
+        self.assertIsNone(res['next'])
+        self.assertEqual(self.client.get(url, {'after': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'limit': 0}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'limit': -1}).status_code, 400)
+
     def test_annotating_protocol_part(self):
         '''this is more about testing the annotatext app '''
         self.assertTrue(self.client.login(username='jacob', password='JKM'))
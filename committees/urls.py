@@ -6,7 +6,8 @@ from views import (
     CommitteeListView, CommitteeDetailView, TopicListView, TopicsMoreView,
     TopicDetailView, delete_topic, delete_topic_rating, meeting_list_by_date,
     edit_topic, CommitteeMMMDocuments, UnpublishedProtocolslistView, FutureMeetingslistView,
-    static_committee_detail_redirect, static_committee_redirect, static_committee_meeting_redirect
+    static_committee_detail_redirect, static_committee_redirect, static_committee_meeting_redirect,
+    meeting_protocol_parts
 )
 
 
@@ -49,6 +50,8 @@ committeesurlpatterns = patterns('',
                                      name='edit-committee-topic'),
                                  url(r'^committee/meeting/(?P<pk>\d+)/$', static_committee_meeting_redirect(),
                                      name='committee-meeting'),
+                                 url(r'^committee/meeting/(?P<pk>\d+)/parts/$', meeting_protocol_parts,
+                                     name='committee-meeting-parts'),
                                  url(r'^committee/meeting/tag/(?P<tag>.*)/$', MeetingTagListView.as_view(),
                                      name='committeemeeting-tag'),
                                  url(r'^committee/topic/$', static_committee_redirect('committees/index.html'), name='topic-list'),
@@ -1,8 +1,6 @@
 # -*- coding: utf-8 -*
-import colorsys
 import datetime
 import difflib
-import itertools
 import json
 import logging
 import re
@@ -18,10 +16,12 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.contenttypes.models import ContentType
 from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
+from django.core.paginator import Paginator, InvalidPage
 from django.core.urlresolvers import reverse
 from django.db.models import Q
 from django.http import (HttpResponse, HttpResponseRedirect, Http404,
-                         HttpResponseForbidden, HttpResponsePermanentRedirect)
+                         HttpResponseForbidden, HttpResponsePermanentRedirect,
+                         HttpResponseBadRequest)
 from django.shortcuts import get_object_or_404, render_to_response
 from django.template import RequestContext
 from django.utils.decorators import method_decorator
@@ -31,7 +31,6 @@ from django.views.generic import DetailView, ListView
 from tagging.models import TaggedItem, Tag
 
 import models
-import ok_tag.tag_suggestions
 from auxiliary.mixins import GetMoreView
 from forms import EditTopicForm, LinksFormset
 from hashnav import method_decorator as hashnav_method_decorator
@@ -42,7 +41,7 @@ from lobbyists.models import Lobbyist
 from mks.models import Member
 from mks.utils import get_all_mk_names
 from mmm.models import Document
-from models import Committee, CommitteeMeeting, Topic
+from models import Committee, CommitteeMeeting, ProtocolArtifacts, Topic
 from ok_tag.views import BaseTagMemberListView
 from knesset_data_django.committees import members_by_presence
 
@@ -115,12 +114,7 @@ class CommitteeDetailView(DetailView):
             cached_context['show_member_presence'] = False
             members = cm.members_by_name(current_only=True)
 
-        links = list(Link.objects.for_model(Member))
-        links_by_member = {}
-        for k, g in itertools.groupby(links, lambda x: x.object_pk):
-            links_by_member[str(k)] = list(g)
-        for member in members:
-            member.cached_links = links_by_member.get(str(member.pk), [])
+        Link.objects.attach_to(members)
         cached_context['members'] = members
         recent_meetings, more_meetings_available = cm.recent_meetings(
             limit=self.SEE_ALL_THRESHOLD)
@@ -173,9 +167,8 @@ class MeetingDetailView(DetailView):
         slug = self.kwargs.get(self.slug_url_kwarg, None)
         if pk is not None:
             # Double prefetch since prefetch does not work over filter
-            queryset = queryset.filter(pk=pk).prefetch_related('parts',
-                                                               'parts__speaker__mk',
-                                                               'lobbyists_mentioned',
+            # the protocol parts are loaded a page at a time, see get_context_data
+            queryset = queryset.filter(pk=pk).prefetch_related('lobbyists_mentioned',
                                                                'mks_attended',
                                                                'mks_attended__current_party',
                                                                'committee__members',
@@ -208,14 +201,7 @@ class MeetingDetailView(DetailView):
     def get_context_data(self, *args, **kwargs):
         context = super(MeetingDetailView, self).get_context_data(**kwargs)
         cm = context['object']
-        colors = {}
-        speakers = cm.parts.order_by('speaker__mk').values_list('header',
-                                                                'speaker__mk').distinct()
-        n = speakers.count()
-        for (i, (p, mk)) in enumerate(speakers):
-            (r, g, b) = colorsys.hsv_to_rgb(float(i) / n, 0.5 if mk else 0.3,
-                                            255)
-            colors[p] = 'rgb(%i, %i, %i)' % (r, g, b)
+        artifacts = ProtocolArtifacts.objects.for_meeting(cm)
         context['title'] = _('%(committee)s meeting on %(date)s') % {
             'committee': cm.committee.name,
             'date': cm.date_string}
@@ -224,12 +210,19 @@ class MeetingDetailView(DetailView):
         page = self.request.GET.get('page', None)
         if page:
             context['description'] += _(' page %(page)s') % {'page': page}
-        context['colors'] = colors
-        parts_lengths = {}
-        for part in cm.parts.all():
-            parts_lengths[part.id] = len(part.body)
-        context['parts_lengths'] = json.dumps(parts_lengths)
-        context['paginate_by'] = models.COMMITTEE_PROTOCOL_PAGINATE_BY
+        context['colors'] = artifacts.speaker_colors()
+        context['parts_lengths'] = artifacts.parts_lengths
+        paginator = Paginator(xrange(artifacts.parts_count()), models.COMMITTEE_PROTOCOL_PAGINATE_BY)
+        try:
+            page_obj = paginator.page(self.request.GET.get('page', 1))
+        except InvalidPage:
+            # past the last page, the infinite scroll stops on an empty protocol
+            context['parts'] = []
+            context['invalid_page'] = True
+        else:
+            context['parts'] = artifacts.page_parts(page_obj.number)
+            context['paginator'] = paginator
+            context['page_obj'] = page_obj
 
         if cm.committee.type != 'plenum' and \
                 waffle.flag_is_active(self.request, 'show_member_presence'):
@@ -242,19 +235,11 @@ class MeetingDetailView(DetailView):
             members = cm.mks_attended.order_by('name')
             context['show_member_presence'] = False
 
-        links = list(Link.objects.for_model(Member))
-        links_by_member = {}
-        for k, g in itertools.groupby(links, lambda x: x.object_pk):
-            links_by_member[str(k)] = list(g)
-        for member in members:
-            member.cached_links = links_by_member.get(str(member.pk), [])
+        members = list(members)
+        Link.objects.attach_to(members)
         context['members'] = members
 
-        meeting_text = [cm.topics] + [part.body for part in cm.parts.all()]
-        context[
-            'tag_suggestions'] = ok_tag.tag_suggestions.extract_suggested_tags(
-            cm.tags,
-            meeting_text)
+        context['tag_suggestions'] = cm.get_tag_suggestions()
 
         context['mentioned_lobbyists'] = cm.main_lobbyists_mentioned
         context[
@@ -795,6 +780,37 @@ def static_committee_detail_redirect():
     return view
 
 
+def meeting_protocol_parts(request, pk):
+    ''' json of the protocol parts following the part of order "after" (0
+        for the first), at most COMMITTEE_PROTOCOL_PAGINATE_BY of them,
+        without their bodies if "body" is 0
+    '''
+    meeting = get_object_or_404(CommitteeMeeting, pk=pk)
+    try:
+        after = int(request.GET.get('after', 0))
+        limit = min(int(request.GET.get('limit', models.COMMITTEE_PROTOCOL_PAGINATE_BY)),
+                    models.COMMITTEE_PROTOCOL_PAGINATE_BY)
+    except ValueError:
+        return HttpResponseBadRequest('after and limit should be numbers')
+    if limit < 1:
+        return HttpResponseBadRequest('limit should be positive')
+    with_body = request.GET.get('body') != '0'
+    parts = meeting.parts.after(after, limit)
+    if not with_body:
+        parts = parts.defer('body')
+    result = []
+    for part in parts:
+        data = {'id': part.id, 'order': part.order, 'header': part.header, 'speaker': part.speaker_id}
+        if with_body:
+            data['body'] = part.body
+        result.append(data)
+    response = {
+        'parts': result,
+        'next': result[-1]['order'] if len(result) == limit else None,
+    }
+    return HttpResponse(json.dumps(response), content_type='application/json')
+
+
 def static_committee_meeting_redirect():
     def view(*args, **kwargs):
         try:
@@ -0,0 +1,121 @@
+"""
+iCalendar feeds of events.
+
+A feed holds the future (or all) events, of everyone, of a committee (the
+event's which_object) or of a person (who). The VEVENT of an event is
+rendered once and cached until the event is saved or deleted, so serving a
+feed reads the ids of its events (through the when index) and the cached
+VEVENTs, renders only the events that aren't cached, and doesn't write to
+the db.
+
+Any change to the events bumps the events version, the time of the last
+change. A feed's ETag is a hash of its event ids and the version, and its
+Last-Modified is the version, or the start of the last event that left a
+future only feed if that was later.
+"""
+from datetime import datetime
+import hashlib
+import time
+
+import vobject
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+
+from events.models import Event
+
+# VEVENTs are cached for these summary lengths
+CACHED_SUMMARY_LENGTHS = (50,)
+VEVENT_CACHE_TIME = 60 * 60 * 24 * 7
+VERSION_KEY = 'events_ical_version'
+VERSION_CACHE_TIME = 60 * 60 * 24 * 30
+# without a cached version, events changed in other processes are assumed
+# to have changed at the start of the current period of this length
+VERSION_FALLBACK_PERIOD = 60 * 10
+
+CALENDAR_BEGIN = 'BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//PYVOBJECT//NONSGML Version 1//EN\r\n'
+CALENDAR_END = 'END:VCALENDAR\r\n'
+
+# number of events rendered per query
+RENDER_CHUNK_SIZE = 500
+
+
+# the time of the last change to the events in this process
+_local_version = time.time()
+
+
+def vevent_cache_key(event_id, summary_length):
+    return 'event_vevent_%s_%d' % (event_id, summary_length)
+
+
+def invalidate_event(event_id=None):
+    """Drop the cached VEVENT of the event with event_id, if given, and
+    bump the events version"""
+    global _local_version
+    if event_id is not None:
+        cache.delete_many([vevent_cache_key(event_id, length) for length in CACHED_SUMMARY_LENGTHS])
+    _local_version = time.time()
+    cache.set(VERSION_KEY, _local_version, VERSION_CACHE_TIME)
+
+
+def events_version():
+    """The time of the last change to the events"""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # not cached (or a dummy cache), see VERSION_FALLBACK_PERIOD
+        now = time.time()
+        version = max(_local_version, now - now % VERSION_FALLBACK_PERIOD)
+        cache.add(VERSION_KEY, version, VERSION_CACHE_TIME)
+    return version
+
+
+def feed_events(committee_id=None, person_id=None):
+    """The events of the feed of the committee with committee_id, the person
+    with person_id, or all the events"""
+    qs = Event.objects.all()
+    if committee_id is not None:
+        qs = qs.filter(which_type=ContentType.objects.get(app_label="committees", model="committee"),
+                       which_pk=str(committee_id))
+    if person_id is not None:
+        qs = qs.filter(who=person_id)
+    return qs
+
+
+def render_vevent(event, summary_length):
+    return event.add_vevent_to_ical(vobject.iCalendar(), summary_length=summary_length).serialize()
+
+
+def render_calendar(event_ids, summary_length):
+    """The iCalendar of the events with event_ids, in that order"""
+    keys = [vevent_cache_key(event_id, summary_length) for event_id in event_ids]
+    cached = summary_length in CACHED_SUMMARY_LENGTHS
+    vevents = cache.get_many(keys) if cached else {}
+    missing = [event_id for event_id, key in zip(event_ids, keys) if key not in vevents]
+    for start in xrange(0, len(missing), RENDER_CHUNK_SIZE):
+        rendered = dict((vevent_cache_key(event.id, summary_length), render_vevent(event, summary_length))
+                        for event in Event.objects.filter(id__in=missing[start:start + RENDER_CHUNK_SIZE]))
+        if cached:
+            cache.set_many(rendered, VEVENT_CACHE_TIME)
+        vevents.update(rendered)
+    return ''.join([CALENDAR_BEGIN] + [vevents[key] for key in keys if key in vevents] + [CALENDAR_END])
+
+
+class Feed(object):
+    """The ids, ETag and Last-Modified time of an iCalendar feed"""
+
+    def __init__(self, summary_length=50, future_only=True, committee_id=None, person_id=None):
+        self.summary_length = summary_length
+        events = feed_events(committee_id, person_id)
+        version = events_version()
+        if future_only:
+            now = datetime.now()
+            passed = list(events.filter(when__lte=now).order_by('-when').values_list('when', flat=True)[:1])
+            if passed:
+                version = max(version, time.mktime(passed[0].timetuple()))
+            events = events.filter(when__gt=now)
+        self.event_ids = list(events.order_by('when', 'id').values_list('id', flat=True))
+        self.last_modified = version
+        self.etag = hashlib.md5('%s:%d:%s' % (version, summary_length,
+                                              ','.join(str(event_id) for event_id in self.event_ids))).hexdigest()
+
+    def render(self):
+        return render_calendar(self.event_ids, self.summary_length)
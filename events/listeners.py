@@ -0,0 +1,17 @@
+from django.db.models.signals import post_save, post_delete, m2m_changed
+
+from events.ical import invalidate_event
+from events.models import Event
+
+
+def invalidate_event_ical(sender, instance, **kwargs):
+    invalidate_event(instance.id)
+post_save.connect(invalidate_event_ical, sender=Event)
+post_delete.connect(invalidate_event_ical, sender=Event)
+
+
+def invalidate_person_feeds(sender, action, **kwargs):
+    # the events of a person's feed changed
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_event()
+m2m_changed.connect(invalidate_person_feeds, sender=Event.who.through)
@@ -35,7 +35,7 @@ class Event(models.Model):
         and allows the users to contribute resources (through links)
         and discuss upcoming events.
     '''
-    when = models.DateTimeField()
+    when = models.DateTimeField(db_index=True)
     when_over = models.DateTimeField(null=True, blank=True)
     # KNESSET_TODO the end time of a committee meeting is not recorded anywhere,
     # so we are left to guess
@@ -58,6 +58,10 @@ class Event(models.Model):
 
     objects = EventManager()
 
+    class Meta:
+        # the per committee calendar feeds
+        index_together = [['which_type', 'which_pk', 'when']]
+
     @property
     def is_future(self):
         return self.when > datetime.now()
@@ -77,28 +81,31 @@ class Event(models.Model):
 
     def add_vevent_to_ical(self, cal, summary_length):
         """
-        adds itself as a vevent to @cal.
+        adds itself as a vevent to @cal, and returns the vevent.
         cal should be a vobject.iCalendar
         """
         vevent = cal.add('vevent')
+        vevent.add('uid').value = self.icaluid or 'oknesset-event-%d' % self.pk
         vevent.add('dtstart').value = self.when
         warnings = []
-        if not self.when_over:
-            # this can happen if you migrated so you have when_over but
-            # have not run parse_future_committee_meetings yet.
-            self.when_over = self.when + timedelta(hours=2)
-            self.when_over_guessed = True
-            self.save()
-        if self.when_over_guessed:
+        # when_over can be missing if you migrated so you have when_over but
+        # have not run parse_future_committee_meetings yet.
+        when_over = self.when_over or self.when + timedelta(hours=2)
+        if self.when_over_guessed or not self.when_over:
             warnings.append(ugettext('no end date data - guessed it to be 2 hours after start'))
         # TODO: add `geo` to the Event model
         # FLOAT:FLOAT lon:lat, up to 6 digits, degrees.
         vevent.add('geo').value = '31.777067;35.205495'
         vevent.add('x-pk').value = str(self.pk)
-        vevent.add('dtend').value = self.when_over
+        vevent.add('dtend').value = when_over
         vevent.add('summary').value = self.get_summary(summary_length)
         vevent.add('location').value = self.where
+        description = self.what
         if warnings:
-            self.what = '\n'.join((self.what, '', ugettext('oknesset warnings:'), ''))
-            self.what += '\n'.join(warnings)
-        vevent.add('description').value = self.what
+            description = '\n'.join((description, '', ugettext('oknesset warnings:'), ''))
+            description += '\n'.join(warnings)
+        vevent.add('description').value = description
+        return vevent
+
+
+from listeners import *
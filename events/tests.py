@@ -8,14 +8,18 @@ Replace these with more appropriate tests for your application.
 import datetime
 from datetime import timedelta
 import json
+import time
 
 import vobject
 
 from django.test import TestCase
 from django.utils import translation
 from django.core.urlresolvers import reverse
+from django.utils.http import http_date
 
+from committees.models import Committee
 from models import Event
+from persons.models import Person
 
 
 class ViewTest(TestCase):
@@ -37,6 +41,42 @@ class ViewTest(TestCase):
         self.assertEqual(res.context['in_hours'], 2)
         self.assertEqual(res.context['in_minutes'], 33)
 
+    def _event_ids(self, res):
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res['Content-Type'], 'text/calendar; charset=utf-8')
+        return [int(vevent.x_pk.value) for vevent in vobject.readOne(res.content).vevent_list]
+
+    def testIcalendar(self):
+        res = self.client.get(reverse('event-icalendar'))
+        self.assertEqual(self._event_ids(res), [self.ev3.id, self.ev2.id])
+        vevent = vobject.readOne(res.content).vevent_list[1]
+        self.assertEqual(len(vevent.summary.value), 50)
+        # reading doesn't fill the guessed end time
+        self.assertIsNone(Event.objects.get(id=self.ev3.id).when_over)
+        self.assertTrue(res['ETag'])
+        etag = res['ETag']
+        res = self.client.get(reverse('event-icalendar'), HTTP_IF_NONE_MATCH=etag,
+                              HTTP_IF_MODIFIED_SINCE=http_date(time.time() - 3600))
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res['ETag'], etag)
+
+        res = self.client.get(reverse('event-icalendar'),
+                              HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60))
+        self.assertEqual(res.status_code, 304)
+        res = self.client.get(reverse('event-icalendar'), HTTP_IF_NONE_MATCH='"other"')
+        self.assertEqual(self._event_ids(res), [self.ev3.id, self.ev2.id])
+
+    def testIcalendarFeeds(self):
+        committee = Committee.objects.create(name='c1')
+        person = Person.objects.create(name='p1')
+        self.ev2.which_object = committee
+        self.ev2.save()
+        self.ev3.who.add(person)
+        res = self.client.get(reverse('committee-event-icalendar', kwargs={'committee_id': committee.id}))
+        self.assertEqual(self._event_ids(res), [self.ev2.id])
+        res = self.client.get(reverse('person-event-icalendar', kwargs={'person_id': person.id}))
+        self.assertEqual(self._event_ids(res), [self.ev3.id])
+
     def tearDown(self):
         self.ev1.delete()
         self.ev2.delete()
@@ -1,14 +1,15 @@
 # Create your views here.
 
 from datetime import datetime
-import vobject
 
 from django.conf import settings
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
 
 from auxiliary.mixins import GetMoreView
 from hashnav.detail import DetailView
 
+from ical import Feed
 from models import Event
 
 
@@ -40,21 +41,25 @@ class MoreUpcomingEventsView(GetMoreView):
         return Event.objects.get_upcoming()
 
 
-def icalendar(request, summary_length=50, future_only=True):
+def icalendar(request, summary_length=50, future_only=True, committee_id=None, person_id=None):
     """
-    return a single icalendar file, default to future_only.
+    return a single icalendar file, default to future_only, of the events of
+    the committee with committee_id or the person with person_id if given.
     """
-    summary_length = int(summary_length)
-    cal = vobject.iCalendar()
-    now = datetime.now()
-    for e in Event.objects.all():
-        # TODO - use a proper query once I recall the syntax (actually the
-        # implementation of is_future makes this query pretty bad, since it
-        # will execute multiple times - to do this properly I need some sort of
-        # select * from table where start_date > $now, then now is only
-        # calculated once, and this should be log(N) time (assuming an ordered
-        # index on start_date)
-        if future_only and e.when <= now:
-            continue
-        e.add_vevent_to_ical(cal, summary_length=summary_length)
-    return HttpResponse(cal.serialize())
+    feed = Feed(summary_length=int(summary_length), future_only=future_only,
+                committee_id=committee_id, person_id=person_id)
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        # takes precedence over If-Modified-Since
+        etags = parse_etags(if_none_match)
+        not_modified = feed.etag in etags or '*' in etags
+    else:
+        if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE'))
+        not_modified = if_modified_since is not None and if_modified_since >= int(feed.last_modified)
+    if not_modified:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(feed.render(), content_type='text/calendar; charset=utf-8')
+    response['ETag'] = quote_etag(feed.etag)
+    response['Last-Modified'] = http_date(feed.last_modified)
+    return response
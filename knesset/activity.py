@@ -0,0 +1,119 @@
+# encoding: utf-8
+"""
+Batched activity stream writing.
+
+Members' activity (voting, attending committee meetings, proposing bills)
+is recorded as actstream Actions of the member (actor) on the vote, meeting
+or bill (target). An activity is recorded at most once, so signal handlers
+used to check for an existing Action and call action.send for every row.
+Instead they pass PendingActions to record_actions, which writes them
+together: one query finds the ones already recorded and the rest are
+created with one bulk_create. A recorded action whose description changed
+(e.g. a vote action re-created with another type) gets the new description.
+Inside suppress_signals the pending actions of the whole block (e.g. an
+importer's transaction) are collected and written when it ends.
+
+The database enforces the uniqueness of the (actor, verb, target) of the
+UNIQUE_VERBS actions with a partial unique index (auxiliary migration 0014,
+on PostgreSQL and SQLite only; elsewhere write_actions is the only check).
+"""
+from collections import defaultdict, namedtuple, OrderedDict
+import logging
+
+from actstream.models import Action
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction, IntegrityError
+
+from knesset.utils import defer, signals_suppressed
+
+logger = logging.getLogger("open-knesset.knesset.activity")
+
+# the verbs of the actions recorded once per (actor, verb, target)
+UNIQUE_VERBS = ('voted', 'attended', 'proposed', 'joined')
+
+# number of pending actions looked up in one query
+LOOKUP_CHUNK_SIZE = 500
+
+PendingAction = namedtuple('PendingAction', ['actor_content_type_id', 'actor_object_id', 'verb',
+                                             'target_content_type_id', 'target_object_id',
+                                             'description', 'timestamp'])
+
+
+def pending_action(actor_model, actor_id, verb, target_model, target_id, description=None, timestamp=None):
+    """A PendingAction of the actor_model (a model or an instance) object
+    with actor_id on the target_model object with target_id. Takes ids, so
+    the actor and target don't have to be loaded."""
+    return PendingAction(ContentType.objects.get_for_model(actor_model).id, unicode(actor_id), verb,
+                         ContentType.objects.get_for_model(target_model).id, unicode(target_id),
+                         description, timestamp)
+
+
+def action_key(action):
+    """The (actor, verb, target) of a PendingAction"""
+    return action[:5]
+
+
+def _recorded_actions(keys):
+    """A dict of the keys of the actions in keys that are already recorded
+    to the (id, description) of their Actions"""
+    recorded = defaultdict(list)
+    for start in xrange(0, len(keys), LOOKUP_CHUNK_SIZE):
+        chunk = keys[start:start + LOOKUP_CHUNK_SIZE]
+        # a superset of the chunk's actions, in a single query
+        for row in Action.objects.filter(
+                actor_content_type__in=set(key[0] for key in chunk),
+                actor_object_id__in=set(key[1] for key in chunk),
+                verb__in=set(key[2] for key in chunk),
+                target_content_type__in=set(key[3] for key in chunk),
+                target_object_id__in=set(key[4] for key in chunk)).values_list(
+                'actor_content_type', 'actor_object_id', 'verb', 'target_content_type', 'target_object_id',
+                'id', 'description'):
+            recorded[row[:5]].append(row[5:])
+    return dict((key, recorded[key]) for key in keys if key in recorded)
+
+
+def write_actions(actions):
+    """Create the Actions of the PendingActions that aren't recorded yet, and
+    update the description of those recorded with another one"""
+    pending = OrderedDict()
+    for action in actions:
+        # the last description of an action wins
+        pending[action_key(action)] = action
+    changed = defaultdict(list)
+    for key, recorded in _recorded_actions(pending.keys()).iteritems():
+        description = pending.pop(key).description
+        if description is not None:
+            changed[description].extend(action_id for action_id, old in recorded if old != description)
+    for description, action_ids in changed.iteritems():
+        if action_ids:
+            Action.objects.filter(id__in=action_ids).update(description=description)
+    if not pending:
+        return
+    new_actions = []
+    for action in pending.itervalues():
+        fields = action._asdict()
+        if fields['timestamp'] is None:
+            del fields['timestamp']
+        new_actions.append(Action(**fields))
+    try:
+        with transaction.atomic():
+            Action.objects.bulk_create(new_actions)
+    except IntegrityError:
+        # some were recorded concurrently, create the others one by one
+        logger.debug('bulk create of %d actions failed, creating separately' % len(new_actions))
+        for new_action in new_actions:
+            try:
+                with transaction.atomic():
+                    new_action.save()
+            except IntegrityError:
+                pass
+
+
+def record_actions(actions):
+    """Record the PendingActions that aren't recorded yet, now or, inside
+    suppress_signals, when it ends"""
+    if signals_suppressed():
+        for action in actions:
+            defer(write_actions, action)
+    else:
+        write_actions(actions)
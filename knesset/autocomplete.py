@@ -0,0 +1,163 @@
+# encoding: utf-8
+"""
+In-process autocomplete indexes.
+
+An AutocompleteIndex holds the lowercased texts of all the objects of some
+kind, in rank (recency) order, and a trigram index of them: every 3
+character substring maps to a compact array of the positions of the texts
+containing it. A query (of 3 characters or more) is looked up by its rarest
+trigram and only the texts in that posting list are checked for the query
+as a substring, so matching costs the same as icontains (case insensitive
+substring) but without scanning a table. Matches at the start of the text
+or of a word rank first, then by recency. Results of recent queries are
+kept in a small LRU cache.
+
+Indexes are built lazily, on the first query in a process. Saving or
+deleting a model the index depends on marks it stale in the current process
+and bumps its version in the cache; other processes check the version every
+VERSION_CHECK_INTERVAL seconds, and rebuild at least every MAX_AGE seconds
+in case the data changed without signals (queryset updates, bulk loads).
+"""
+import threading
+import time
+import uuid
+from array import array
+from collections import defaultdict, OrderedDict
+
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+
+VERSION_CHECK_INTERVAL = 60
+MAX_AGE = 60 * 60
+VERSION_TIMEOUT = 60 * 60 * 24 * 30
+HOT_QUERIES = 1000
+# stop looking once this many matches were found
+MAX_MATCHES = 1000
+
+
+def trigrams(text):
+    return set(text[i:i + 3] for i in xrange(len(text) - 2))
+
+
+class _Index(object):
+    def __init__(self, entries):
+        self.texts = []
+        self.results = []
+        self.keys = defaultdict(list)
+        self.postings = defaultdict(lambda: array('I'))
+        for position, (text, result, keys) in enumerate(entries):
+            text = text.lower()
+            self.texts.append(text)
+            self.results.append(result)
+            for key in keys:
+                self.keys[key].append(position)
+            for trigram in trigrams(text):
+                self.postings[trigram].append(position)
+        self.postings = dict(self.postings)
+        self.hot = OrderedDict()
+        self.built = time.time()
+
+    def candidates(self, query):
+        if len(query) < 3:
+            return xrange(len(self.texts))
+        postings = []
+        for trigram in trigrams(query):
+            if trigram not in self.postings:
+                return ()
+            postings.append(self.postings[trigram])
+        return min(postings, key=len)
+
+    def search(self, query, limit):
+        # start of text, start of a word, anywhere
+        ranked = ([], [], [])
+        found = 0
+        for position in self.candidates(query):
+            text = self.texts[position]
+            start = text.find(query)
+            if start < 0:
+                continue
+            if start == 0:
+                ranked[0].append(position)
+                if len(ranked[0]) >= limit:
+                    break
+            elif not text[start - 1].isalnum():
+                ranked[1].append(position)
+            else:
+                ranked[2].append(position)
+            found += 1
+            if found >= MAX_MATCHES:
+                break
+        return [self.results[position] for position in (ranked[0] + ranked[1] + ranked[2])[:limit]]
+
+
+class AutocompleteIndex(object):
+    """
+    Base class of autocomplete indexes. Subclasses set name and models (the
+    models whose changes invalidate the index) and implement entries().
+    """
+    name = None
+    models = ()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+        self._stale = True
+        self._version = None
+        self._checked = 0
+
+    def entries(self):
+        """Iterable of (text, result, keys) of every object, in rank order.
+        text is matched against queries; keys are exact query strings that
+        find the object too (like a number), see key()"""
+        raise NotImplementedError
+
+    def key(self, query):
+        """The exact lookup key of query, or None to match it as text"""
+        return None
+
+    @property
+    def version_key(self):
+        return 'autocomplete_%s_version' % self.name
+
+    def connect(self):
+        for model in self.models:
+            post_save.connect(self.invalidate, sender=model, dispatch_uid='autocomplete_%s' % self.name)
+            post_delete.connect(self.invalidate, sender=model, dispatch_uid='autocomplete_%s' % self.name)
+
+    def invalidate(self, **kwargs):
+        self._stale = True
+        cache.set(self.version_key, uuid.uuid4().hex, VERSION_TIMEOUT)
+
+    def _current_index(self):
+        now = time.time()
+        index = self._index
+        if index is not None and not self._stale and now - index.built < MAX_AGE:
+            if now - self._checked < VERSION_CHECK_INTERVAL:
+                return index
+            self._checked = now
+            if cache.get(self.version_key) == self._version:
+                return index
+        with self._lock:
+            if self._index is index:
+                self._stale = False
+                self._version = cache.get(self.version_key)
+                self._checked = now
+                self._index = _Index(self.entries())
+            return self._index
+
+    def search(self, query, limit):
+        """Up to limit results of the objects matching query"""
+        index = self._current_index()
+        query = query.lower()
+        hot_key = (query, limit)
+        results = index.hot.pop(hot_key, None)
+        if results is None:
+            key = self.key(query)
+            if key is not None:
+                results = [index.results[position] for position in index.keys.get(key, [])[:limit]]
+            else:
+                results = index.search(query, limit)
+            if len(index.hot) >= HOT_QUERIES:
+                index.hot.popitem(last=False)
+        index.hot[hot_key] = results
+        return results
@@ -0,0 +1,97 @@
+# encoding: utf-8
+"""
+Streaming exports of large querysets.
+
+Rows are read in primary key order, a chunk at a time, with keyset
+pagination (WHERE pk > last pk) instead of OFFSET, and written to a
+StreamingHttpResponse as they are produced, so memory use does not depend
+on the size of the export. Exports can be resumed from the last exported
+primary key with since_id, and optionally compressed to a .gz file on the
+fly (transport compression of the stream is left to GZipMiddleware).
+"""
+import csv
+import zlib
+
+import ujson
+from django.http import StreamingHttpResponse
+
+EXPORT_CHUNK_SIZE = 1000
+
+CSV_BOM = '\xef\xbb\xbf'
+
+
+def iterate_by_key(queryset, chunk_size=EXPORT_CHUNK_SIZE, since_id=None):
+    """Yield (pks, chunk) pairs of queryset in primary key order, where chunk
+    is a queryset of the objects with the (sorted) primary keys pks. Only the
+    objects with a primary key greater than since_id are exported."""
+    last_pk = since_id
+    while True:
+        keys = queryset.order_by('pk')
+        if last_pk is not None:
+            keys = keys.filter(pk__gt=last_pk)
+        pks = list(keys.values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            return
+        yield pks, queryset.filter(pk__in=pks).order_by('pk')
+        last_pk = pks[-1]
+
+
+class _LineBuffer(object):
+    """A file like object for csv.writer, which returns what it is given"""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(header, rows):
+    """Encoded CSV lines of header and rows (iterables of unicode values),
+    prefixed with a BOM for excel"""
+    writer = csv.writer(_LineBuffer(), dialect='excel')
+    yield CSV_BOM + writer.writerow([unicode(title).encode('utf8') for title in header])
+    for row in rows:
+        yield writer.writerow([unicode(value).encode('utf8') for value in row])
+
+
+def json_array(items):
+    """A JSON array of items, one item per chunk"""
+    yield '['
+    separator = ''
+    for item in items:
+        yield separator + ujson.dumps(item)
+        separator = ',\n'
+    yield ']'
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def get_since_id(request):
+    """The since_id GET param of request as an int, or None"""
+    try:
+        return int(request.GET['since_id'])
+    except (KeyError, ValueError, TypeError, AttributeError):
+        return None
+
+
+def wants_gzip(request):
+    return request is not None and request.GET.get('gzip') in ('1', 'true')
+
+
+def streaming_response(chunks, content_type, filename=None, compress=False):
+    """A StreamingHttpResponse of chunks, downloaded as filename (with a .gz
+    suffix when compressed)"""
+    if compress:
+        chunks = gzip_chunks(chunks)
+        content_type = 'application/gzip'
+        if filename:
+            filename += '.gz'
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    if filename:
+        response['Content-Disposition'] = 'attachment; filename="{}"'.format(filename)
+    return response
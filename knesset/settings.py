@@ -191,6 +191,7 @@ INSTALLED_APPS = (
     'kikar',
     'ok_tag',
     'dials',
+    'search',
 ) + KNESSET_DATA_DJANGO_APPS
 
 TEMPLATE_CONTEXT_PROCESSORS = (
@@ -260,7 +261,6 @@ request_logger.setLevel(logging.ERROR)
 request_logger.addHandler(stderr_handler)
 request_logger.addHandler(stderr_handler)
 
-GOOGLE_CUSTOM_SEARCH = "007833092092208924626:1itz_l8x4a4"
 GOOGLE_MAPS_API_KEYS = {'dev': 'ABQIAAAAWCfW8hHVwzZc12qTG0qLEhQCULP4XOMyhPd8d_NrQQEO8sT8XBQdS2fOURLgU1OkrUWJE1ji1lJ-3w',
                         'prod': 'ABQIAAAAWCfW8hHVwzZc12qTG0qLEhR8lgcBs8YFes75W3FA_wpyzLVCpRTF-eaJoRuCHAJ2qzVu-Arahwp8QA'}
 GOOGLE_MAPS_API_KEY = GOOGLE_MAPS_API_KEYS['dev']  # override this in prod server
@@ -1,6 +1,18 @@
+# encoding: utf-8
+import datetime
+import gzip
+import hashlib
+import json
+import os
+from xml.sax.saxutils import escape
+
+from django.conf import settings
 from django.contrib.sitemaps import Sitemap
+from django.contrib.sites.models import Site
+from django.core.urlresolvers import reverse
+from django.utils.encoding import iri_to_uri, smart_str
 from tagging.models import Tag
-from mks.models import Member, Party
+from mks.models import Member, Party, member_name_with_dashes
 from laws.models import Vote, Bill
 from committees.models import Committee, CommitteeMeeting
 from agendas.models import Agenda
@@ -9,7 +21,8 @@ from agendas.models import Agenda
 class LimitSitemap(Sitemap):
     pass
     # this can be used to automatically paginate sitemaps.
-    # must use sections for that. currently using a single file-cached sitemap
+    # the sitemap files written by update_sitemap are paginated by
+    # write_sitemap_files, see FileSection
     # limit = 2000
 
 
@@ -98,3 +111,242 @@ sitemaps = {
     'agendas': AgendaSitemap,
     'index': IndexPagesSitemap,
 }
+
+
+# Sitemap files
+#
+# update_sitemap writes the sitemaps to gzipped files under
+# MEDIA_ROOT/sitemaps, a file per section and page, and a sitemap index
+# listing them to MEDIA_ROOT/sitemap.xml. The rows of a section are read
+# with values_list, ordered by id, and the urls are built from the row
+# values. Page n of a section holds the rows with ids in
+# [n * URLS_PER_PAGE, (n + 1) * URLS_PER_PAGE), so adding or removing rows
+# only changes their own pages. A hash of every page's rows is kept in a
+# manifest, and only pages whose rows changed since the last run are
+# written again.
+
+URLS_PER_PAGE = 10000
+SITEMAPS_DIR = 'sitemaps'
+INDEX_FILE = 'sitemap.xml'
+MANIFEST_FILE = 'manifest.json'
+
+
+class FileSection(object):
+    """A section of the sitemap files. Subclasses set sitemap (the Sitemap
+    class of the section, for changefreq and priority), model and fields,
+    the values_list fields following the id, and implement location(row)."""
+    sitemap = None
+    model = None
+    fields = ()
+
+    def __init__(self, name):
+        self.name = name
+
+    def rows(self):
+        return self.model.objects.order_by('id').values_list('id', *self.fields).iterator()
+
+    def location(self, row):
+        raise NotImplementedError
+
+    def lastmod(self, row):
+        return None
+
+
+class MemberSection(FileSection):
+    sitemap = MemberSitemap
+    model = Member
+    fields = ('name',)
+
+    def location(self, row):
+        return reverse('member-detail-with-slug', args=[str(row[0]), member_name_with_dashes(row[1])])
+
+
+class BillSection(FileSection):
+    sitemap = BillSitemap
+    model = Bill
+    fields = ('stage_date',)
+
+    def location(self, row):
+        return reverse('bill-detail', args=[str(row[0])])
+
+    def lastmod(self, row):
+        return row[1]
+
+
+class PartySection(FileSection):
+    sitemap = PartySitemap
+    model = Party
+
+    def location(self, row):
+        return reverse('party-detail', args=[str(row[0])])
+
+
+class VoteSection(FileSection):
+    sitemap = VoteSitemap
+    model = Vote
+    fields = ('time',)
+
+    def location(self, row):
+        return reverse('vote-detail', args=[str(row[0])])
+
+    def lastmod(self, row):
+        return row[1].date()
+
+
+class CommitteeSection(FileSection):
+    sitemap = CommitteeSitemap
+    model = Committee
+    fields = ('type',)
+
+    def location(self, row):
+        if row[1] == 'plenum':
+            return reverse('plenum')
+        return reverse('committee-detail', args=[str(row[0])])
+
+
+class CommitteeMeetingSection(FileSection):
+    sitemap = CommitteeMeetingSitemap
+    model = CommitteeMeeting
+    fields = ('committee__type', 'date', 'protocol_parts_update_date')
+
+    def location(self, row):
+        if row[1] == 'plenum':
+            return reverse('plenum-meeting', args=[str(row[0])])
+        return reverse('committee-meeting', args=[str(row[0])])
+
+    def lastmod(self, row):
+        return row[3] or row[2]
+
+
+class AgendaSection(FileSection):
+    sitemap = AgendaSitemap
+    model = Agenda
+
+    def location(self, row):
+        return reverse('agenda-detail', args=[str(row[0])])
+
+
+class TagSection(FileSection):
+    sitemap = TagSitemap
+    model = Tag
+    fields = ('name',)
+
+    def location(self, row):
+        return reverse('tag-detail', kwargs={'slug': row[1]})
+
+
+class IndexPagesSection(FileSection):
+    sitemap = IndexPagesSitemap
+
+    def rows(self):
+        return enumerate(self.sitemap().items())
+
+    def location(self, row):
+        return row[1]
+
+
+file_sections = [
+    MemberSection('members'),
+    BillSection('bills'),
+    PartySection('parties'),
+    VoteSection('votes'),
+    CommitteeSection('committees'),
+    CommitteeMeetingSection('committees_meetings'),
+    AgendaSection('agendas'),
+    TagSection('tags'),
+    IndexPagesSection('index'),
+]
+
+
+def _pages(rows):
+    """(page number, rows of the page) of rows ordered by id"""
+    page, page_rows = None, []
+    for row in rows:
+        row_page = row[0] // URLS_PER_PAGE
+        if row_page != page and page_rows:
+            yield page, page_rows
+            page_rows = []
+        page = row_page
+        page_rows.append(row)
+    if page_rows:
+        yield page, page_rows
+
+
+def _page_hash(rows):
+    return hashlib.sha1(smart_str(repr(rows))).hexdigest()
+
+
+def _write_file(path, content, compress=False):
+    """Write content to path, replacing the file only when the write is done"""
+    tmp_path = path + '.tmp'
+    f = gzip.open(tmp_path, 'wb') if compress else open(tmp_path, 'wb')
+    try:
+        f.write(smart_str(content))
+    finally:
+        f.close()
+    os.rename(tmp_path, path)
+
+
+def _page_xml(section, rows, base_url):
+    changefreq = section.sitemap.changefreq
+    priority = section.sitemap.priority
+    parts = ['<?xml version="1.0" encoding="UTF-8"?>\n'
+             '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n']
+    for row in rows:
+        lastmod = section.lastmod(row)
+        parts.append('<url><loc>%s</loc>%s<changefreq>%s</changefreq><priority>%s</priority></url>\n' % (
+            escape(base_url + iri_to_uri(section.location(row))),
+            '<lastmod>%s</lastmod>' % lastmod.isoformat() if lastmod else '',
+            changefreq, priority))
+    parts.append('</urlset>\n')
+    return ''.join(parts)
+
+
+def write_sitemap_files(root=None, force=False):
+    """Write the sitemap files of the pages that changed since the last
+    call, and the sitemap index, under root (MEDIA_ROOT by default). All
+    the pages are written if force is true. Returns the number of pages
+    written."""
+    root = root or settings.MEDIA_ROOT
+    directory = os.path.join(root, SITEMAPS_DIR)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    manifest_path = os.path.join(directory, MANIFEST_FILE)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    base_url = 'http://%s' % Site.objects.get_current().domain
+    today = datetime.date.today().isoformat()
+    new_manifest = {}
+    written = 0
+    for section in file_sections:
+        for page, rows in _pages(section.rows()):
+            file_name = '%s-%d.xml.gz' % (section.name, page)
+            page_hash = _page_hash(rows)
+            entry = manifest.get(file_name)
+            if force or entry is None or entry['hash'] != page_hash or \
+                    not os.path.exists(os.path.join(directory, file_name)):
+                _write_file(os.path.join(directory, file_name), _page_xml(section, rows, base_url),
+                            compress=True)
+                lastmods = [lastmod for lastmod in (section.lastmod(row) for row in rows) if lastmod]
+                entry = {'hash': page_hash,
+                         'lastmod': max(lastmods).isoformat() if lastmods else today}
+                written += 1
+            new_manifest[file_name] = entry
+    # remove the pages that have no rows anymore
+    for file_name in set(manifest) - set(new_manifest):
+        path = os.path.join(directory, file_name)
+        if os.path.exists(path):
+            os.remove(path)
+    media_url = settings.MEDIA_URL if '://' in settings.MEDIA_URL else base_url + settings.MEDIA_URL
+    files_url = media_url + SITEMAPS_DIR + '/'
+    index = ['<?xml version="1.0" encoding="UTF-8"?>\n'
+             '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n']
+    for file_name in sorted(new_manifest):
+        index.append('<sitemap><loc>%s</loc><lastmod>%s</lastmod></sitemap>\n' % (
+            escape(files_url + file_name), new_manifest[file_name]['lastmod']))
+    index.append('</sitemapindex>\n')
+    _write_file(os.path.join(root, INDEX_FILE), ''.join(index))
+    _write_file(manifest_path, json.dumps(new_manifest))
+    return written
@@ -0,0 +1,52 @@
+# encoding: utf-8
+"""
+Multi pattern substring matching.
+
+PatternIndex answers "which of these (many) patterns occur in this text" with
+a single pass over the text, instead of one str.find per pattern. Patterns
+are indexed by their first KEY_LENGTH characters (short patterns by all of
+them); every position of the text is looked up in the index and only the few
+candidate patterns found there are verified with startswith. Matching thus
+costs O(len(text)) lookups however many patterns there are, and the index
+takes memory proportional to the number of patterns, not their total length.
+"""
+
+
+class PatternIndex(object):
+    KEY_LENGTH = 12
+
+    def __init__(self, patterns=()):
+        """patterns is an iterable of (pattern, value) pairs, see add"""
+        # key length -> {pattern prefix: [(pattern, value), ...]}
+        self._index = {}
+        self._count = 0
+        for pattern, value in patterns:
+            self.add(pattern, value)
+
+    def __len__(self):
+        return self._count
+
+    def add(self, pattern, value):
+        """Index pattern, reporting value when it is found. Several patterns
+        may share the same value; empty patterns are ignored."""
+        if not pattern:
+            return
+        length = min(len(pattern), self.KEY_LENGTH)
+        self._index.setdefault(length, {}).setdefault(pattern[:length], []).append((pattern, value))
+        self._count += 1
+
+    def matches(self, text):
+        """The set of values of all patterns occurring in text"""
+        found = set()
+        if not text or not self._index:
+            return found
+        lookups = [(length, self._index[length]) for length in sorted(self._index)]
+        shortest = lookups[0][0]
+        for i in xrange(len(text) - shortest + 1):
+            for length, keys in lookups:
+                candidates = keys.get(text[i:i + length])
+                if candidates:
+                    for pattern, value in candidates:
+                        if value not in found and text.startswith(pattern, i):
+                            found.add(value)
+        return found
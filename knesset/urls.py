@@ -26,6 +26,7 @@ from laws.models import Bill
 from lobbyists.urls import lobbyistpatterns
 from auxiliary.urls import auxiliarysurlpatterns
 from dials.urls import dialsurlpatterns
+from search.urls import searchurlpatterns
 
 from auxiliary.views import (
     main, post_annotation, post_details, post_feedback,
@@ -59,8 +60,6 @@ urlpatterns = patterns('',
     url(r'^comments/post/', 'knesset.utils.comment_post_wrapper', name='comments-post-comment'),
     (r'^comments/', include('django.contrib.comments.urls')),
     (r'^jsi18n/$', 'django.views.i18n.javascript_catalog', js_info_dict),
-    #(r'^search/', include('haystack.urls')),
-    url(r'^search/', 'auxiliary.views.search', name='site-search'),
     url(r'^feeds/$', feeds.MainActionsFeed(), name='main-actions-feed'),
     url(r'^feeds/comments/$', feeds.Comments(),name='feeds-comments'),
     url(r'^feeds/votes/$', feeds.Votes(),name='feeds-votes'),
@@ -109,6 +108,7 @@ urlpatterns += staticfiles_urlpatterns() + static(settings.MEDIA_URL, document_r
 urlpatterns += personsurlpatterns
 urlpatterns += auxiliarysurlpatterns
 urlpatterns += dialsurlpatterns
+urlpatterns += searchurlpatterns
 if settings.DEBUG:
     import debug_toolbar
 
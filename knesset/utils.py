@@ -1,6 +1,9 @@
 # encoding: utf-8
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime
 import re
+import threading
 
 from django.core.urlresolvers import reverse
 from django.utils.http import urlencode
@@ -93,24 +96,92 @@ def cannonize(s):
     return re.sub("""["'`\(\) /.,\-\xa0]""", '', s)  # @IndentOk
 
 
+def cannonized_key(s):
+    """A short key of the cannonized form of s, to store in an indexed column.
+    Strings that cannonize to the same string have the same key."""
+    return hashlib.sha1(smart_str(cannonize(s))).hexdigest()
+
+
 try:
     from functools import wraps
 except ImportError:
     from django.utils.functional import wraps
-import inspect
+
+_signals_state = threading.local()
+
+
+def signals_suppressed():
+    """Whether this thread is inside suppress_signals"""
+    return getattr(_signals_state, 'depth', 0) > 0
+
+
+@contextmanager
+def suppress_signals():
+    """
+    Context manager for bulk operations (loading fixtures, importers): the
+    signal handlers decorated with disable_for_loaddata are not called in
+    this thread inside it, and the work passed to defer is done once, in
+    bulk, when the outermost block exits without an exception.
+    """
+    depth = getattr(_signals_state, 'depth', 0)
+    if depth == 0:
+        _signals_state.deferred = OrderedDict()
+    _signals_state.depth = depth + 1
+    try:
+        yield
+    finally:
+        _signals_state.depth = depth
+        if depth == 0:
+            deferred = _signals_state.deferred
+            _signals_state.deferred = None
+    if depth == 0:
+        for func, items in deferred.iteritems():
+            func(items.keys())
+
+
+def defer(func, item):
+    """Call func with a list of item and the other items deferred with it
+    when the signals suppression ends, or with [item] now if the signals are
+    not suppressed. Equal items are passed once."""
+    if signals_suppressed():
+        _signals_state.deferred.setdefault(func, OrderedDict())[item] = True
+    else:
+        func([item])
 
 
 def disable_for_loaddata(signal_handler):
+    """Don't call the signal handler for fixture (raw) saves and inside
+    suppress_signals"""
     @wraps(signal_handler)
     def wrapper(*args, **kwargs):
-        for fr in inspect.stack():
-            if inspect.getmodulename(fr[1]) in ('loaddata', 'sync_dev'):
-                return
+        if kwargs.get('raw') or signals_suppressed():
+            return
         signal_handler(*args, **kwargs)
 
     return wrapper
 
 
+def deferred_when_suppressed(deferred):
+    """
+    Like disable_for_loaddata, but inside suppress_signals the handler is
+    replaced by deferred(*args, **kwargs), which should defer the bulk
+    equivalent of the handler's work and return.
+    """
+    def decorator(signal_handler):
+        @wraps(signal_handler)
+        def wrapper(*args, **kwargs):
+            if kwargs.get('raw'):
+                return
+            if signals_suppressed():
+                deferred(*args, **kwargs)
+                return
+            signal_handler(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
 class RequestFactory(Client):
     """
     Class that lets you create mock Request objects for use in testing.
@@ -211,3 +282,25 @@ def get_thousands_string(f):
 def get_cache_key(str):
     str = str.encode('utf-8')
     return hashlib.sha1(str).hexdigest()
+
+
+def bulk_add_m2m(model, field_name, pairs, chunk_size=500):
+    """
+    Add (source id, target id) pairs to the ManyToManyField field_name of model
+    with bulk inserts, skipping pairs that are already linked.
+    Note that unlike related_manager.add this sends no m2m_changed signals.
+    Returns the set of pairs that were added.
+    """
+    field = model._meta.get_field(field_name)
+    through = field.rel.through
+    source, target = field.m2m_field_name(), field.m2m_reverse_field_name()
+    pairs = set(pairs)
+    source_ids = sorted(set(source_id for source_id, target_id in pairs))
+    for i in range(0, len(source_ids), chunk_size):
+        pairs.difference_update(through.objects.filter(
+            **{source + '__in': source_ids[i:i + chunk_size]}).values_list(source, target))
+    new_pairs = sorted(pairs)
+    for i in range(0, len(new_pairs), chunk_size):
+        through.objects.bulk_create([through(**{source + '_id': source_id, target + '_id': target_id})
+                                     for source_id, target_id in new_pairs[i:i + chunk_size]])
+    return set(new_pairs)
@@ -14,6 +14,8 @@ from apis.resources.base import BaseResource
 from mks.api import MemberResource
 
 from models import Law, Bill, Vote, VoteAction, PrivateProposal
+from mks.models import Member
+from vote_choices import BILL_STAGE_CHOICES
 
 from simple.management.commands.syncdata_globals import p_explanation
 
@@ -41,6 +43,8 @@ class VoteActionResource(BaseResource):
             'member', 'party', 'vote', 'against_party', 'against_coalition', 'against_opposition', 'against_own_bill',
             'member_title', 'vote_title', 'member_url', 'vote_url', 'vote_time'
         ]
+        list_from_values = True
+        allow_export = True
 
     vote_type = fields.CharField('type', null=True)
     member = fields.ToOneField(MemberResource, 'member', full=False)
@@ -52,6 +56,24 @@ class VoteActionResource(BaseResource):
     vote_url = fields.CharField('vote__get_absolute_url')
     vote_time = fields.DateTimeField('vote__time')
 
+    def _vote_action_values(self, pks, *lookups):
+        return VoteAction.objects.filter(pk__in=pks).values_list('pk', *lookups)
+
+    def bulk_dehydrate_member_title(self, pks, request):
+        return dict(self._vote_action_values(pks, 'member__name'))
+
+    def bulk_dehydrate_member_url(self, pks, request):
+        return dict((pk, Member(id=member_id, name=name).get_absolute_url())
+                    for pk, member_id, name in self._vote_action_values(pks, 'member', 'member__name'))
+
+    def bulk_dehydrate_vote_title(self, pks, request):
+        return dict((pk, u"%s (%s)" % (title, time_string))
+                    for pk, title, time_string in self._vote_action_values(pks, 'vote__title', 'vote__time_string'))
+
+    def bulk_dehydrate_vote_url(self, pks, request):
+        return dict((pk, reverse('vote-detail', args=[str(vote_id)]))
+                    for pk, vote_id in self._vote_action_values(pks, 'vote'))
+
 
 class VoteResource(BaseResource):
     class Meta(BaseResource.Meta):
@@ -63,6 +85,8 @@ class VoteResource(BaseResource):
             'importance', 'controversy', 'against_party ', 'against_coalition',
             'against_opposition', 'against_own_bill',
         ]
+        list_from_values = True
+        allow_export = True
         filtering = dict(tag=('exact'),
                          member=ALL,
                          member_for=ALL,
@@ -169,6 +193,8 @@ class BillResource(BaseResource):
         ]
         include_absolute_url = True
         limit = 20
+        list_from_values = True
+        allow_export = True
 
     explanation = fields.CharField()
     legal_code = fields.CharField()
@@ -256,6 +282,14 @@ class BillResource(BaseResource):
     def dehydrate_stage(self, bundle):
         return bundle.obj.get_stage_display()
 
+    def bulk_dehydrate_stage(self, pks, request):
+        stages = dict(BILL_STAGE_CHOICES)
+        return dict((pk, stages.get(stage, stage)) for pk, stage in Bill.objects.filter(pk__in=pks).values_list(
+            'pk', 'stage'))
+
+    def bulk_dehydrate_absolute_url(self, pks, request):
+        return dict((pk, reverse('bill-detail', args=[str(pk)])) for pk in pks)
+
     def get_src_parts(self, bundle):
         try:
             return bundle.src_parts
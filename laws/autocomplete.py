@@ -0,0 +1,52 @@
+# encoding: utf-8
+"""
+Autocomplete indexes of bills, votes and knesset proposals, see
+knesset.autocomplete.
+"""
+from knesset.autocomplete import AutocompleteIndex
+from laws.models.bill import Bill
+from laws.models.law import Law
+from laws.models.proposal import KnessetProposal
+from laws.models.vote import Vote
+
+
+class BillAutocomplete(AutocompleteIndex):
+    name = 'bill'
+    models = (Bill,)
+
+    def entries(self):
+        for bill_id, full_title in Bill.objects.values_list('id', 'full_title'):
+            yield full_title, (bill_id, full_title), ()
+
+
+class VoteAutocomplete(AutocompleteIndex):
+    name = 'vote'
+    models = (Vote,)
+
+    def entries(self):
+        for vote_id, title, time in Vote.objects.values_list('id', 'title', 'time'):
+            yield title, (vote_id, u'{0} - {1}'.format(time.date().strftime('%d/%m/%Y'), title)), ()
+
+
+class KnessetProposalAutocomplete(AutocompleteIndex):
+    """Knesset proposals by title or law title, or by booklet number"""
+    name = 'knesset_proposal'
+    models = (KnessetProposal, Law)
+
+    def entries(self):
+        for kp_id, title, date, law_title, booklet_number in KnessetProposal.objects.order_by(
+                '-date', '-id').values_list('id', 'title', 'date', 'law__title', 'booklet_number'):
+            formatted_date = date.strftime('%d/%m/%Y') if date else u''
+            suggestion = u'{0} - {1} - {2}'.format(formatted_date, law_title or u'', title)
+            keys = (unicode(booklet_number),) if booklet_number is not None else ()
+            yield u'%s\n%s' % (title, law_title or u''), (kp_id, suggestion), keys
+
+    def key(self, query):
+        return query if query.isdigit() else None
+
+
+bill_autocomplete = BillAutocomplete()
+vote_autocomplete = VoteAutocomplete()
+knesset_proposal_autocomplete = KnessetProposalAutocomplete()
+for index in (bill_autocomplete, vote_autocomplete, knesset_proposal_autocomplete):
+    index.connect()
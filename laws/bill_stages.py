@@ -0,0 +1,312 @@
+# encoding: utf-8
+"""
+Resolving the stages and activity streams of bills in batches.
+
+Bill.update_stage looks at the votes, proposals and committee meetings of a
+single bill, with a few queries per bill, and always saves it. update_stages
+does the same for many bills: the related data of a chunk of bills is fetched
+with a fixed number of queries, stages are resolved in memory, only the bills
+whose stage changed are written, and the activity streams that differ from
+the bills' data are replaced with one bulk delete and one bulk insert.
+"""
+import logging
+from collections import defaultdict, namedtuple
+from datetime import datetime
+
+from actstream.models import Action
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+
+from committees.models import CommitteeMeeting
+from laws.constants import FIRST_KNESSET_START, CONVERT_TO_DISCUSSION_HEADERS
+from laws.enums import BillStages
+from laws.autocomplete import bill_autocomplete
+from laws.listeners import add_tags_to_bill_related_objects
+from laws.models import (Bill, Vote, PrivateProposal, KnessetProposal, GovProposal,
+                         GovLegislationCommitteeDecision, PartyStatistics)
+from mks.models import Member
+from search.indexer import index_objects
+
+logger = logging.getLogger("open-knesset.laws.bill_stages")
+
+CHUNK_SIZE = 500
+
+VOTE_FIELDS = ('id', 'title', 'time', 'for_votes_count', 'against_votes_count')
+
+
+class VoteData(namedtuple('VoteData', VOTE_FIELDS)):
+    """The fields of a vote the stage of a bill depends on"""
+
+    @property
+    def passed(self):
+        return self.for_votes_count > self.against_votes_count
+
+
+ProposalData = namedtuple('ProposalData', ['id', 'date', 'title'])
+MeetingData = namedtuple('MeetingData', ['id', 'date', 'committee_name'])
+DecisionData = namedtuple('DecisionData', ['id', 'date', 'stand'])
+
+# stage (and stage date) change of a bill. stream is True when the stage was
+# resolved from all the bill data, in which case its activity stream is
+# regenerated (if it changed), like Bill.update_stage does
+StageChange = namedtuple('StageChange', ['bill_id', 'old_stage', 'old_stage_date', 'stage', 'stage_date', 'stream'])
+
+
+class BillRelations(object):
+    """The related objects of a bill that its stage and activity stream
+    are computed from"""
+
+    def __init__(self):
+        self.proposals = []
+        self.knesset_proposal = None
+        self.gov_proposal = None
+        self.pre_votes = []
+        self.first_committee_meetings = []
+        self.second_committee_meetings = []
+        self.gov_decisions = []
+
+
+def fetch_relations(bill_ids):
+    """A dict of bill id -> BillRelations of every bill in bill_ids, fetched
+    with a fixed number of queries"""
+    relations = defaultdict(BillRelations)
+    for bill_id, proposal_id, date, title in PrivateProposal.objects.filter(bill__in=bill_ids).values_list(
+            'bill', 'id', 'date', 'title'):
+        relations[bill_id].proposals.append(ProposalData(proposal_id, date, title))
+    for model, attr in ((KnessetProposal, 'knesset_proposal'), (GovProposal, 'gov_proposal')):
+        for bill_id, proposal_id, date, title in model.objects.filter(bill__in=bill_ids).values_list(
+                'bill', 'id', 'date', 'title'):
+            setattr(relations[bill_id], attr, ProposalData(proposal_id, date, title))
+    for vote in Vote.objects.filter(bills_pre_votes__in=bill_ids).values('bills_pre_votes', *VOTE_FIELDS):
+        relations[vote['bills_pre_votes']].pre_votes.append(VoteData(*[vote[f] for f in VOTE_FIELDS]))
+    for field in ('first_committee_meetings', 'second_committee_meetings'):
+        through = Bill._meta.get_field(field).rel.through
+        for bill_id, cm_id, date, committee_name in through.objects.filter(bill__in=bill_ids).values_list(
+                'bill', 'committeemeeting', 'committeemeeting__date', 'committeemeeting__committee__name'):
+            getattr(relations[bill_id], field).append(MeetingData(cm_id, date, committee_name))
+    for bill_id, decision_id, date, stand in GovLegislationCommitteeDecision.objects.filter(
+            bill__in=bill_ids).values_list('bill', 'id', 'date', 'stand'):
+        relations[bill_id].gov_decisions.append(DecisionData(decision_id, date, stand))
+    return relations
+
+
+def resolve_stage(stage, stage_date, approval_vote, first_vote, relations, force_update=False):
+    """
+    The stage of a bill according to all its current data, as a
+    (stage, stage_date, stream) tuple, see Bill.update_stage.
+    approval_vote and first_vote are the votes of the bill (or None),
+    relations are its BillRelations. stream is False when the stage was
+    decided by a vote or by committee corrections, in which case
+    update_stage does not regenerate the activity stream.
+    """
+    if not stage_date or force_update:  # might be empty if bill is new
+        stage_date = FIRST_KNESSET_START
+    if approval_vote:
+        if approval_vote.for_votes_count > approval_vote.against_votes_count:
+            stage = BillStages.APPROVED
+        else:
+            stage = BillStages.FAILED_APPROVAL
+        return stage, approval_vote.time.date(), False
+    for cm in relations.second_committee_meetings:
+        if not stage_date or stage_date < cm.date:
+            stage = BillStages.COMMITTEE_CORRECTIONS
+            stage_date = cm.date
+    if stage == BillStages.COMMITTEE_CORRECTIONS:
+        return stage, stage_date, False
+    if first_vote:
+        if first_vote.for_votes_count > first_vote.against_votes_count:
+            stage = BillStages.FIRST_VOTE
+        else:
+            stage = BillStages.FAILED_FIRST_VOTE
+        return stage, first_vote.time.date(), False
+    for proposal in (relations.knesset_proposal, relations.gov_proposal):
+        if proposal is not None and (not stage_date or stage_date < proposal.date):
+            stage = BillStages.IN_COMMITTEE
+            stage_date = proposal.date
+    for cm in relations.first_committee_meetings:
+        if not stage_date or stage_date < cm.date:
+            # if it was converted to discussion, seeing it in
+            # a cm doesn't mean much.
+            if stage != BillStages.CONVERTED_TO_DISCUSSION:
+                stage = BillStages.IN_COMMITTEE
+                stage_date = cm.date
+    for v in relations.pre_votes:
+        if not stage_date or stage_date < v.time.date():
+            for h in CONVERT_TO_DISCUSSION_HEADERS:
+                if v.title.find(h) >= 0:
+                    stage = BillStages.CONVERTED_TO_DISCUSSION
+                    stage_date = v.time.date()
+    for v in relations.pre_votes:
+        if not stage_date or stage_date < v.time.date():
+            if v.for_votes_count > v.against_votes_count:
+                stage = BillStages.PRE_APPROVED
+            else:
+                stage = BillStages.FAILED_PRE_APPROVAL
+            stage_date = v.time.date()
+    for pp in relations.proposals:
+        if not stage_date or stage_date < pp.date:
+            stage = BillStages.PROPOSED
+            stage_date = pp.date
+    return stage, stage_date, True
+
+
+def _is_converted_to_discussion(vote):
+    return any(vote.title.find(h) >= 0 for h in CONVERT_TO_DISCUSSION_HEADERS)
+
+
+def stream_actions(approval_vote, first_vote, relations):
+    """The (unsaved) activity stream Actions of a bill, as (verb, target model,
+    target id, timestamp, description) tuples"""
+    actions = []
+    for p in relations.proposals:
+        actions.append(('was-proposed', PrivateProposal, p.id, p.date, p.title))
+    if relations.gov_proposal is not None:
+        p = relations.gov_proposal
+        actions.append(('was-proposed', GovProposal, p.id, p.date, p.title))
+    if relations.knesset_proposal is not None:
+        p = relations.knesset_proposal
+        actions.append(('was-knesset-proposed', KnessetProposal, p.id, p.date, p.title))
+    for v in relations.pre_votes:
+        if _is_converted_to_discussion(v):
+            actions.append(('was-converted-to-discussion', Vote, v.id, v.time, None))
+        else:
+            actions.append(('was-pre-voted', Vote, v.id, v.time, v.passed))
+    if first_vote:
+        actions.append(('was-first-voted', Vote, first_vote.id, first_vote.time, first_vote.passed))
+    if approval_vote:
+        actions.append(('was-approval-voted', Vote, approval_vote.id, approval_vote.time, approval_vote.passed))
+    for cm in relations.first_committee_meetings:
+        actions.append(('was-discussed-1', CommitteeMeeting, cm.id, cm.date, cm.committee_name))
+    for cm in relations.second_committee_meetings:
+        actions.append(('was-discussed-2', CommitteeMeeting, cm.id, cm.date, cm.committee_name))
+    for g in relations.gov_decisions:
+        actions.append(('was-voted-on-gov', GovLegislationCommitteeDecision, g.id, g.date, str(g.stand)))
+    return actions
+
+
+def _action_key(verb, content_type_id, target_id, description):
+    return verb, content_type_id, unicode(target_id), unicode(description) if description is not None else None
+
+
+def changed_activity_streams(bills, relations):
+    """The ids of the bills in bills, a dict of bill id -> (approval vote,
+    first vote), whose stored activity stream differs from stream_actions.
+    relations is a dict of bill id -> BillRelations."""
+    if not bills:
+        return []
+    bill_ct = ContentType.objects.get_for_model(Bill)
+    stored = defaultdict(set)
+    for bill_id, verb, content_type_id, target_id, description in Action.objects.filter(
+            actor_content_type=bill_ct, actor_object_id__in=[unicode(bill_id) for bill_id in bills]).values_list(
+            'actor_object_id', 'verb', 'target_content_type', 'target_object_id', 'description'):
+        stored[int(bill_id)].add(_action_key(verb, content_type_id, target_id, description))
+    changed = []
+    for bill_id, (approval_vote, first_vote) in bills.iteritems():
+        expected = set(_action_key(verb, ContentType.objects.get_for_model(model).id, target_id, description)
+                       for verb, model, target_id, timestamp, description in stream_actions(
+                           approval_vote, first_vote, relations[bill_id]))
+        if expected != stored[bill_id]:
+            changed.append(bill_id)
+    return changed
+
+
+def regenerate_activity_streams(bills, relations):
+    """Replace the activity streams of bills, a dict of bill id ->
+    (approval vote, first vote), with one delete and one bulk insert.
+    relations is a dict of bill id -> BillRelations."""
+    if not bills:
+        return
+    bill_ct = ContentType.objects.get_for_model(Bill)
+    content_types = {}
+    new_actions = []
+    for bill_id, (approval_vote, first_vote) in bills.iteritems():
+        for verb, model, target_id, timestamp, description in stream_actions(
+                approval_vote, first_vote, relations[bill_id]):
+            if model not in content_types:
+                content_types[model] = ContentType.objects.get_for_model(model)
+            new_actions.append(Action(
+                actor_content_type=bill_ct, actor_object_id=bill_id, verb=verb,
+                target_content_type=content_types[model], target_object_id=target_id,
+                timestamp=timestamp or datetime.now(),
+                description=unicode(description) if description is not None else None))
+    with transaction.atomic():
+        Action.objects.filter(actor_content_type=bill_ct, actor_object_id__in=list(bills)).delete()
+        Action.objects.bulk_create(new_actions, batch_size=CHUNK_SIZE)
+
+
+def _update_chunk(bill_ids, force_update, dry_run):
+    """The StageChanges of the bills with bill_ids, and the ids of the bills
+    whose activity stream was regenerated"""
+    rows = list(Bill.objects.filter(id__in=bill_ids).values(
+        'id', 'stage', 'stage_date', 'approval_vote', 'first_vote'))
+    vote_ids = set(row[f] for row in rows for f in ('approval_vote', 'first_vote') if row[f])
+    votes = dict((vote['id'], VoteData(*[vote[f] for f in VOTE_FIELDS]))
+                 for vote in Vote.objects.filter(id__in=vote_ids).values(*VOTE_FIELDS))
+    relations = fetch_relations(bill_ids)
+
+    changes = []
+    streams = {}
+    for row in rows:
+        approval_vote, first_vote = votes.get(row['approval_vote']), votes.get(row['first_vote'])
+        stage, stage_date, stream = resolve_stage(row['stage'], row['stage_date'], approval_vote, first_vote,
+                                                  relations[row['id']], force_update)
+        if stream:
+            streams[row['id']] = (approval_vote, first_vote)
+        if (stage, stage_date) != (row['stage'], row['stage_date']):
+            changes.append(StageChange(row['id'], row['stage'], row['stage_date'], stage, stage_date, stream))
+    if dry_run:
+        return changes, []
+    # the stream changes with the bill's meetings and votes, even if its stage doesn't
+    streams = dict((bill_id, streams[bill_id]) for bill_id in changed_activity_streams(streams, relations))
+    if not changes and not streams:
+        return changes, []
+
+    by_stage = defaultdict(list)
+    for change in changes:
+        by_stage[(change.stage, change.stage_date)].append(change.bill_id)
+    with transaction.atomic():
+        for (stage, stage_date), ids in by_stage.iteritems():
+            Bill.objects.filter(id__in=ids).update(stage=stage, stage_date=stage_date)
+        regenerate_activity_streams(streams, relations)
+    return changes, streams.keys()
+
+
+def update_stages(bills=None, force_update=False, dry_run=False):
+    """
+    Update the stages of bills (a Bill queryset, all bills by default) like
+    Bill.update_stage, in chunks of CHUNK_SIZE bills. Only bills whose stage
+    or activity stream changed are written; they are written with queryset
+    updates, so Bill save signals are not sent. Instead the bills are
+    reindexed for search, the bill autocomplete is invalidated, the bills'
+    tags are added to their related objects and the bill statistics of their
+    proposers are recalculated (once per member).
+    Returns the list of StageChanges.
+    """
+    if bills is None:
+        bills = Bill.objects.all()
+    bill_ids = list(bills.order_by('id').values_list('id', flat=True))
+    changes = []
+    stream_ids = []
+    for i in range(0, len(bill_ids), CHUNK_SIZE):
+        chunk_changes, chunk_stream_ids = _update_chunk(bill_ids[i:i + CHUNK_SIZE], force_update, dry_run)
+        changes.extend(chunk_changes)
+        stream_ids.extend(chunk_stream_ids)
+    logger.info('%d of %d bills changed stage, %d activity streams changed' % (
+        len(changes), len(bill_ids), len(stream_ids)))
+    if dry_run:
+        return changes
+
+    changed_ids = [change.bill_id for change in changes]
+    updated_ids = sorted(set(changed_ids).union(stream_ids))
+    for i in range(0, len(updated_ids), CHUNK_SIZE):
+        updated_bills = list(Bill.objects.filter(id__in=updated_ids[i:i + CHUNK_SIZE]))
+        index_objects('bill', updated_bills)
+        for bill in updated_bills:
+            add_tags_to_bill_related_objects(Bill, bill)
+    if updated_ids:
+        bill_autocomplete.invalidate()
+    if changed_ids:
+        for member in Member.objects.filter(bills__in=changed_ids).distinct():
+            member.recalc_bill_statistics()
+        PartyStatistics.objects.mark_stale(party__members__bills__in=changed_ids)
+    return changes
@@ -0,0 +1,73 @@
+# encoding: utf-8
+"""
+Finding and merging duplicate laws and bills.
+
+Laws and bills keep the cannonized_key of their title in the indexed
+title_key column, so duplicates are found with a GROUP BY on it instead of
+comparing the cannonized titles of every pair.
+"""
+import logging
+from collections import namedtuple, defaultdict
+
+from django.db.models import Count
+
+from laws.models import Law, Bill
+
+logger = logging.getLogger("open-knesset.laws.dedup")
+
+# duplicates are to be merged into target
+Merge = namedtuple('Merge', ['target', 'duplicates'])
+
+
+def find_duplicate_laws():
+    """Groups of unmerged laws with the same cannonized title. The law with
+    the most bills (the latest one on a tie) is the merge target."""
+    laws = Law.objects.filter(merged_into=None).exclude(title_key='')
+    keys = [group['title_key'] for group in laws.values('title_key').annotate(
+        count=Count('id')).filter(count__gt=1).order_by()]
+    if not keys:
+        return []
+
+    groups = defaultdict(list)
+    for law in laws.filter(title_key__in=keys).annotate(bills_count=Count('bills')):
+        groups[law.title_key].append(law)
+    merges = []
+    for key in keys:
+        group = sorted(groups[key], key=lambda law: (law.bills_count, law.id), reverse=True)
+        merges.append(Merge(group[0], group[1:]))
+    return merges
+
+
+def find_duplicate_bills():
+    """Groups of bills of the same law with the same cannonized title. The
+    first bill in the default bill ordering is the merge target."""
+    bills = Bill.objects.filter(law__isnull=False).exclude(title_key='')
+    keys = set((group['law'], group['title_key']) for group in bills.values('law', 'title_key').annotate(
+        count=Count('id')).filter(count__gt=1).order_by())
+    if not keys:
+        return []
+
+    groups = defaultdict(list)
+    for bill in bills.filter(law__in=set(law_id for law_id, title_key in keys)).select_related('law'):
+        if (bill.law_id, bill.title_key) in keys:
+            groups[(bill.law_id, bill.title_key)].append(bill)
+    return [Merge(group[0], group[1:]) for group in groups.values()]
+
+
+def apply_merges(merges):
+    for merge in merges:
+        for duplicate in merge.duplicates:
+            merge.target.merge(duplicate)
+
+
+def merge_duplicates():
+    """Merge duplicate laws, then the duplicate bills of every law.
+    Returns the applied law merges and bill merges."""
+    law_merges = find_duplicate_laws()
+    apply_merges(law_merges)
+    # merging laws moves their bills, so bills are looked for afterwards
+    bill_merges = find_duplicate_bills()
+    apply_merges(bill_merges)
+    logger.info('merged %d duplicate laws and %d duplicate bills' % (
+        sum(len(merge.duplicates) for merge in law_merges), sum(len(merge.duplicates) for merge in bill_merges)))
+    return law_merges, bill_merges
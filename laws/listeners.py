@@ -1,51 +1,56 @@
 # encoding: utf-8
-from django.db.models.signals import m2m_changed, post_save
+from django.db.models.signals import m2m_changed, post_save, post_delete
 from django.contrib.contenttypes.models import ContentType
-from actstream import action
-from actstream.models import Action
 from tagging.models import TaggedItem
 
-from knesset.utils import cannonize, disable_for_loaddata
+from knesset.activity import record_actions, pending_action, write_actions
+from knesset.utils import cannonize, disable_for_loaddata, defer, deferred_when_suppressed
 from laws.models.bill import Bill
 from laws.models.candidate_list_model_statistics import CandidateListVotingStatistics
 from laws.models.member_voting_statistics import MemberVotingStatistics
+from laws.models.party_statistics import PartyStatistics
 from laws.models.party_voting_statistics import PartyVotingStatistics
 from laws.models.proposal import PrivateProposal
+from laws.models.vote import Vote
 from laws.models.vote_action import VoteAction
 from mks.models import Member, Party
 
 from polyorg.models import CandidateList
 from ok_tag.models import add_tags_to_related_objects
+from laws.autocomplete import bill_autocomplete, vote_autocomplete, knesset_proposal_autocomplete
 
 def record_bill_proposal(**kwargs):
     if kwargs['action'] != "post_add":
         return
-    private_proposal_ct = ContentType.objects.get(app_label="laws", model="privateproposal")
-    member_ct = ContentType.objects.get(app_label="mks", model="member")
     proposal = kwargs['instance']
     if str(kwargs['sender']).find('proposers') >= 0:
         verb = 'proposed'
     else:
         verb = 'joined'
-    for mk_id in kwargs['pk_set']:
-        if Action.objects.filter(actor_object_id=mk_id, actor_content_type=member_ct, verb=verb,
-                                 target_object_id=proposal.id,
-                                 target_content_type=private_proposal_ct).count() == 0:
-            mk = Member.objects.get(pk=mk_id)
-            action.send(mk, verb=verb, target=proposal, timestamp=proposal.date)
+    record_actions([pending_action(Member, mk_id, verb, PrivateProposal, proposal.id, timestamp=proposal.date)
+                    for mk_id in kwargs['pk_set']])
 
 
 m2m_changed.connect(record_bill_proposal, sender=PrivateProposal.proposers.through)
 m2m_changed.connect(record_bill_proposal, sender=PrivateProposal.joiners.through)  # same code handles both events
 
 
-@disable_for_loaddata
+def _vote_action_activity(vote_action):
+    return pending_action(Member, vote_action.member_id, 'voted', Vote, vote_action.vote_id,
+                          description=unicode(vote_action.get_type_display()),
+                          timestamp=vote_action.vote.time)
+
+
+def defer_record_vote_action(sender, created, instance, **kwargs):
+    # inside suppress_signals, so the action is written when it ends
+    if created:
+        record_actions([_vote_action_activity(instance)])
+
+
+@deferred_when_suppressed(defer_record_vote_action)
 def record_vote_action(sender, created, instance, **kwargs):
     if created:
-        action.send(instance.member, verb='voted',
-                    description=instance.get_type_display(),
-                    target=instance.vote,
-                    timestamp=instance.vote.time)
+        write_actions([_vote_action_activity(instance)])
 
 
 post_save.connect(record_vote_action, sender=VoteAction,
@@ -70,6 +75,75 @@ def handle_party_save(sender, created, instance, **kwargs):
 post_save.connect(handle_party_save, sender=Party)
 
 
+@disable_for_loaddata
+def handle_party_statistics_party_save(sender, created, instance, **kwargs):
+    if instance._state.db != 'default' or not instance.knesset_id:
+        return
+    if created:
+        PartyStatistics.objects.get_or_create(party=instance, knesset_id=instance.knesset_id,
+                                              defaults={'is_stale': True})
+    else:
+        PartyStatistics.objects.mark_stale(party=instance)
+
+
+post_save.connect(handle_party_statistics_party_save, sender=Party,
+                  dispatch_uid='party_statistics_party_save')
+
+
+def mark_members_party_statistics_stale(member_ids):
+    PartyStatistics.objects.mark_stale(party__members__in=member_ids)
+
+
+def defer_party_statistics_vote_action_change(sender, instance, **kwargs):
+    defer(mark_members_party_statistics_stale, instance.member_id)
+
+
+@deferred_when_suppressed(defer_party_statistics_vote_action_change)
+def handle_party_statistics_vote_action_change(sender, instance, **kwargs):
+    PartyStatistics.objects.mark_stale(party__members=instance.member_id)
+
+
+post_save.connect(handle_party_statistics_vote_action_change, sender=VoteAction,
+                  dispatch_uid='party_statistics_vote_action_save')
+post_delete.connect(handle_party_statistics_vote_action_change, sender=VoteAction,
+                    dispatch_uid='party_statistics_vote_action_delete')
+
+
+@disable_for_loaddata
+def handle_party_statistics_member_save(sender, instance, **kwargs):
+    # WeeklyPresence.save recalculates and saves its member, so this also
+    # covers presence changes
+    if instance.current_party_id:
+        PartyStatistics.objects.mark_stale(party=instance.current_party_id)
+
+
+post_save.connect(handle_party_statistics_member_save, sender=Member,
+                  dispatch_uid='party_statistics_member_save')
+
+
+@disable_for_loaddata
+def handle_party_statistics_bill_save(sender, instance, **kwargs):
+    PartyStatistics.objects.mark_stale(party__members__bills=instance)
+
+
+post_save.connect(handle_party_statistics_bill_save, sender=Bill,
+                  dispatch_uid='party_statistics_bill_save')
+
+
+def handle_party_statistics_bill_proposers_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # proposers were changed from the member side, instance is the member
+        PartyStatistics.objects.mark_stale(party__members=instance)
+    elif pk_set:
+        PartyStatistics.objects.mark_stale(party__members__in=pk_set)
+
+
+m2m_changed.connect(handle_party_statistics_bill_proposers_change, sender=Bill.proposers.through,
+                    dispatch_uid='party_statistics_bill_proposers')
+
+
 @disable_for_loaddata
 def handle_mk_save(sender, created, instance, **kwargs):
     if created and instance._state.db == 'default':
@@ -0,0 +1,34 @@
+# encoding: utf-8
+from __future__ import print_function
+
+from django.core.management.base import BaseCommand
+from optparse import make_option
+
+from laws.dedup import find_duplicate_laws, find_duplicate_bills, merge_duplicates
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Merge laws with the same cannonized title, and identical bills of each law"
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '-n', action='store_true', dest="dryrun", default=False,
+            help='Dry run, changes nothing in the db, just lists the merges that would be made'
+        ),
+    )
+
+    def handle(self, *args, **options):
+        if not options['dryrun']:
+            merge_duplicates()
+            return
+
+        for merge in find_duplicate_laws():
+            print(u'law {0} "{1}" <- {2}'.format(merge.target.id, merge.target.title, u', '.join(
+                unicode(law.id) for law in merge.duplicates)))
+        # bills of merged laws are only compared once the laws are merged
+        for merge in find_duplicate_bills():
+            print(u'bill {0} "{1}" <- {2}'.format(merge.target.id, merge.target.title, u', '.join(
+                unicode(bill.id) for bill in merge.duplicates)))
@@ -1,10 +1,12 @@
 # encoding: utf-8
 from __future__ import print_function
 
-from django.core.management.base import BaseCommand
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
 from optparse import make_option
 
 from laws.models import Vote
+from laws.vote_properties import update_votes_properties, DEFAULT_CHUNK_SIZE
 from mks.models import Knesset
 import logging
 
@@ -17,21 +19,60 @@ class Command(BaseCommand):
     option_list = BaseCommand.option_list + (
         make_option(
             '-n', action='store_true', dest="dryrun", default=False,
-            help='Dry run, changes nothing in the db, just display results'
+            help='Dry run, changes nothing in the db, just display the changes that would be made'
+        ),
+        make_option(
+            '--all', action='store_true', dest='all', default=False,
+            help='Recalculate all votes, not only those of the current knesset'
+        ),
+        make_option(
+            '--since', dest='since', default=None,
+            help='Recalculate votes since the given date (YYYY-MM-DD) instead of the current knesset start'
+        ),
+        make_option(
+            '--chunk-size', dest='chunk_size', type='int', default=DEFAULT_CHUNK_SIZE,
+            help='Number of votes to process at once (default: %d)' % DEFAULT_CHUNK_SIZE
+        ),
+        make_option(
+            '--workers', dest='workers', type='int', default=1,
+            help='Number of worker processes to split the votes between'
         ),
     )
 
     def handle(self, *args, **options):
+        if options['all']:
+            votes_to_update = Vote.objects.all()
+            start_date = None
+        else:
+            if options['since']:
+                try:
+                    start_date = datetime.strptime(options['since'], '%Y-%m-%d').date()
+                except ValueError:
+                    raise CommandError('--since should be in the format YYYY-MM-DD')
+            else:
+                start_date = Knesset.objects.current_knesset().start_date
+            votes_to_update = Vote.objects.filter(time__gte=start_date)
+
+        logger.info('Found {0} votes to update since {1}'.format(votes_to_update.count(), start_date or 'ever'))
 
-        start_date = Knesset.objects.current_knesset().start_date
+        def progress(done, total):
+            logger.info('Processed {0}/{1} votes'.format(done, total))
+
+        result = update_votes_properties(votes_to_update, chunk_size=options['chunk_size'],
+                                         workers=options['workers'], dry_run=options['dryrun'],
+                                         progress=progress)
 
-        votes_to_update = Vote.objects.filter(time__gte=start_date)
-        logger.info('Found {0} votes to update since {1}'.format(votes_to_update.count(), start_date))
         if options['dryrun']:
             logger.info("Not updating the db, dry run was specified")
-            return
-
-        for vote in votes_to_update:
+            for vote_properties in result.changes:
+                print(u'vote {0}: {1}'.format(vote_properties.vote_id, u', '.join(
+                    u'{0} {1} -> {2}'.format(field, old, new)
+                    for field, (old, new) in sorted(vote_properties.changed_fields.items()))))
+                if vote_properties.changed_actions:
+                    print(u'    {0} vote actions with changed flags'.format(len(vote_properties.changed_actions)))
 
-            vote.update_vote_properties()
-            logger.info(u'Recalculated vote properties for {0}'.format(vote))
+        for error in result.errors:
+            logger.error(error)
+        logger.info(u'Recalculated {0} votes: {1} votes and {2} vote actions {3}changed, {4} errors'.format(
+            result.votes, result.changed_votes, result.changed_actions, 'would be ' if options['dryrun'] else '',
+            len(result.errors)))
@@ -0,0 +1,39 @@
+# encoding: utf-8
+from django.core.management.base import BaseCommand, CommandError
+from optparse import make_option
+
+from laws.models import PartyStatistics
+from mks.models import Knesset
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Recompute the precomputed party statistics shown in the party stat pages"
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--knesset', dest='knesset', type='int', default=None,
+            help='Number of the knesset to refresh (default: the current knesset)'
+        ),
+        make_option(
+            '--stale', action='store_true', dest='stale', default=False,
+            help='Only refresh statistics that were marked as stale'
+        ),
+    )
+
+    def handle(self, *args, **options):
+        if options['knesset']:
+            try:
+                knesset = Knesset.objects.get(number=options['knesset'])
+            except Knesset.DoesNotExist:
+                raise CommandError('Knesset %d does not exist' % options['knesset'])
+        else:
+            knesset = Knesset.objects.current_knesset()
+
+        if options['stale']:
+            count = PartyStatistics.objects.refresh_stale(knesset)
+        else:
+            count = PartyStatistics.objects.refresh(knesset)
+        logger.info('Refreshed statistics of %d parties in knesset %d' % (count, knesset.number))
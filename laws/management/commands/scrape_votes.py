@@ -4,6 +4,7 @@ from logging import getLogger
 from django.db import transaction
 from knesset_data.dataservice.votes import Vote as DataserviceVote
 from knesset_data.html_scrapers.votes import HtmlVote
+from knesset.utils import suppress_signals
 from laws.models import Vote, VoteAction
 from simple.constants import KNESSET_VOTE_PAGE
 from simple.scrapers import hebrew_strftime
@@ -60,6 +61,11 @@ class Command(BaseKnessetDataserviceCollectionCommand):
         return oknesset_vote
 
     def _add_vote_actions(self, dataservice_vote, oknesset_vote):
+        # the vote actions listeners run once for all the members votes
+        with suppress_signals():
+            self._create_vote_actions(dataservice_vote, oknesset_vote)
+
+    def _create_vote_actions(self, dataservice_vote, oknesset_vote):
         for member_id, vote_result_code in HtmlVote.get_from_vote_id(dataservice_vote.id).member_votes:
             member_qs = Member.objects.filter(pk=member_id)
             if member_qs.exists():
@@ -0,0 +1,40 @@
+# encoding: utf-8
+from django.core.management.base import BaseCommand
+from optparse import make_option
+
+from laws.bill_stages import update_stages
+from laws.models import Bill
+from mks.models import Knesset
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Recompute the stages (and activity streams) of bills in batches"
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--all', action='store_true', dest='all', default=False,
+            help='Update all bills (default: bills proposed in the current knesset)'
+        ),
+        make_option(
+            '--force', action='store_true', dest='force', default=False,
+            help='Assume the current stages are wrong and recalculate them from scratch'
+        ),
+        make_option(
+            '-n', action='store_true', dest='dryrun', default=False,
+            help='Dry run, changes nothing in the db, just display results'
+        ),
+    )
+
+    def handle(self, *args, **options):
+        bills = Bill.objects.all()
+        if not options['all']:
+            start_date = Knesset.objects.current_knesset().start_date
+            bills = bills.filter(proposals__date__gte=start_date).distinct()
+
+        changes = update_stages(bills, force_update=options['force'], dry_run=options['dryrun'])
+        for change in changes:
+            logger.info('bill %d: stage %s (%s) -> %s (%s)' % (
+                change.bill_id, change.old_stage, change.old_stage_date, change.stage, change.stage_date))
@@ -5,7 +5,7 @@ from datetime import date
 
 import voting
 import waffle
-from actstream import Follow, Action, action
+from actstream import Follow
 from django.conf import settings
 from django.contrib.comments.models import Comment
 from django.contrib.contenttypes.models import ContentType
@@ -16,8 +16,7 @@ from django.utils.translation import ugettext_lazy as _
 from tagging.models import TaggedItem, Tag
 from tagging.utils import get_tag
 
-from knesset.utils import slugify_name
-from laws.constants import FIRST_KNESSET_START, CONVERT_TO_DISCUSSION_HEADERS
+from knesset.utils import slugify_name, cannonized_key
 from laws.enums import BillStages
 from laws.models.proposal import PrivateProposal, KnessetProposal, GovProposal
 from laws.vote_choices import BILL_AGRR_STAGES, BILL_STAGE_CHOICES, BILL_STAGES
@@ -139,6 +138,8 @@ class Bill(models.Model):
     stage = models.CharField(max_length=10, choices=BILL_STAGE_CHOICES)
     #: date of entry to current stage
     stage_date = models.DateField(blank=True, null=True, db_index=True)
+    #: cannonized_key of the title, to find duplicate bills of a law
+    title_key = models.CharField(max_length=40, blank=True, db_index=True, editable=False)
     pre_votes = models.ManyToManyField('laws.Vote', related_name='bills_pre_votes', blank=True,
                                        null=True)  # link to pre-votes related to this bill
     first_committee_meetings = models.ManyToManyField('committees.CommitteeMeeting', related_name='bills_first',
@@ -174,6 +175,7 @@ class Bill(models.Model):
     def save(self, **kwargs):
         self.slug = slugify_name(self.title)
         self.popular_name_slug = slugify_name(self.popular_name)
+        self.title_key = cannonized_key(self.title)
         if self.law:
             self.full_title = "%s %s" % (self.law.title, self.title)
         else:
@@ -323,124 +325,21 @@ class Bill(models.Model):
         recalculation. default is False, so we assume current status is OK,
         and only look for updates.
         """
-        if not self.stage_date or force_update:  # might be empty if bill is new
-            self.stage_date = FIRST_KNESSET_START
-        if self.approval_vote:
-            if self.approval_vote.for_votes_count > self.approval_vote.against_votes_count:
-                self.stage = BillStages.APPROVED
-            else:
-                self.stage = BillStages.FAILED_APPROVAL
-            self.stage_date = self.approval_vote.time.date()
-            self.save()
-            return
-        for cm in self.second_committee_meetings.all():
-            if not self.stage_date or self.stage_date < cm.date:
-                self.stage = BillStages.COMMITTEE_CORRECTIONS
-                self.stage_date = cm.date
-        if self.stage == BillStages.COMMITTEE_CORRECTIONS:
-            self.save()
-            return
-        if self.first_vote:
-            if self.first_vote.for_votes_count > self.first_vote.against_votes_count:
-                self.stage = BillStages.FIRST_VOTE
-            else:
-                self.stage = BillStages.FAILED_FIRST_VOTE
-            self.stage_date = self.first_vote.time.date()
-            self.save()
-            return
-        try:
-            kp = self.knesset_proposal
-            if not (self.stage_date) or self.stage_date < kp.date:
-                self.stage = BillStages.IN_COMMITTEE
-                self.stage_date = kp.date
-        except KnessetProposal.DoesNotExist:
-            pass
-        try:
-            gp = self.gov_proposal
-            if not (self.stage_date) or self.stage_date < gp.date:
-                self.stage = BillStages.IN_COMMITTEE
-                self.stage_date = gp.date
-        except GovProposal.DoesNotExist:
-            pass
-        for cm in self.first_committee_meetings.all():
-            if not (self.stage_date) or self.stage_date < cm.date:
-                # if it was converted to discussion, seeing it in
-                # a cm doesn't mean much.
-                if self.stage != BillStages.CONVERTED_TO_DISCUSSION:
-                    self.stage = BillStages.IN_COMMITTEE
-                    self.stage_date = cm.date
-        for v in self.pre_votes.all():
-            if not (self.stage_date) or self.stage_date < v.time.date():
-                for h in CONVERT_TO_DISCUSSION_HEADERS:
-                    if v.title.find(h) >= 0:
-                        self.stage = BillStages.CONVERTED_TO_DISCUSSION  # converted to discussion
-                        self.stage_date = v.time.date()
-        for v in self.pre_votes.all():
-            if not (self.stage_date) or self.stage_date < v.time.date():
-                if v.for_votes_count > v.against_votes_count:
-                    self.stage = BillStages.PRE_APPROVED
-                else:
-                    self.stage = BillStages.FAILED_PRE_APPROVAL
-                self.stage_date = v.time.date()
-        for pp in self.proposals.all():
-            if not (self.stage_date) or self.stage_date < pp.date:
-                self.stage = BillStages.PROPOSED
-                self.stage_date = pp.date
+        from laws.bill_stages import fetch_relations, resolve_stage
+        relations = fetch_relations([self.id])[self.id]
+        self.stage, self.stage_date, stream = resolve_stage(self.stage, self.stage_date, self.approval_vote,
+                                                            self.first_vote, relations, force_update)
         self.save()
-        self.generate_activity_stream()
-
-    def generate_activity_stream(self):
-        ''' create an activity stream based on the data stored in self '''
-
-        Action.objects.stream_for_actor(self).delete()
-        ps = list(self.proposals.all())
-        try:
-            ps.append(self.gov_proposal)
-        except GovProposal.DoesNotExist:
-            pass
-
-        for p in ps:
-            action.send(self, verb='was-proposed', target=p,
-                        timestamp=p.date, description=p.title)
-
-        try:
-            p = self.knesset_proposal
-            action.send(self, verb='was-knesset-proposed', target=p,
-                        timestamp=p.date, description=p.title)
-        except KnessetProposal.DoesNotExist:
-            pass
-
-        for v in self.pre_votes.all():
-            discussion = False
-            for h in CONVERT_TO_DISCUSSION_HEADERS:
-                if v.title.find(h) >= 0:  # converted to discussion
-                    discussion = True
-            if discussion:
-                action.send(self, verb='was-converted-to-discussion', target=v,
-                            timestamp=v.time)
-            else:
-                action.send(self, verb='was-pre-voted', target=v,
-                            timestamp=v.time, description=v.passed)
-
-        if self.first_vote:
-            action.send(self, verb='was-first-voted', target=self.first_vote,
-                        timestamp=self.first_vote.time, description=self.first_vote.passed)
-
-        if self.approval_vote:
-            action.send(self, verb='was-approval-voted', target=self.approval_vote,
-                        timestamp=self.approval_vote.time, description=self.approval_vote.passed)
-
-        for cm in self.first_committee_meetings.all():
-            action.send(self, verb='was-discussed-1', target=cm,
-                        timestamp=cm.date, description=cm.committee.name)
-
-        for cm in self.second_committee_meetings.all():
-            action.send(self, verb='was-discussed-2', target=cm,
-                        timestamp=cm.date, description=cm.committee.name)
-
-        for g in self.gov_decisions.all():
-            action.send(self, verb='was-voted-on-gov', target=g,
-                        timestamp=g.date, description=str(g.stand))
+        if stream:
+            self.generate_activity_stream(relations)
+
+    def generate_activity_stream(self, relations=None):
+        ''' create an activity stream based on the data stored in self.
+        relations are the bill's BillRelations, fetched if not given '''
+        from laws.bill_stages import fetch_relations, regenerate_activity_streams
+        if relations is None:
+            relations = fetch_relations([self.id])[self.id]
+        regenerate_activity_streams({self.id: (self.approval_vote, self.first_vote)}, {self.id: relations})
 
     @property
     def frozen(self):
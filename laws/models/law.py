@@ -1,5 +1,7 @@
 # encoding: utf-8
 from django.db import models
+
+from knesset.utils import cannonized_key
 import logging
 logger = logging.getLogger(__name__)
 
@@ -10,10 +12,16 @@ class Law(models.Model):
 
     title = models.CharField(max_length=1000)
     merged_into = models.ForeignKey('Law', related_name='duplicates', blank=True, null=True)
+    #: cannonized_key of the title, to find duplicate laws
+    title_key = models.CharField(max_length=40, blank=True, db_index=True, editable=False)
 
     def __unicode__(self):
         return self.title
 
+    def save(self, **kwargs):
+        self.title_key = cannonized_key(self.title)
+        super(Law, self).save(**kwargs)
+
     def merge(self, another_law):
         """
         Merges another_law into this one.
@@ -0,0 +1,194 @@
+# encoding: utf-8
+from collections import defaultdict
+from datetime import datetime
+
+from django.db import models, transaction
+from django.db.models import Count
+
+from laws.models.bill import Bill
+from laws.models.vote_action import VoteAction
+from laws.vote_choices import BILL_AGRR_STAGES
+from mks.models import Knesset, Party, Member
+import logging
+
+logger = logging.getLogger("open-knesset.laws.models")
+
+# PartyListView stat page -> PartyStatistics field
+STAT_FIELDS = {
+    'votes-per-seat': 'votes_per_seat',
+    'discipline': 'discipline',
+    'coalition-discipline': 'coalition_discipline',
+    'residence-centrality': 'residence_centrality',
+    'residence-economy': 'residence_economy',
+    'bills-proposed': 'bills_proposed',
+    'bills-pre': 'bills_pre',
+    'bills-first': 'bills_first',
+    'bills-approved': 'bills_approved',
+    'presence': 'presence',
+    'committees': 'committees',
+}
+
+
+def _average(values):
+    values = [v for v in values if v]
+    if values:
+        return round(float(sum(values)) / len(values), 1)
+    return 0
+
+
+def _per_seat(count, party):
+    if not party.number_of_seats:
+        return None
+    return round(float(count) / party.number_of_seats, 1)
+
+
+def _percent_kept(total_votes, votes_against):
+    if not total_votes:
+        return None
+    return round(100.0 * (total_votes - votes_against) / total_votes, 1)
+
+
+class PartyStatisticsManager(models.Manager):
+    def _compute(self, knesset, parties):
+        """The statistics of the given parties of knesset, as a dict of
+        party id -> dict of field values, computed with a handful of grouped
+        queries"""
+        party_ids = [party.id for party in parties]
+        time_filter = {'vote__time__gt': knesset.start_date}
+        date_filter = {'proposals__date__gt': knesset.start_date}
+        if knesset.end_date:
+            time_filter['vote__time__lte'] = knesset.end_date
+            date_filter['proposals__date__lte'] = knesset.end_date
+
+        votes = defaultdict(lambda: defaultdict(int))
+        for row in VoteAction.objects.filter(member__current_party__in=party_ids, **time_filter).values(
+                'member__current_party', 'type', 'against_party', 'against_coalition',
+                'against_opposition').annotate(count=Count('id')).order_by():
+            party_votes = votes[row['member__current_party']]
+            if row['type'] != 'no-vote':
+                party_votes['total'] += row['count']
+            for flag in ('against_party', 'against_coalition', 'against_opposition'):
+                if row[flag]:
+                    party_votes[flag] += row['count']
+
+        members = defaultdict(list)
+        for member in Member.objects.filter(current_party__in=party_ids).values(
+                'current_party', 'residence_centrality', 'residence_economy',
+                'average_weekly_presence_hours', 'average_monthly_committee_presence'):
+            members[member['current_party']].append(member)
+
+        bills = {}
+        for stage in ('proposed', 'pre', 'first', 'approved'):
+            bills[stage] = defaultdict(set)
+            for party_id, bill_id in Bill.objects.filter(
+                    BILL_AGRR_STAGES[stage], proposers__current_party__in=party_ids,
+                    **date_filter).values_list('proposers__current_party', 'id').distinct():
+                bills[stage][party_id].add(bill_id)
+
+        statistics = {}
+        for party in parties:
+            party_votes = votes[party.id]
+            party_members = members[party.id]
+            against_coalition = party_votes['against_coalition' if party.is_coalition else 'against_opposition']
+            statistics[party.id] = dict(
+                votes_per_seat=_per_seat(party_votes['total'], party),
+                discipline=_percent_kept(party_votes['total'], party_votes['against_party']),
+                coalition_discipline=_percent_kept(party_votes['total'], against_coalition),
+                residence_centrality=_average([m['residence_centrality'] for m in party_members]),
+                residence_economy=_average([m['residence_economy'] for m in party_members]),
+                bills_proposed=_per_seat(len(bills['proposed'][party.id]), party),
+                bills_pre=_per_seat(len(bills['pre'][party.id]), party),
+                bills_first=_per_seat(len(bills['first'][party.id]), party),
+                bills_approved=_per_seat(len(bills['approved'][party.id]), party),
+                presence=_average([m['average_weekly_presence_hours'] for m in party_members]),
+                committees=_average([m['average_monthly_committee_presence'] for m in party_members]),
+            )
+        return statistics
+
+    def refresh(self, knesset=None, party_ids=None):
+        """Recompute the statistics of the parties of knesset (the current
+        one by default), or only of party_ids, and clear their stale flag"""
+        knesset = knesset or Knesset.objects.current_knesset()
+        parties = Party.objects.filter(knesset=knesset)
+        if party_ids is not None:
+            parties = parties.filter(id__in=party_ids)
+        parties = list(parties)
+        statistics = self._compute(knesset, parties)
+
+        with transaction.atomic():
+            existing = set(self.filter(knesset=knesset, party__in=parties).values_list('party_id', flat=True))
+            for party_id, values in statistics.iteritems():
+                if party_id in existing:
+                    self.filter(knesset=knesset, party_id=party_id).update(
+                        is_stale=False, updated=datetime.now(), **values)
+            self.bulk_create([self.model(knesset=knesset, party_id=party_id, **values)
+                              for party_id, values in statistics.iteritems() if party_id not in existing])
+        logger.debug('refreshed statistics of %d parties of knesset %s' % (len(parties), knesset.number))
+        return len(parties)
+
+    def refresh_stale(self, knesset=None):
+        """Recompute the statistics marked as stale, of knesset or of all the
+        knessets, and compute the missing statistics of the parties of
+        knesset (the current one by default). Called by the importers and
+        refresh_party_statistics, so reads don't have to."""
+        stale = self.filter(is_stale=True)
+        if knesset is not None:
+            stale = stale.filter(knesset=knesset)
+        party_ids = defaultdict(list)
+        for knesset_id, party_id in stale.values_list('knesset', 'party'):
+            party_ids[knesset_id].append(party_id)
+        knesset = knesset or Knesset.objects.current_knesset()
+        if knesset is not None:
+            party_ids[knesset.pk].extend(Party.objects.filter(knesset=knesset).exclude(
+                statistics__knesset=knesset).values_list('id', flat=True))
+            if not party_ids[knesset.pk]:
+                del party_ids[knesset.pk]
+        count = 0
+        for knesset in Knesset.objects.filter(pk__in=party_ids.keys()):
+            count += self.refresh(knesset, party_ids=party_ids[knesset.pk])
+        return count
+
+    def for_knesset(self, knesset):
+        """The statistics of the parties of knesset, as a dict of party id ->
+        PartyStatistics. These are the last computed statistics, stale ones
+        are refreshed by refresh_stale, and parties without any are missing."""
+        return dict((statistics.party_id, statistics) for statistics in self.filter(knesset=knesset))
+
+    def mark_stale(self, **filters):
+        """Mark the statistics of the parties matching filters as stale, with
+        a single UPDATE"""
+        return self.filter(**filters).update(is_stale=True)
+
+
+class PartyStatistics(models.Model):
+    """Precomputed statistics of a party shown in the party stat pages.
+
+    Rows are marked as stale by the listeners when votes, presence, bills or
+    parties change, and refreshed by the importers that change them or by
+    the refresh_party_statistics command (see PartyStatisticsManager).
+    """
+
+    class Meta:
+        app_label = 'laws'
+        unique_together = ('party', 'knesset')
+
+    party = models.ForeignKey('mks.Party', related_name='statistics')
+    knesset = models.ForeignKey('mks.Knesset', related_name='party_statistics')
+    votes_per_seat = models.FloatField(null=True, blank=True)
+    discipline = models.FloatField(null=True, blank=True)
+    coalition_discipline = models.FloatField(null=True, blank=True)
+    residence_centrality = models.FloatField(null=True, blank=True)
+    residence_economy = models.FloatField(null=True, blank=True)
+    bills_proposed = models.FloatField(null=True, blank=True)
+    bills_pre = models.FloatField(null=True, blank=True)
+    bills_first = models.FloatField(null=True, blank=True)
+    bills_approved = models.FloatField(null=True, blank=True)
+    presence = models.FloatField(null=True, blank=True)
+    committees = models.FloatField(null=True, blank=True)
+    is_stale = models.BooleanField(default=False)
+    updated = models.DateTimeField(auto_now=True)
+
+    objects = PartyStatisticsManager()
+
+    def __unicode__(self):
+        return u"{} ({})".format(self.party.name, self.knesset_id)
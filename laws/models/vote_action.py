@@ -25,7 +25,6 @@ class VoteAction(models.Model):
 
     def save(self, **kwargs):
         if not self.party_id:
-            party = self.member.party_at(self.vote.time.date())
-            if party:
-                self.party_id = party.id
+            from mks.intervals import get_party_index
+            self.party_id = get_party_index().party_id_at(self.member_id, self.vote.time.date())
         super(VoteAction, self).save(**kwargs)
@@ -0,0 +1,48 @@
+# encoding: utf-8
+import json
+from datetime import datetime
+
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from laws.autocomplete import vote_autocomplete, bill_autocomplete
+from laws.models import Vote, Bill
+
+
+class AutocompleteTest(TestCase):
+    def setUp(self):
+        self.inside = Vote.objects.create(title=u'vote on the subbudget law', time=datetime(2015, 1, 3))
+        self.word = Vote.objects.create(title=u'a Budget law', time=datetime(2015, 1, 2))
+        self.start = Vote.objects.create(title=u'budget law', time=datetime(2015, 1, 1))
+        self.old_word = Vote.objects.create(title=u'the budget', time=datetime(2014, 1, 1))
+        Vote.objects.create(title=u'another law', time=datetime(2015, 1, 4))
+
+    def _ids(self, query, limit=30):
+        return [vote_id for vote_id, suggestion in vote_autocomplete.search(query, limit)]
+
+    def test_substring_match(self):
+        self.assertEqual(set(self._ids(u'udge')),
+                         set([self.inside.id, self.word.id, self.start.id, self.old_word.id]))
+        self.assertEqual(self._ids(u'nothing'), [])
+        self.assertEqual(len(self._ids(u'la')), 4)
+
+    def test_ranking(self):
+        # text start, then word start, then anywhere; recent first
+        self.assertEqual(self._ids(u'budget'), [self.start.id, self.word.id, self.old_word.id, self.inside.id])
+        self.assertEqual(self._ids(u'budget', 2), [self.start.id, self.word.id])
+
+    def test_refreshed_on_save(self):
+        self.assertEqual(self._ids(u'tax'), [])
+        vote = Vote.objects.create(title=u'tax law', time=datetime(2015, 2, 1))
+        self.assertEqual(self._ids(u'tax'), [vote.id])
+        vote.delete()
+        self.assertEqual(self._ids(u'tax'), [])
+
+    def test_views(self):
+        res = self.client.get(reverse('vote-auto-complete'), {'query': u'Budget L'})
+        result = json.loads(res.content)
+        self.assertEqual(result['data'], [self.start.id, self.word.id, self.inside.id])
+        self.assertEqual(result['suggestions'], [u'01/01/2015 - budget law', u'02/01/2015 - a Budget law',
+                                                 u'03/01/2015 - vote on the subbudget law'])
+        bill = Bill.objects.create(title=u'budget', full_title=u'the budget law', stage='1')
+        self.assertEqual(bill_autocomplete.search(u'budget', 30), [(bill.id, u'the budget law')])
@@ -0,0 +1,78 @@
+# encoding: utf-8
+from datetime import date, datetime
+
+from actstream import Action
+from django.test import TestCase
+
+from committees.models import Committee
+from laws.bill_stages import update_stages
+from laws.enums import BillStages
+from laws.models import Vote, Bill, PrivateProposal, KnessetProposal
+
+
+class TestUpdateStages(TestCase):
+    def setUp(self):
+        self.pre_vote = Vote.objects.create(title='pre vote', time=datetime(2011, 2, 1), for_votes_count=10,
+                                            against_votes_count=2)
+        self.approval_vote = Vote.objects.create(title='approval vote', time=datetime(2011, 6, 1),
+                                                 for_votes_count=1, against_votes_count=2)
+        self.proposed = Bill.objects.create(title='proposed', stage=BillStages.UNKNOWN)
+        PrivateProposal.objects.create(bill=self.proposed, title='p 1', date=date(2011, 1, 1))
+        self.pre_approved = Bill.objects.create(title='pre approved', stage=BillStages.PROPOSED,
+                                                stage_date=date(2011, 1, 1))
+        PrivateProposal.objects.create(bill=self.pre_approved, title='p 2', date=date(2011, 1, 1))
+        self.pre_approved.pre_votes.add(self.pre_vote)
+        self.in_committee = Bill.objects.create(title='in committee', stage=BillStages.UNKNOWN)
+        KnessetProposal.objects.create(bill=self.in_committee, title='kp', date=date(2011, 3, 1))
+        self.approved = Bill.objects.create(title='approved', stage=BillStages.UNKNOWN,
+                                            approval_vote=self.approval_vote)
+        self.unchanged = Bill.objects.create(title='unchanged', stage=BillStages.PROPOSED,
+                                             stage_date=date(2011, 1, 1))
+        PrivateProposal.objects.create(bill=self.unchanged, title='p 3', date=date(2011, 1, 1))
+
+    def _stage(self, bill):
+        bill = Bill.objects.get(pk=bill.pk)
+        return bill.stage, bill.stage_date
+
+    def test_update_stages(self):
+        changes = update_stages()
+        self.assertEqual(set(change.bill_id for change in changes),
+                         set([self.proposed.id, self.pre_approved.id, self.in_committee.id, self.approved.id]))
+        self.assertEqual(self._stage(self.proposed), (BillStages.PROPOSED, date(2011, 1, 1)))
+        self.assertEqual(self._stage(self.pre_approved), (BillStages.PRE_APPROVED, date(2011, 2, 1)))
+        self.assertEqual(self._stage(self.in_committee), (BillStages.IN_COMMITTEE, date(2011, 3, 1)))
+        self.assertEqual(self._stage(self.approved), (BillStages.FAILED_APPROVAL, date(2011, 6, 1)))
+        self.assertEqual(update_stages(), [])
+
+    def test_same_as_update_stage(self):
+        update_stages()
+        batch = dict((bill.id, (bill.stage, bill.stage_date)) for bill in Bill.objects.all())
+        bill_actions = Action.objects.filter(verb__startswith='was-')
+        batch_stream = sorted(bill_actions.values_list('actor_object_id', 'verb', 'target_object_id'))
+        Bill.objects.update(stage=BillStages.UNKNOWN, stage_date=None)
+        Action.objects.all().delete()
+        for bill in Bill.objects.all():
+            bill.update_stage()
+        self.assertEqual(batch, dict((bill.id, (bill.stage, bill.stage_date)) for bill in Bill.objects.all()))
+        stream = bill_actions.values_list('actor_object_id', 'verb', 'target_object_id')
+        self.assertEqual(batch_stream, sorted(stream))
+
+    def test_stream_follows_meetings(self):
+        update_stages()
+        action_ids = sorted(Action.objects.values_list('id', flat=True))
+        self.assertEqual(update_stages(), [])
+        self.assertEqual(sorted(Action.objects.values_list('id', flat=True)), action_ids)
+
+        # a meeting before the stage date doesn't change the stage, only the stream
+        meeting = Committee.objects.create(name='c').meetings.create(date=date(2011, 2, 1))
+        self.in_committee.first_committee_meetings.add(meeting)
+        self.assertEqual(update_stages(), [])
+        self.assertEqual(self._stage(self.in_committee), (BillStages.IN_COMMITTEE, date(2011, 3, 1)))
+        self.assertTrue(Action.objects.filter(verb='was-discussed-1', actor_object_id=self.in_committee.id,
+                                              target_object_id=meeting.id).exists())
+
+    def test_dry_run(self):
+        changes = update_stages(dry_run=True)
+        self.assertEqual(len(changes), 4)
+        self.assertEqual(self._stage(self.proposed), (BillStages.UNKNOWN, None))
+        self.assertFalse(Action.objects.filter(verb='was-proposed').exists())
@@ -0,0 +1,39 @@
+# encoding: utf-8
+from django.test import TestCase
+
+from laws.dedup import find_duplicate_laws, find_duplicate_bills, merge_duplicates
+from laws.models import Law, Bill
+
+
+class TestDedup(TestCase):
+    def setUp(self):
+        self.law = Law.objects.create(title=u'חוק החשמל')
+        self.duplicate_law = Law.objects.create(title=u'חוק ה-חשמל')
+        self.other_law = Law.objects.create(title=u'חוק המים')
+        self.bill = Bill.objects.create(title=u'חוק החשמל (תיקון)', law=self.law, stage='1')
+        self.duplicate_bill = Bill.objects.create(title=u'חוק החשמל, תיקון', law=self.duplicate_law, stage='1')
+        self.other_bill = Bill.objects.create(title=u'חוק המים', law=self.other_law, stage='1')
+
+    def test_title_key(self):
+        self.assertEqual(self.law.title_key, self.duplicate_law.title_key)
+        self.assertNotEqual(self.law.title_key, self.other_law.title_key)
+        self.law.title = u'חוק המים'
+        self.law.save()
+        self.assertEqual(self.law.title_key, self.other_law.title_key)
+
+    def test_find_duplicates(self):
+        merges = find_duplicate_laws()
+        self.assertEqual(len(merges), 1)
+        # on equal bill counts the later law is kept
+        self.assertEqual(merges[0].target, self.duplicate_law)
+        self.assertEqual(merges[0].duplicates, [self.law])
+        # the bills belong to different laws until the laws are merged
+        self.assertEqual(find_duplicate_bills(), [])
+
+    def test_merge_duplicates(self):
+        law_merges, bill_merges = merge_duplicates()
+        self.assertEqual(Law.objects.get(pk=self.law.pk).merged_into, self.duplicate_law)
+        self.assertEqual(len(bill_merges), 1)
+        self.assertEqual(list(self.duplicate_law.bills.all()), [bill_merges[0].target])
+        self.assertEqual(Bill.objects.count(), 2)
+        self.assertEqual(merge_duplicates(), ([], []))
@@ -0,0 +1,93 @@
+import datetime
+
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from laws.enums import BillStages
+from laws.models import Vote, VoteAction, Bill, PrivateProposal, PartyStatistics
+from mks.models import Knesset, Party, Member, WeeklyPresence
+from mks.views import PartyListView
+
+
+class TestPartyStatistics(TestCase):
+    def setUp(self):
+        self.knesset = Knesset.objects.create(number=1, start_date=datetime.date(2010, 1, 1))
+        self.coalition_party = Party.objects.create(name='coalition', knesset=self.knesset, number_of_seats=2,
+                                                    is_coalition=True)
+        self.opposition_party = Party.objects.create(name='opposition', knesset=self.knesset, number_of_seats=1)
+        self.mk_1 = Member.objects.create(name='mk 1', current_party=self.coalition_party, residence_centrality=4)
+        self.mk_2 = Member.objects.create(name='mk 2', current_party=self.coalition_party, residence_centrality=7)
+        self.mk_3 = Member.objects.create(name='mk 3', current_party=self.opposition_party)
+        self.vote = Vote.objects.create(title='vote', time=datetime.datetime(2012, 1, 1))
+        VoteAction.objects.create(vote=self.vote, member=self.mk_1, type='for')
+        VoteAction.objects.create(vote=self.vote, member=self.mk_2, type='against', against_party=True,
+                                  against_coalition=True)
+        VoteAction.objects.create(vote=self.vote, member=self.mk_3, type='for')
+        self.bill = Bill.objects.create(title='bill', stage=BillStages.APPROVED)
+        self.bill.proposers.add(self.mk_1, self.mk_2)
+        PrivateProposal.objects.create(bill=self.bill, title='proposal', date=datetime.date(2011, 1, 1))
+
+    def _statistics(self, party):
+        return PartyStatistics.objects.get(party=party, knesset=self.knesset)
+
+    def test_refresh(self):
+        self.assertEqual(PartyStatistics.objects.refresh(self.knesset), 2)
+        coalition = self._statistics(self.coalition_party)
+        self.assertEqual(coalition.votes_per_seat, 1.0)
+        self.assertEqual(coalition.discipline, 50.0)
+        self.assertEqual(coalition.coalition_discipline, 50.0)
+        self.assertEqual(coalition.residence_centrality, 5.5)
+        self.assertEqual(coalition.bills_proposed, 0.5)
+        self.assertEqual(coalition.bills_approved, 0.5)
+        self.assertFalse(coalition.is_stale)
+        opposition = self._statistics(self.opposition_party)
+        self.assertEqual(opposition.discipline, 100.0)
+        self.assertEqual(opposition.residence_centrality, 0)
+        self.assertEqual(opposition.bills_proposed, 0.0)
+
+    def test_changes_mark_statistics_stale(self):
+        PartyStatistics.objects.refresh(self.knesset)
+        WeeklyPresence.objects.create(member=self.mk_3, date=datetime.date(2012, 1, 2), hours=10)
+        self.assertTrue(self._statistics(self.opposition_party).is_stale)
+        self.assertFalse(self._statistics(self.coalition_party).is_stale)
+
+        # reads serve the last computed statistics
+        statistics = PartyStatistics.objects.for_knesset(self.knesset)
+        self.assertEqual(sorted(statistics), sorted([self.coalition_party.id, self.opposition_party.id]))
+        self.assertTrue(statistics[self.opposition_party.id].is_stale)
+        self.assertNotEqual(statistics[self.opposition_party.id].presence, 10.0)
+
+        self.assertEqual(PartyStatistics.objects.refresh_stale(), 1)
+        statistics = PartyStatistics.objects.for_knesset(self.knesset)
+        self.assertFalse(any(s.is_stale for s in statistics.itervalues()))
+        self.assertEqual(self._statistics(self.opposition_party).presence, 10.0)
+
+        VoteAction.objects.create(vote=Vote.objects.create(title='vote 2', time=datetime.datetime(2012, 2, 1)),
+                                  member=self.mk_1, type='for')
+        self.assertTrue(self._statistics(self.coalition_party).is_stale)
+
+    def test_new_party_gets_statistics(self):
+        party = Party.objects.create(name='new', knesset=self.knesset, number_of_seats=1)
+        self.assertTrue(self._statistics(party).is_stale)
+
+    def test_refresh_stale_computes_missing_statistics(self):
+        PartyStatistics.objects.all().delete()
+        self.assertEqual(PartyStatistics.objects.refresh_stale(), 2)
+        self.assertEqual(self._statistics(self.coalition_party).votes_per_seat, 1.0)
+        self.assertEqual(PartyStatistics.objects.refresh_stale(), 0)
+
+    def test_stat_pages_without_statistics(self):
+        res = self.client.get(reverse('party-stats', kwargs={'stat_type': 'seats'}))
+        self.assertEqual(res.context['coalition'][0].extra, 2)
+        res = self.client.get(reverse('party-stats', kwargs={'stat_type': 'discipline'}))
+        self.assertEqual([party.id for party in res.context['coalition']], [self.coalition_party.id])
+        self.assertEqual(res.context['coalition'][0].extra, 'N/A')
+
+    def test_stat_pages(self):
+        PartyStatistics.objects.refresh_stale()
+        for stat_type, title in PartyListView.pages:
+            res = self.client.get(reverse('party-stats', kwargs={'stat_type': stat_type}))
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual([party.id for party in res.context['coalition']], [self.coalition_party.id])
+            self.assertEqual([party.id for party in res.context['opposition']], [self.opposition_party.id])
+        self.assertEqual(res.context['coalition'][0].extra, 0)
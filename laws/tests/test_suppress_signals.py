@@ -0,0 +1,60 @@
+import datetime
+
+from actstream.models import Action
+from django.test import TestCase
+
+from knesset.utils import suppress_signals, signals_suppressed, defer
+from laws.models import Vote, VoteAction, PartyStatistics
+from mks.models import Knesset, Party, Member
+
+
+class SuppressSignalsTest(TestCase):
+    def setUp(self):
+        self.knesset = Knesset.objects.create(number=1, start_date=datetime.date(2010, 1, 1))
+        self.party = Party.objects.create(name='party', knesset=self.knesset, number_of_seats=2)
+        self.mk_1 = Member.objects.create(name='mk 1', current_party=self.party)
+        self.mk_2 = Member.objects.create(name='mk 2', current_party=self.party)
+        self.vote = Vote.objects.create(title='vote', time=datetime.datetime(2012, 1, 1))
+
+    def test_defer(self):
+        calls = []
+        defer(calls.append, 1)
+        self.assertEqual(calls, [[1]])
+        with suppress_signals():
+            with suppress_signals():
+                defer(calls.append, 2)
+                defer(calls.append, 3)
+            defer(calls.append, 2)
+            self.assertTrue(signals_suppressed())
+            self.assertEqual(calls, [[1]])
+        self.assertFalse(signals_suppressed())
+        self.assertEqual(calls, [[1], [2, 3]])
+
+    def test_deferred_dropped_on_error(self):
+        calls = []
+        with self.assertRaises(ValueError):
+            with suppress_signals():
+                defer(calls.append, 1)
+                raise ValueError()
+        self.assertFalse(signals_suppressed())
+        self.assertEqual(calls, [])
+
+    def test_vote_actions_listeners_deferred(self):
+        PartyStatistics.objects.filter(party=self.party).update(is_stale=False)
+        with suppress_signals():
+            VoteAction.objects.create(vote=self.vote, member=self.mk_1, type='for')
+            VoteAction.objects.create(vote=self.vote, member=self.mk_2, type='against')
+            self.assertEqual(Action.objects.filter(verb='voted').count(), 0)
+            self.assertFalse(PartyStatistics.objects.filter(party=self.party, is_stale=True).exists())
+        actions = Action.objects.filter(verb='voted')
+        self.assertEqual(sorted(action.actor_object_id for action in actions),
+                         sorted([str(self.mk_1.id), str(self.mk_2.id)]))
+        self.assertEqual(set(action.target_object_id for action in actions), set([str(self.vote.id)]))
+        self.assertTrue(PartyStatistics.objects.filter(party=self.party, is_stale=True).exists())
+
+    def test_recreated_vote_action_updates_description(self):
+        VoteAction.objects.create(vote=self.vote, member=self.mk_1, type='for')
+        VoteAction.objects.filter(vote=self.vote, member=self.mk_1).delete()
+        vote_action = VoteAction.objects.create(vote=self.vote, member=self.mk_1, type='against')
+        action = Action.objects.get(verb='voted', actor_object_id=str(self.mk_1.id))
+        self.assertEqual(action.description, unicode(vote_action.get_type_display()))
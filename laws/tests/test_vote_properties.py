@@ -0,0 +1,67 @@
+import datetime
+
+from django.test import TestCase
+
+from laws.models import Vote, VoteAction, Bill
+from laws.vote_properties import update_votes_properties
+from mks.models import Knesset, Party, Member, Membership, CoalitionMembership
+
+
+class TestVoteProperties(TestCase):
+    def setUp(self):
+        self.knesset = Knesset.objects.create(number=1, start_date=datetime.date(2010, 1, 1))
+        self.coalition_party = Party.objects.create(name='coalition', knesset=self.knesset)
+        self.opposition_party = Party.objects.create(name='opposition', knesset=self.knesset)
+        CoalitionMembership.objects.create(party=self.coalition_party, start_date=datetime.date(2010, 1, 1))
+        self.members = []
+        for i, party in enumerate([self.coalition_party] * 4 + [self.opposition_party] * 3):
+            member = Member.objects.create(name='mk %d' % i, current_party=party)
+            Membership.objects.create(member=member, party=party, start_date=datetime.date(2010, 1, 1))
+            self.members.append(member)
+        self.vote = Vote.objects.create(title='vote', time=datetime.datetime(2012, 1, 1))
+        for member, vote_type in zip(self.members, ['for', 'for', 'for', 'against', 'against', 'against', 'for']):
+            VoteAction.objects.create(vote=self.vote, member=member, type=vote_type, party=member.current_party)
+        self.bill = Bill.objects.create(title='bill', stage='1')
+        self.bill.pre_votes.add(self.vote)
+        self.bill.proposers.add(self.members[3])
+
+    def _flags(self, member):
+        action = VoteAction.objects.get(vote=self.vote, member=member)
+        return action.against_party, action.against_coalition, action.against_opposition, action.against_own_bill
+
+    def test_update_votes_properties(self):
+        result = update_votes_properties(Vote.objects.all())
+        self.assertEqual(result.votes, 1)
+        self.assertEqual(result.errors, [])
+
+        vote = Vote.objects.get(pk=self.vote.pk)
+        self.assertEqual(vote.votes_count, 7)
+        self.assertEqual(vote.for_votes_count, 4)
+        self.assertEqual(vote.against_votes_count, 3)
+        self.assertEqual(vote.controversy, 3)
+        self.assertEqual(vote.against_party, 2)
+        self.assertEqual(vote.against_coalition, 1)
+        self.assertEqual(vote.against_opposition, 1)
+        self.assertEqual(vote.against_own_bill, 1)
+        self.assertEqual(self._flags(self.members[3]), (True, True, False, True))
+        self.assertEqual(self._flags(self.members[6]), (True, False, True, False))
+        self.assertEqual(self._flags(self.members[0]), (False, False, False, False))
+
+    def test_same_results_as_single_vote_update(self):
+        self.vote.update_vote_properties()
+        self.assertEqual(self.vote.against_party, 2)
+        result = update_votes_properties(Vote.objects.all())
+        self.assertEqual((result.changed_votes, result.changed_actions), (0, 0))
+
+    def test_dry_run(self):
+        result = update_votes_properties(Vote.objects.all(), dry_run=True)
+        self.assertEqual(result.changed_votes, 1)
+        self.assertEqual(result.changed_actions, 2)
+        self.assertEqual(result.changes[0].changed_fields['against_party'], (None, 2))
+        self.assertEqual(Vote.objects.get(pk=self.vote.pk).against_party, None)
+
+    def test_missing_membership_is_reported(self):
+        Membership.objects.filter(member=self.members[0]).delete()
+        result = update_votes_properties(Vote.objects.all())
+        self.assertEqual(result.votes, 0)
+        self.assertEqual(len(result.errors), 1)
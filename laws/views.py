@@ -6,7 +6,6 @@ import os
 import difflib
 import logging
 
-import itertools
 import tagging
 import voting
 from actstream import action
@@ -22,7 +21,6 @@ from django.template import RequestContext
 from django.utils.decorators import method_decorator
 from django.utils.translation import ugettext_lazy, ugettext as _
 from django.views.decorators.csrf import ensure_csrf_cookie
-from django.db.models import Q
 from tagging.models import Tag, TaggedItem
 
 from agendas.models import Agenda, UserSuggestedVote, Link
@@ -36,6 +34,8 @@ from knesset.utils import notify_responsible_adult
 from mks.models import Member, Knesset
 from models import Bill, BillBudgetEstimation, Vote, KnessetProposal, VoteAction
 from committees.models import CommitteeMeeting
+from committees.autocomplete import committee_meeting_autocomplete
+from laws.autocomplete import bill_autocomplete, vote_autocomplete, knesset_proposal_autocomplete
 
 logger = logging.getLogger("open-knesset.laws.views")
 
@@ -114,13 +114,9 @@ def bill_auto_complete(request):
     if not 'query' in request.GET:
         raise Http404
 
-    options = Bill.objects.filter(
-        full_title__icontains=request.GET['query'])[:30]
-    data = []
-    suggestions = []
-    for i in options:
-        data.append(i.id)
-        suggestions.append(i.full_title)
+    options = bill_autocomplete.search(request.GET['query'], 30)
+    data = [bill_id for bill_id, suggestion in options]
+    suggestions = [suggestion for bill_id, suggestion in options]
 
     result = {'query': request.GET['query'],
               'suggestions': suggestions,
@@ -271,6 +267,7 @@ def votes_to_bar_widths(v_count, v_for, v_against):
 
 class BillCsvView(CsvView):
     model = Bill
+    export_by_key = True
     file_path_and_name = ['csv', 'bills.csv']
     filename = os.path.join(*file_path_and_name)
     list_display = (('full_title', _('Full Title')),
@@ -383,14 +380,8 @@ class BillDetailView(DetailView):
         proposers = proposers.select_related('current_party')
         extra_proposers = extra_proposers.select_related('current_party')
 
-        links = list(Link.objects.for_model(Member))
-        links_by_member = {}
-        for k, g in itertools.groupby(links, lambda x: x.object_pk):
-            links_by_member[str(k)] = list(g)
-        for proposer in proposers:
-            proposer.cached_links = links_by_member.get(str(proposer.pk), [])
-        for proposer in extra_proposers:
-            proposer.cached_links = links_by_member.get(str(proposer.pk), [])
+        # evaluates the querysets, their cached members get the links
+        Link.objects.attach_to(list(proposers) + list(extra_proposers))
         context['proposers'] = proposers
         context['extra_proposers'] = extra_proposers
         votes = voting.models.Vote.objects.get_object_votes(bill)
@@ -953,15 +944,9 @@ def vote_auto_complete(request):
     if not 'query' in request.GET:
         raise Http404
 
-    options = Vote.objects.filter(title__icontains=request.GET['query'])[:30]
-
-    data = []
-    suggestions = []
-    for i in options:
-        formatted_date = i.time.date().strftime('%d/%m/%Y')
-        title = u'{0} - {1}'.format(formatted_date, i.title)
-        data.append(i.id)
-        suggestions.append(title)
+    options = vote_autocomplete.search(request.GET['query'], 30)
+    data = [vote_id for vote_id, suggestion in options]
+    suggestions = [suggestion for vote_id, suggestion in options]
 
     result = {'query': request.GET['query'],
               'suggestions': suggestions,
@@ -975,23 +960,10 @@ def knesset_proposal_auto_complete(request):
     if not request.GET.get('query'):
         raise Http404
 
-    q = request.GET['query']
-    if q.isdigit():
-        options = KnessetProposal.objects.filter(booklet_number=q)[0:30]
-
-    else:
-        options = KnessetProposal.objects.filter(
-
-            Q(title__icontains=q) |
-            Q(law__title__icontains=q))[:30]
-
-    data = []
-    suggestions = []
-    for i in options:
-        formatted_date = i.date.strftime('%d/%m/%Y')
-        title = u'{0} - {1} - {2}'.format(formatted_date, i.law.title, i.title)
-        data.append(i.id)
-        suggestions.append(title)
+    # digits are looked up as a booklet number
+    options = knesset_proposal_autocomplete.search(request.GET['query'], 30)
+    data = [kp_id for kp_id, suggestion in options]
+    suggestions = [suggestion for kp_id, suggestion in options]
 
     result = {'query': request.GET['query'],
               'suggestions': suggestions,
@@ -1004,18 +976,9 @@ def committee_meeting_auto_complete(request):
     if not request.GET.get('query'):
         raise Http404
 
-    q = request.GET['query']
-
-    optional_committee_meetings = CommitteeMeeting.objects.filter(
-        Q(date_string__icontains=q) | Q(topics__icontains=q)
-    )[:10]
-
-    data = []
-    suggestions = []
-    for committee_meeting in optional_committee_meetings:
-        title = u'{0} - {1}'.format(committee_meeting.date_string, committee_meeting.topics)
-        data.append(committee_meeting.pk)
-        suggestions.append(title)
+    options = committee_meeting_autocomplete.search(request.GET['query'], 10)
+    data = [cm_id for cm_id, suggestion in options]
+    suggestions = [suggestion for cm_id, suggestion in options]
 
     result = {'query': request.GET['query'],
               'suggestions': suggestions,
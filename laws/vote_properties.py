@@ -0,0 +1,276 @@
+# encoding: utf-8
+"""
+Batch computation of vote properties.
+
+Computes what Vote.update_vote_properties computes - the against_party /
+against_coalition / against_opposition / against_own_bill flags of every
+VoteAction and the counters of the Vote - for many votes at once. Party and
+coalition memberships are answered from the in-memory PartyIntervalIndex, the
+actions and bill proposers of a chunk of votes are fetched with a handful of
+queries, and only rows whose values actually changed are written, with one
+UPDATE per distinct flags combination for the actions.
+"""
+import logging
+import multiprocessing
+from collections import defaultdict, namedtuple
+
+from django.db import connection, transaction
+
+from laws import constants
+from laws.helpers import resolve_vote_type_by_title, MissingVotePartyException
+from laws.models import Vote, VoteAction, Bill
+from mks.intervals import get_party_index
+
+logger = logging.getLogger("open-knesset.laws.vote_properties")
+
+DEFAULT_CHUNK_SIZE = 500
+
+VOTE_ACTION_FLAGS = ('against_party', 'against_coalition', 'against_opposition', 'against_own_bill')
+VOTE_PROPERTY_FIELDS = ('against_party', 'against_coalition', 'against_opposition', 'against_own_bill',
+                        'votes_count', 'for_votes_count', 'against_votes_count', 'abstain_votes_count',
+                        'controversy', 'vote_type')
+
+# fields: the new Vote field values; changed_fields: field -> (old, new) for
+# the fields that differ; changed_actions: action id -> (old flags, new flags)
+VoteProperties = namedtuple('VoteProperties', ['vote_id', 'fields', 'changed_fields', 'changed_actions'])
+
+
+class VotePropertiesResult(object):
+    """Totals of a batch run, mergeable across chunks and worker processes"""
+
+    def __init__(self):
+        self.votes = 0
+        self.changed_votes = 0
+        self.changed_actions = 0
+        self.errors = []
+        self.changes = []
+
+    def add(self, other):
+        self.votes += other.votes
+        self.changed_votes += other.changed_votes
+        self.changed_actions += other.changed_actions
+        self.errors.extend(other.errors)
+        self.changes.extend(other.changes)
+        return self
+
+
+def _stands(votes, total):
+    return float(votes) > constants.STANDS_FOR_THRESHOLD * total
+
+
+class VotePropertiesCalculator(object):
+    def __init__(self, index=None, raise_errors=False):
+        self.index = index or get_party_index()
+        self.raise_errors = raise_errors
+
+    def _proposers_by_vote(self, vote_ids):
+        bills_by_vote = defaultdict(set)
+        for vote_id, bill_id in Bill.pre_votes.through.objects.filter(
+                vote_id__in=vote_ids).values_list('vote_id', 'bill_id'):
+            bills_by_vote[vote_id].add(bill_id)
+        for vote_id, bill_id in Bill.objects.filter(first_vote_id__in=vote_ids).values_list('first_vote_id', 'id'):
+            bills_by_vote[vote_id].add(bill_id)
+        for vote_id, bill_id in Bill.objects.filter(approval_vote_id__in=vote_ids).values_list('approval_vote_id',
+                                                                                                'id'):
+            bills_by_vote[vote_id].add(bill_id)
+
+        proposers_by_bill = defaultdict(set)
+        bill_ids = set().union(*bills_by_vote.values()) if bills_by_vote else set()
+        if bill_ids:
+            for bill_id, member_id in Bill.proposers.through.objects.filter(
+                    bill_id__in=bill_ids).values_list('bill_id', 'member_id'):
+                proposers_by_bill[bill_id].add(member_id)
+
+        return dict((vote_id, set().union(*[proposers_by_bill[bill_id] for bill_id in bill_ids]))
+                    for vote_id, bill_ids in bills_by_vote.iteritems())
+
+    def _compute_vote(self, vote, actions, proposers):
+        vote_id, time, title = vote['id'], vote['time'], vote['title']
+        d = time.date()
+
+        action_party_ids = {}
+        for action in actions:
+            party_id = self.index.party_id_at(action['member_id'], d)
+            if party_id is None:
+                raise MissingVotePartyException(
+                    'could not find which party member %s belonged to during vote %s' % (action['member_id'], vote_id))
+            action_party_ids[action['id']] = party_id
+
+        party_for_votes = defaultdict(int)
+        party_against_votes = defaultdict(int)
+        for action in actions:
+            if action['type'] == 'for':
+                party_for_votes[action_party_ids[action['id']]] += 1
+            elif action['type'] == 'against':
+                party_against_votes[action_party_ids[action['id']]] += 1
+
+        coalition_for_votes = coalition_against_votes = opposition_for_votes = opposition_against_votes = 0
+        for party_id in set(party_for_votes) | set(party_against_votes):
+            if self.index.is_coalition_at(party_id, d):
+                coalition_for_votes += party_for_votes[party_id]
+                coalition_against_votes += party_against_votes[party_id]
+            else:
+                opposition_for_votes += party_for_votes[party_id]
+                opposition_against_votes += party_against_votes[party_id]
+        coalition_total_votes = coalition_for_votes + coalition_against_votes
+        coalition_stands_for = _stands(coalition_for_votes, coalition_total_votes)
+        coalition_stands_against = _stands(coalition_against_votes, coalition_total_votes)
+        opposition_total_votes = opposition_for_votes + opposition_against_votes
+        opposition_stands_for = _stands(opposition_for_votes, opposition_total_votes)
+        opposition_stands_against = _stands(opposition_against_votes, opposition_total_votes)
+
+        counts = dict((flag, 0) for flag in VOTE_ACTION_FLAGS)
+        type_counts = defaultdict(int)
+        changed_actions = {}
+        for action in actions:
+            party_id = action_party_ids[action['id']]
+            party_total = party_for_votes[party_id] + party_against_votes[party_id]
+            flags = dict((flag, False) for flag in VOTE_ACTION_FLAGS)
+            if action['type'] == 'against' and _stands(party_for_votes[party_id], party_total):
+                flags['against_party'] = True
+            if action['type'] == 'for' and _stands(party_against_votes[party_id], party_total):
+                flags['against_party'] = True
+            if self.index.is_coalition_at(party_id, d):
+                if (coalition_stands_for and action['type'] == 'against') or \
+                        (coalition_stands_against and action['type'] == 'for'):
+                    flags['against_coalition'] = True
+            else:
+                if (opposition_stands_for and action['type'] == 'against') or \
+                        (opposition_stands_against and action['type'] == 'for'):
+                    flags['against_opposition'] = True
+            if action['member_id'] in proposers and action['type'] == 'against':
+                flags['against_own_bill'] = True
+
+            for flag in VOTE_ACTION_FLAGS:
+                counts[flag] += flags[flag]
+            type_counts[action['type']] += 1
+            old_flags = tuple(action[flag] for flag in VOTE_ACTION_FLAGS)
+            new_flags = tuple(flags[flag] for flag in VOTE_ACTION_FLAGS)
+            if old_flags != new_flags:
+                changed_actions[action['id']] = (old_flags, new_flags)
+
+        fields = dict(counts)
+        fields.update(votes_count=len(actions),
+                      for_votes_count=type_counts['for'],
+                      against_votes_count=type_counts['against'],
+                      abstain_votes_count=type_counts['abstain'],
+                      controversy=min(type_counts['for'], type_counts['against']),
+                      vote_type=resolve_vote_type_by_title(title))
+        changed_fields = dict((field, (vote[field], value)) for field, value in fields.iteritems()
+                              if vote[field] != value)
+        return VoteProperties(vote_id, fields, changed_fields, changed_actions)
+
+    def compute(self, vote_ids):
+        """Compute the properties of the given votes without writing anything.
+
+        Returns a list of VoteProperties and a list of error messages for
+        votes that could not be computed (or raises MissingVotePartyException if
+        raise_errors was set).
+        """
+        votes = Vote.objects.filter(id__in=vote_ids).values('id', 'time', 'title', *VOTE_PROPERTY_FIELDS)
+        actions_by_vote = defaultdict(list)
+        for action in VoteAction.objects.filter(vote_id__in=vote_ids).values(
+                'id', 'vote_id', 'member_id', 'type', *VOTE_ACTION_FLAGS):
+            actions_by_vote[action['vote_id']].append(action)
+        proposers_by_vote = self._proposers_by_vote(vote_ids)
+
+        properties, errors = [], []
+        for vote in votes:
+            try:
+                properties.append(self._compute_vote(vote, actions_by_vote[vote['id']],
+                                                     proposers_by_vote.get(vote['id'], set())))
+            except MissingVotePartyException as e:
+                if self.raise_errors:
+                    raise
+                logger.warning(unicode(e))
+                errors.append(unicode(e))
+        return properties, errors
+
+    def apply(self, properties, write_votes=True):
+        """Write the changed action flags (and vote fields) of computed properties"""
+        actions_by_flags = defaultdict(list)
+        for vote_properties in properties:
+            for action_id, (old_flags, new_flags) in vote_properties.changed_actions.iteritems():
+                actions_by_flags[new_flags].append(action_id)
+        for flags, action_ids in actions_by_flags.iteritems():
+            for i in range(0, len(action_ids), DEFAULT_CHUNK_SIZE):
+                VoteAction.objects.filter(id__in=action_ids[i:i + DEFAULT_CHUNK_SIZE]).update(
+                    **dict(zip(VOTE_ACTION_FLAGS, flags)))
+        if write_votes:
+            for vote_properties in properties:
+                if vote_properties.changed_fields:
+                    Vote.objects.filter(id=vote_properties.vote_id).update(**vote_properties.fields)
+
+    def update_votes(self, vote_ids, dry_run=False):
+        """Compute and write the properties of a chunk of votes.
+
+        With dry_run nothing is written and the changes are returned in
+        result.changes instead.
+        """
+        result = VotePropertiesResult()
+        properties, result.errors = self.compute(vote_ids)
+        result.votes = len(properties)
+        changed = [p for p in properties if p.changed_fields or p.changed_actions]
+        result.changed_votes = len([p for p in changed if p.changed_fields])
+        result.changed_actions = sum(len(p.changed_actions) for p in changed)
+        if dry_run:
+            result.changes = changed
+        elif changed:
+            with transaction.atomic():
+                self.apply(changed)
+        return result
+
+
+def _chunks(vote_ids, chunk_size):
+    for i in range(0, len(vote_ids), chunk_size):
+        yield vote_ids[i:i + chunk_size]
+
+
+_worker_calculator = None
+
+
+def _init_worker(index):
+    global _worker_calculator
+    _worker_calculator = VotePropertiesCalculator(index=index)
+
+
+def _update_chunk_in_worker(args):
+    vote_ids, dry_run = args
+    return _worker_calculator.update_votes(vote_ids, dry_run=dry_run)
+
+
+def update_votes_properties(votes, chunk_size=DEFAULT_CHUNK_SIZE, workers=1, dry_run=False, progress=None):
+    """Recompute the properties of all votes in the given queryset.
+
+    The votes are processed in chunks of chunk_size, split across worker
+    processes if workers > 1. progress, if given, is called with the number
+    of processed votes and the total after every chunk.
+
+    Returns a VotePropertiesResult.
+    """
+    vote_ids = list(votes.order_by('id').values_list('id', flat=True))
+    total = len(vote_ids)
+    result = VotePropertiesResult()
+    index = get_party_index()
+
+    if workers > 1:
+        # every worker must open its own db connection
+        connection.close()
+        pool = multiprocessing.Pool(workers, _init_worker, (index,))
+        try:
+            chunk_results = pool.imap_unordered(_update_chunk_in_worker,
+                                                [(chunk, dry_run) for chunk in _chunks(vote_ids, chunk_size)])
+            for chunk_result in chunk_results:
+                result.add(chunk_result)
+                if progress:
+                    progress(result.votes + len(result.errors), total)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        calculator = VotePropertiesCalculator(index=index)
+        for chunk in _chunks(vote_ids, chunk_size):
+            result.add(calculator.update_votes(chunk, dry_run=dry_run))
+            if progress:
+                progress(result.votes + len(result.errors), total)
+    return result
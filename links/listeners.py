@@ -0,0 +1,17 @@
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+
+from links.managers import links_cache_key
+from links.models import Link
+
+
+def invalidate_links_cache(sender, instance, **kwargs):
+    cache.delete(links_cache_key(instance.content_type_id, instance.object_pk))
+    # the object_icon_links template tag cache
+    ct = ContentType.objects.get_for_id(instance.content_type_id)
+    cache.delete('%s.%s.%s' % (ct.app_label, ct.model, instance.object_pk))
+
+
+post_save.connect(invalidate_links_cache, sender=Link)
+post_delete.connect(invalidate_links_cache, sender=Link)
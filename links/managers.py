@@ -1,8 +1,15 @@
+from django.conf import settings
+from django.core.cache import cache
 from django.db import models
+from django.db.models import Q
 from django.contrib.contenttypes.models import ContentType
 from django.utils.encoding import force_unicode
 
 
+def links_cache_key(content_type_id, object_pk):
+    return 'links_%s_%s' % (content_type_id, object_pk)
+
+
 class LinksManager(models.Manager):
 
     def for_model(self, model):
@@ -16,3 +23,41 @@ class LinksManager(models.Manager):
         if isinstance(model, models.Model):
             qs = qs.filter(object_pk=force_unicode(model._get_pk_val()))
         return qs
+
+    def for_objects(self, objects):
+        """
+        Dict of each of objects (instances of any models) to the list of its
+        active links. The links of every object are cached (and dropped from
+        the cache when its links change), the links of the objects that are
+        not in the cache are read in one query.
+        """
+        keys = {}
+        pks_by_ct = {}
+        for obj in objects:
+            ct = ContentType.objects.get_for_model(obj)
+            pk = force_unicode(obj._get_pk_val())
+            keys[obj] = links_cache_key(ct.id, pk)
+            pks_by_ct.setdefault(ct.id, set()).add(pk)
+        cached = cache.get_many(keys.values())
+        missing = None
+        for ct_id, pks in pks_by_ct.iteritems():
+            pks = [pk for pk in pks if links_cache_key(ct_id, pk) not in cached]
+            if pks:
+                q = Q(content_type=ct_id, object_pk__in=pks)
+                missing = q if missing is None else missing | q
+        found = dict((key, []) for key in keys.itervalues() if key not in cached)
+        if missing is not None:
+            for link in self.get_query_set().select_related('link_type').filter(
+                    missing, active=True).order_by('id'):
+                found[links_cache_key(link.content_type_id, link.object_pk)].append(link)
+            cache.set_many(found, settings.LONG_CACHE_TIME)
+            cached.update(found)
+        return dict((obj, cached[key]) for obj, key in keys.iteritems())
+
+    def attach_to(self, objects):
+        """Set the cached_links of each of objects, which the links template
+        tags use instead of querying the links of every object"""
+        objects = list(objects)
+        links = self.for_objects(objects)
+        for obj in objects:
+            obj.cached_links = links[obj]
@@ -68,6 +68,21 @@ class TestModels(unittest.TestCase):
         self.assertEqual(self.link.link_type, self.default_link)
         self.assertEqual(self.link.__unicode__(), u'google: http://www.google.com/')
 
+    def testForObjects(self):
+        other_mk = Member.objects.create(name='other MK')
+        site = Site.objects.create(domain="example.org", name="example")
+        site_link = Link.objects.create(url='http://www.example.org/', title='example', content_object=site)
+        old_link = Link.objects.create(url='http://www.example.org/old', title='old', content_object=self.mk,
+                                       active=False)
+        links = Link.objects.for_objects([self.mk, other_mk, site])
+        self.assertEqual(links, {self.mk: [self.link], other_mk: [], site: [site_link]})
+        Link.objects.attach_to([self.mk])
+        self.assertEqual(self.mk.cached_links, [self.link])
+        old_link.delete()
+        site_link.delete()
+        site.delete()
+        other_mk.delete()
+
     def tearDown(self):
         self.knesset.delete()
         self.default_link.delete()
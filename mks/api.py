@@ -16,6 +16,7 @@ from tagging.utils import calculate_cloud
 from apis.resources.base import BaseResource, BaseNonModelResource
 from models import Member, Party, Knesset
 from agendas.models import Agenda
+from laws.models.party_statistics import STAT_FIELDS
 from video.utils import get_videos_queryset
 from video.api import VideoResource
 from links.models import Link
@@ -33,9 +34,10 @@ class PartyResource(BaseResource):
     TBD: create a party app
     '''
     knesset_id = fields.IntegerField('knesset_id', null=True)
+    statistics = fields.DictField(null=True, readonly=True)
 
     class Meta(BaseResource.Meta):
-        queryset = Party.objects.all()
+        queryset = Party.objects.prefetch_related('statistics')
         allowed_methods = ['get']
         excludes = ['end_date', 'start_date']
         include_absolute_url = True
@@ -51,6 +53,14 @@ class PartyResource(BaseResource):
             return super(PartyResource, self).get_object_list(request).filter(
                 knesset=Knesset.objects.current_knesset())
 
+    def dehydrate_statistics(self, bundle):
+        for party_statistics in bundle.obj.statistics.all():
+            if party_statistics.knesset_id == bundle.obj.knesset_id:
+                statistics = dict((field, getattr(party_statistics, field)) for field in STAT_FIELDS.values())
+                statistics['updated'] = party_statistics.updated
+                return statistics
+        return None
+
 
 class DictStruct:
     def __init__(self, **entries):
@@ -203,6 +213,7 @@ class MemberResource(BaseResource):
         list_fields = ['name', 'id', 'img_url', 'is_current', 'average_weekly_presence_hours', 'mmms_count',
                        'bills_stats_first', 'bills_stats_proposed', ]
         include_absolute_url = True
+        list_from_values = True
 
     party_name = fields.CharField()
     party_url = fields.CharField()
@@ -216,7 +227,7 @@ class MemberResource(BaseResource):
                                         attribute=lambda b: get_videos_queryset(b.obj, group='related'),
                                         null=True)
     links = fields.ToManyField(LinkResource,
-                               attribute=lambda b: Link.objects.for_model(b.obj),
+                               attribute=lambda b: Link.objects.for_objects([b.obj])[b.obj],
                                full=True,
                                null=True)
     bills_uri = fields.CharField()
@@ -293,6 +304,22 @@ class MemberResource(BaseResource):
 
         return count
 
+    def _counts(self, pks, relation):
+        return dict(Member.objects.filter(pk__in=pks).annotate(count=Count(relation)).values_list('pk', 'count'))
+
+    def bulk_dehydrate_mmms_count(self, pks, request):
+        return self._counts(pks, 'mmm_documents')
+
+    def bulk_dehydrate_votes_count(self, pks, request):
+        return self._counts(pks, 'votes')
+
+    def bulk_dehydrate_absolute_url(self, pks, request):
+        return dict((member.pk, member.get_absolute_url())
+                    for member in Member.objects.filter(pk__in=pks).only('id', 'name'))
+
+    def bulk_dehydrate_party_name(self, pks, request):
+        return dict(Member.objects.filter(pk__in=pks).values_list('pk', 'current_party__name'))
+
     def dehydrate_average_weekly_presence_rank(self, bundle):
         ''' Calculate the distribution of presence and place the user on a 5 level scale '''
         SCALE = 5
@@ -0,0 +1,21 @@
+# encoding: utf-8
+"""
+Autocomplete index of current members, see knesset.autocomplete.
+"""
+from knesset.autocomplete import AutocompleteIndex
+from mks.models import Member
+
+
+class MemberAutocomplete(AutocompleteIndex):
+    """Current members by name"""
+    name = 'member'
+    models = (Member,)
+
+    def entries(self):
+        for member in Member.objects.values('name', 'id', 'img_url', 'gender', 'is_current').filter(
+                is_current=True):
+            yield member['name'], {'value': member['name'], 'data': member}, ()
+
+
+member_autocomplete = MemberAutocomplete()
+member_autocomplete.connect()
@@ -0,0 +1,175 @@
+# encoding: utf-8
+"""
+In-memory interval index over Membership and CoalitionMembership.
+
+Answers "which party was member M in at date D" and "was party P in the
+coalition at date D" without hitting the db, for Member.party_at and
+Party.is_coalition_at: intervals are inclusive on both ends and a missing
+start or end date is open ended. Where memberships overlap, one without a
+start date wins, then the one that started last, the order the old
+party_at scanned them in (by -start_date, NULLs first on PostgreSQL).
+
+get_party_index returns an index shared by the whole process, so it only
+hands out ids and new Party instances, never objects shared between
+callers. The mks listeners invalidate it when memberships, coalition
+memberships or parties are saved or deleted; other processes notice
+through a version token kept in the cache, checked every
+VERSION_CHECK_INTERVAL seconds (without a cached token, the index is
+rebuilt every VERSION_FALLBACK_PERIOD seconds). Writes that send no signals (queryset
+update(), bulk_create, raw sql) must call invalidate_party_index
+themselves.
+"""
+import datetime
+import time
+from bisect import bisect_right
+from collections import defaultdict
+
+from django.core.cache import cache
+
+from mks.models import Membership, CoalitionMembership, Party
+
+MAX_DATE = datetime.date.max
+
+PARTY_INDEX_VERSION_KEY = 'mks_party_interval_index_version'
+PARTY_INDEX_VERSION_CACHE_TIME = 60 * 60 * 24 * 30
+VERSION_CHECK_INTERVAL = 10
+# without a cached version, changes in other processes are assumed to have
+# happened at the start of the current period of this length
+VERSION_FALLBACK_PERIOD = 60 * 10
+
+
+def _as_date(value):
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    return value
+
+
+class _Intervals(object):
+    """Possibly overlapping [start, end] intervals, each carrying a value. A
+    start or end of None is open ended."""
+
+    def __init__(self, intervals):
+        # the intervals without a start come first, the others are sorted by
+        # start date and the one that started last wins
+        self.open_intervals = [(end or MAX_DATE, value) for start, end, value in intervals if start is None]
+        intervals = sorted(((start, end or MAX_DATE, value) for start, end, value in intervals
+                            if start is not None), key=lambda (start, end, value): start)
+        self.starts = [start for start, end, value in intervals]
+        self.intervals = intervals
+
+    def at(self, date):
+        for end, value in self.open_intervals:
+            if end >= date:
+                return value
+        i = bisect_right(self.starts, date)
+        while i > 0:
+            i -= 1
+            start, end, value = self.intervals[i]
+            if end >= date:
+                return value
+        return None
+
+
+class PartyIntervalIndex(object):
+    """Membership and coalition intervals of all members and parties"""
+
+    def __init__(self, memberships, coalition_memberships):
+        """memberships are (member_id, party_id, start_date, end_date) tuples,
+        coalition_memberships are (party_id, start_date, end_date) tuples"""
+        by_member = defaultdict(list)
+        for member_id, party_id, start_date, end_date in memberships:
+            by_member[member_id].append((start_date, end_date, party_id))
+        self.memberships = dict((member_id, _Intervals(intervals)) for member_id, intervals in by_member.iteritems())
+
+        by_party = defaultdict(list)
+        for party_id, start_date, end_date in coalition_memberships:
+            by_party[party_id].append((start_date, end_date, True))
+        self.coalition_memberships = dict((party_id, _Intervals(intervals))
+                                          for party_id, intervals in by_party.iteritems())
+        self._parties = None
+
+    @classmethod
+    def build(cls):
+        return cls(Membership.objects.values_list('member_id', 'party_id', 'start_date', 'end_date'),
+                   CoalitionMembership.objects.values_list('party_id', 'start_date', 'end_date'))
+
+    def party_id_at(self, member_id, date):
+        """Id of the party member_id belonged to at date, or None"""
+        intervals = self.memberships.get(member_id)
+        if intervals is None:
+            return None
+        return intervals.at(_as_date(date))
+
+    def is_coalition_at(self, party_id, date):
+        intervals = self.coalition_memberships.get(party_id)
+        if intervals is None:
+            return False
+        return intervals.at(_as_date(date)) is not None
+
+    def party_ids_at(self, member_dates):
+        """Party ids for a sequence of (member_id, date) pairs, None where unknown"""
+        return [self.party_id_at(member_id, date) for member_id, date in member_dates]
+
+    def party(self, party_id):
+        """A new Party instance of the party with party_id, the fields of all
+        parties are loaded on first use"""
+        if party_id is None:
+            return None
+        if self._parties is None:
+            fields = [field.attname for field in Party._meta.concrete_fields]
+            self._parties = dict((values['id'], values) for values in Party.objects.values(*fields))
+        values = self._parties.get(party_id)
+        if values is None:
+            return None
+        party = Party(**values)
+        # as if loaded from the db
+        party._state.adding = False
+        party._state.db = 'default'
+        return party
+
+
+_party_index = None
+_party_index_version = None
+_party_index_checked = 0
+# the time of the last invalidation in this process
+_local_version = time.time()
+
+
+def party_index_version():
+    """The time of the last invalidate_party_index call in any process"""
+    version = cache.get(PARTY_INDEX_VERSION_KEY)
+    if version is None:
+        # not cached (or a dummy cache), see VERSION_FALLBACK_PERIOD
+        now = time.time()
+        version = max(_local_version, now - now % VERSION_FALLBACK_PERIOD)
+        cache.add(PARTY_INDEX_VERSION_KEY, version, PARTY_INDEX_VERSION_CACHE_TIME)
+    return version
+
+
+def get_party_index():
+    """The process wide PartyIntervalIndex, built on first use and rebuilt
+    after invalidate_party_index was called in this or any other process"""
+    global _party_index, _party_index_version, _party_index_checked
+    now = time.time()
+    if _party_index is not None and now - _party_index_checked > VERSION_CHECK_INTERVAL:
+        _party_index_checked = now
+        if party_index_version() != _party_index_version:
+            _party_index = None
+    if _party_index is None:
+        _party_index_version = party_index_version()
+        _party_index = PartyIntervalIndex.build()
+        _party_index_checked = now
+    return _party_index
+
+
+def invalidate_party_index():
+    global _party_index, _local_version
+    _party_index = None
+    _local_version = time.time()
+    cache.set(PARTY_INDEX_VERSION_KEY, _local_version, PARTY_INDEX_VERSION_CACHE_TIME)
+
+
+def parties_at(member_dates):
+    """The Party of every (member_id, date) pair, None where unknown"""
+    index = get_party_index()
+    return [index.party(party_id) for party_id in index.party_ids_at(member_dates)]
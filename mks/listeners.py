@@ -4,7 +4,9 @@ from planet.models import Feed, Post
 from actstream import action
 from knesset.utils import cannonize, disable_for_loaddata
 from links.models import Link, LinkType
-from models import Member, Knesset
+from models import Member, Knesset, Party, Membership, CoalitionMembership
+from mks.intervals import invalidate_party_index
+from mks.autocomplete import member_autocomplete
 
 import logging
 logger = logging.getLogger("open-knesset.mks.listeners")
@@ -42,3 +44,18 @@ def reset_current_knesset(sender, instance, **kwargs):
     Knesset.objects._current_knesset = None
 post_save.connect(reset_current_knesset, sender=Knesset)
 post_delete.connect(reset_current_knesset, sender=Knesset)
+
+
+def reset_party_index(sender, instance, created=False, **kwargs):
+    """Make sure the party interval index is rebuilt upon changes to
+    memberships and parties, or when a member is added"""
+    if sender is Member and not created:
+        return
+    invalidate_party_index()
+post_save.connect(reset_party_index, sender=Membership)
+post_delete.connect(reset_party_index, sender=Membership)
+post_save.connect(reset_party_index, sender=CoalitionMembership)
+post_delete.connect(reset_party_index, sender=CoalitionMembership)
+post_save.connect(reset_party_index, sender=Party)
+post_delete.connect(reset_party_index, sender=Party)
+post_save.connect(reset_party_index, sender=Member)
@@ -57,7 +57,18 @@ class NameAwareManager(models.Manager):
 
 
 class MemberManager(NameAwareManager):
-    pass
+    def recalc_average_weekly_presence_hours(self, member_ids):
+        """Bulk version of Member.recalc_average_weekly_presence_hours.
+        Averages are computed with one grouped query and written with update,
+        so the members are not saved and no signals are sent."""
+        from mks.models import Knesset, WeeklyPresence
+        d = Knesset.objects.current_knesset().start_date
+        averages = dict(WeeklyPresence.objects.filter(member__in=member_ids, date__gte=d).values_list(
+            'member').annotate(models.Avg('hours')).order_by())
+        for member_id in member_ids:
+            average = averages.get(member_id)
+            self.filter(pk=member_id).update(
+                average_weekly_presence_hours=round(average, 1) if average is not None else None)
 
 
 class PartyManager(NameAwareManager):
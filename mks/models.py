@@ -144,12 +144,8 @@ class Party(models.Model):
     def is_coalition_at(self, date):
         """Returns true is this party was a part of the coalition at the given
         date"""
-        memberships = CoalitionMembership.objects.filter(party=self)
-        for membership in memberships:
-            if (not membership.start_date or membership.start_date <= date) and \
-                    (not membership.end_date or membership.end_date >= date):
-                return True
-        return False
+        from mks.intervals import get_party_index
+        return get_party_index().is_coalition_at(self.id, date)
 
     @models.permalink
     def get_absolute_url(self):
@@ -198,6 +194,12 @@ class MemberAltname(models.Model):
         [person.del_alias(name) for person in persons]
 
 
+def member_name_with_dashes(name):
+    """The member name in the member url (see Member.get_absolute_url)"""
+    return name.replace(' - ', ' ').replace("'", "").replace(u"”", '').replace("`", "").replace("(", "").replace(
+        ")", "").replace(u'\xa0', ' ').replace(' ', '-')
+
+
 class Member(models.Model):
     id = models.IntegerField(primary_key=True,
                              help_text="Pay attention that the value of this field must correspond to the official Knesset member id")
@@ -283,9 +285,7 @@ class Member(models.Model):
         return self.name
 
     def name_with_dashes(self):
-        return self.name.replace(' - ', ' ').replace("'", "").replace(u"”", '').replace("`", "").replace("(",
-                                                                                                         "").replace(
-            ")", "").replace(u'\xa0', ' ').replace(' ', '-')
+        return member_name_with_dashes(self.name)
 
     def Party(self):
         return self.parties.all().order_by('-membership__start_date')[0]
@@ -296,8 +296,9 @@ class Member(models.Model):
     PartiesString.allow_tags = True
 
     def party_at(self, date):
-        from knesset_data_django.mks.utils import party_at
-        return party_at(self, date)
+        from mks.intervals import get_party_index
+        index = get_party_index()
+        return index.party(index.party_id_at(self.id, date))
 
     def for_votes(self):
         return self.votes.filter(voteaction__type='for')
@@ -0,0 +1,68 @@
+import datetime
+
+from django.test import TestCase
+
+from mks.intervals import get_party_index, parties_at
+from mks.models import Knesset, Party, Member, Membership, CoalitionMembership
+
+
+class TestPartyIntervalIndex(TestCase):
+    def setUp(self):
+        super(TestPartyIntervalIndex, self).setUp()
+        self.knesset = Knesset.objects.create(number=1, start_date=datetime.date(2010, 1, 1))
+        self.party_1 = Party.objects.create(name='party 1', knesset=self.knesset)
+        self.party_2 = Party.objects.create(name='party 2', knesset=self.knesset)
+        self.member = Member.objects.create(name='member')
+        self.membership = Membership.objects.create(member=self.member, party=self.party_1,
+                                                    start_date=datetime.date(2010, 1, 1))
+        Membership.objects.create(member=self.member, party=self.party_2, start_date=datetime.date(2012, 1, 1))
+        self.coalition = CoalitionMembership.objects.create(party=self.party_1, start_date=datetime.date(2010, 1, 1),
+                                                            end_date=datetime.date(2011, 1, 1))
+
+    def test_lookups(self):
+        self.assertEqual(self.member.party_at(datetime.date(2009, 1, 1)), None)
+        self.assertEqual(self.member.party_at(datetime.date(2011, 1, 1)), self.party_1)
+        # the membership that started last wins
+        self.assertEqual(self.member.party_at(datetime.date(2013, 1, 1)), self.party_2)
+        self.assertTrue(self.party_1.is_coalition_at(datetime.date(2011, 1, 1)))
+        self.assertFalse(self.party_1.is_coalition_at(datetime.date(2011, 1, 2)))
+        self.assertFalse(self.party_2.is_coalition_at(datetime.date(2010, 6, 1)))
+
+    def test_membership_without_start_date_wins(self):
+        # like the old party_at, which scanned memberships by -start_date,
+        # NULLs first on PostgreSQL
+        party_3 = Party.objects.create(name='party 3', knesset=self.knesset)
+        Membership.objects.create(member=self.member, party=party_3, end_date=datetime.date(2011, 6, 1))
+        self.assertEqual(self.member.party_at(datetime.date(2009, 1, 1)), party_3)
+        self.assertEqual(self.member.party_at(datetime.date(2011, 1, 1)), party_3)
+        self.assertEqual(self.member.party_at(datetime.date(2011, 6, 2)), self.party_1)
+        self.assertEqual(self.member.party_at(datetime.date(2013, 1, 1)), self.party_2)
+
+    def test_no_queries_once_built(self):
+        get_party_index().party(self.party_1.id)
+        with self.assertNumQueries(0):
+            self.member.party_at(datetime.date(2011, 1, 1))
+            self.party_1.is_coalition_at(datetime.date(2011, 1, 1))
+
+    def test_parties_are_not_shared(self):
+        party = self.member.party_at(datetime.date(2011, 1, 1))
+        party.name = 'changed'
+        self.assertEqual(self.member.party_at(datetime.date(2011, 1, 1)).name, 'party 1')
+
+    def test_changes_invalidate_the_index(self):
+        self.assertEqual(self.member.party_at(datetime.date(2013, 1, 1)), self.party_2)
+        Membership.objects.filter(party=self.party_2).delete()
+        self.assertEqual(self.member.party_at(datetime.date(2013, 1, 1)), self.party_1)
+        self.membership.end_date = datetime.date(2012, 1, 1)
+        self.membership.save()
+        self.assertEqual(self.member.party_at(datetime.date(2013, 1, 1)), None)
+
+        self.coalition.delete()
+        self.assertFalse(self.party_1.is_coalition_at(datetime.date(2010, 6, 1)))
+
+    def test_bulk_lookups(self):
+        other = Member.objects.create(name='other')
+        member_dates = [(self.member.id, datetime.date(2011, 1, 1)), (other.id, datetime.date(2011, 1, 1)),
+                        (self.member.id, datetime.datetime(2013, 1, 1, 12, 0))]
+        self.assertEqual(get_party_index().party_ids_at(member_dates), [self.party_1.id, None, self.party_2.id])
+        self.assertEqual(parties_at(member_dates), [self.party_1, None, self.party_2])
@@ -20,12 +20,13 @@ from actstream import actor_stream
 from actstream.models import Follow
 from hashnav.detail import DetailView
 
-from laws.enums import BillStages
-from laws.vote_choices import BILL_AGRR_STAGES
 from models import Member, Party, Knesset
+from mks.autocomplete import member_autocomplete
 from utils import percentile
-from laws.models import MemberVotingStatistics, Bill, VoteAction
+from laws.models import MemberVotingStatistics, Bill, VoteAction, PartyStatistics
+from laws.models.party_statistics import STAT_FIELDS
 from agendas.models import Agenda
+from agendas.scoring import members_agenda_values, empty_member_values
 
 from persons.models import PersonAlias, Person
 
@@ -325,15 +326,17 @@ class MemberDetailView(DetailView):
         agendas = agendas['top'] + agendas['bottom']
         for agenda in agendas:
             agenda.watched = False
-            agenda.totals = agenda.get_mks_totals(member)
         if self.request.user.is_authenticated():
+            # cached by get_selected_for_instance
+            agenda_values = members_agenda_values([member.id])[member.id]
             watched_agendas = self.request.user.profiles.get().agendas
             for watched_agenda in watched_agendas:
                 if watched_agenda in agendas:
                     agendas[agendas.index(watched_agenda)].watched = True
                 else:
-                    watched_agenda.score = watched_agenda.member_score(
-                        member)
+                    values = agenda_values.get(watched_agenda.id) or empty_member_values()
+                    watched_agenda.score = values['score']
+                    watched_agenda.totals = values['totals']
                     watched_agenda.watched = True
                     agendas.append(watched_agenda)
         agendas.sort(key=attrgetter('score'), reverse=True)
@@ -538,195 +541,47 @@ class PartyListView(ListView):
         ('committees', _('By average monthly committee meetings')),
     )
 
+    def _bar_scale(self, info, values):
+        """norm_factor and baseline of the graph bars of a stat page"""
+        if info == 'seats':
+            return 1, 0
+        if info == 'votes-per-seat':
+            return max(values + [0]) / 20, 0
+        if info in ('discipline', 'coalition-discipline'):
+            m = min(values + [100])
+            return (100.0 - m) / 15, m - 2
+        if info in ('residence-centrality', 'residence-economy'):
+            m = min(values + [10])
+            return (10.0 - m) / 15, m - 1
+        return min(values + [9999]) / 2, 0
+
     def get_context_data(self, **kwargs):
         context = super(PartyListView, self).get_context_data(**kwargs)
-        qs = context['object_list']
 
         info = self.kwargs['stat_type']
 
-        context['coalition'] = qs.filter(is_coalition=True)
-        context['opposition'] = qs.filter(is_coalition=False)
-
         context['friend_pages'] = self.pages
         context['stat_type'] = info
 
+        # the pages other than seats are drawn from the precomputed
+        # statistics, parties without them (yet) show as N/A
+        parties = list(self.object_list)
         if info == 'seats':
-            context['coalition'] = context['coalition'].annotate(
-                extra=Sum('number_of_seats')).order_by('-extra')
-            context['opposition'] = context['opposition'].annotate(
-                extra=Sum('number_of_seats')).order_by('-extra')
-            context['norm_factor'] = 1
-            context['baseline'] = 0
+            for party in parties:
+                party.extra = party.number_of_seats
+        else:
+            statistics = PartyStatistics.objects.for_knesset(Knesset.objects.current_knesset())
+            for party in parties:
+                party.extra = getattr(statistics.get(party.id), STAT_FIELDS[info], None)
 
-        if info == 'votes-per-seat':
-            m = 0
-            for party in chain(context['coalition'], context['opposition']):
-                party.extra = party.voting_statistics.votes_per_seat()
-                if party.extra > m:
-                    m = party.extra
-            context['norm_factor'] = m / 20
-            context['baseline'] = 0
-
-        if info == 'discipline':
-            m = 100
-            for party in context['coalition']:
-                party.extra = party.voting_statistics.discipline()
-                if party.extra < m:
-                    m = party.extra
-            for party in context['opposition']:
-                party.extra = party.voting_statistics.discipline()
-                if party.extra < m:
-                    m = party.extra
-            context['norm_factor'] = (100.0 - m) / 15
-            context['baseline'] = m - 2
-
-        if info == 'coalition-discipline':
-            m = 100
-            for party in context['coalition']:
-                party.extra = party.voting_statistics.coalition_discipline()
-                if party.extra < m:
-                    m = party.extra
-            for party in context['opposition']:
-                party.extra = party.voting_statistics.coalition_discipline()
-                if party.extra < m:
-                    m = party.extra
-            context['norm_factor'] = (100.0 - m) / 15
-            context['baseline'] = m - 2
-
-        if info == 'residence-centrality':
-            m = 10
-            for party in context['coalition']:
-                rc = [member.residence_centrality for member in party.members.all() if
-                      member.residence_centrality]
-                if rc:
-                    party.extra = round(float(sum(rc)) / len(rc), 1)
-                else:
-                    party.extra = 0
-                if party.extra < m:
-                    m = party.extra
-            for party in context['opposition']:
-                rc = [member.residence_centrality for member in party.members.all() if
-                      member.residence_centrality]
-                if rc:
-                    party.extra = round(float(sum(rc)) / len(rc), 1)
-                else:
-                    party.extra = 0
-                if party.extra < m:
-                    m = party.extra
-            context['norm_factor'] = (10.0 - m) / 15
-            context['baseline'] = m - 1
-
-        if info == 'residence-economy':
-            m = 10
-            for party in context['coalition']:
-                rc = [member.residence_economy for member in party.members.all() if
-                      member.residence_economy]
-                if rc:
-                    party.extra = round(float(sum(rc)) / len(rc), 1)
-                else:
-                    party.extra = 0
-                if party.extra < m:
-                    m = party.extra
-            for party in context['opposition']:
-                rc = [member.residence_economy for member in party.members.all() if
-                      member.residence_economy]
-                if rc:
-                    party.extra = round(float(sum(rc)) / len(rc), 1)
-                else:
-                    party.extra = 0
-                if party.extra < m:
-                    m = party.extra
-            context['norm_factor'] = (10.0 - m) / 15
-            context['baseline'] = m - 1
-
-        if info == 'bills-proposed':
-            m = 9999
-            start_date = Knesset.objects.current_knesset().start_date
-            for party in chain(context['coalition'], context['opposition']):
-                party.extra = round(float(
-                    len(set(Bill.objects.filter(
-                        proposers__current_party=party,
-                        proposals__date__gt=start_date).values_list('id', flat=True))
-                        )) / party.number_of_seats, 1)
-                if party.extra < m:
-                    m = party.extra
-            context['norm_factor'] = m / 2
-            context['baseline'] = 0
-
-        if info == 'bills-pre':
-            m = 9999
-            start_date = Knesset.objects.current_knesset().start_date
-            for party in chain(context['coalition'], context['opposition']):
-                party.extra = round(float(
-                    len(set(Bill.objects.filter(
-                        BILL_AGRR_STAGES['pre'],
-                        proposers__current_party=party,
-                        proposals__date__gt=start_date).values_list('id', flat=True))
-                        )) / party.number_of_seats, 1)
-                if party.extra < m:
-                    m = party.extra
-            context['norm_factor'] = m / 2
-            context['baseline'] = 0
-
-        if info == 'bills-first':
-            m = 9999
-            start_date = Knesset.objects.current_knesset().start_date
-            for party in chain(context['coalition'], context['opposition']):
-                party.extra = round(float(
-                    len(set(Bill.objects.filter(
-                        BILL_AGRR_STAGES['first'],
-                        proposers__current_party=party,
-                        proposals__date__gt=start_date).values_list('id', flat=True))
-                        )) / party.number_of_seats, 1)
-                if party.extra < m:
-                    m = party.extra
-            context['norm_factor'] = m / 2
-            context['baseline'] = 0
-
-        if info == 'bills-approved':
-            m = 9999
-            start_date = Knesset.objects.current_knesset().start_date
-            for party in chain(context['coalition'], context['opposition']):
-                party.extra = round(float(
-                    len(set(Bill.objects.filter(
-                        proposers__current_party=party,
-                        proposals__date__gt=start_date,
-                        stage=BillStages.APPROVED).values_list('id', flat=True))
-                        )) / party.number_of_seats, 1)
-                if party.extra < m:
-                    m = party.extra
-            context['norm_factor'] = m / 2
-            context['baseline'] = 0
-
-        if info == 'presence':
-            m = 9999
-            for party in chain(context['coalition'], context['opposition']):
-                awp = [member.average_weekly_presence() for member in
-                       party.members.all()]
-                awp = [a for a in awp if a]
-                if awp:
-                    party.extra = round(float(sum(awp)) / len(awp), 1)
-                else:
-                    party.extra = 0
-                if party.extra < m:
-                    m = party.extra
-            context['norm_factor'] = m / 2
-            context['baseline'] = 0
-
-        if info == 'committees':
-            m = 9999
-            for party in chain(context['coalition'], context['opposition']):
-                cmpm = [member.committee_meetings_per_month() for member in
-                        party.members.all()]
-                cmpm = [c for c in cmpm if c]
-                if cmpm:
-                    party.extra = round(float(sum(cmpm)) / len(cmpm), 1)
-                else:
-                    party.extra = 0
-                if party.extra < m:
-                    m = party.extra
-            context['norm_factor'] = m / 2
-            context['baseline'] = 0
+        context['norm_factor'], context['baseline'] = self._bar_scale(
+            info, [party.extra for party in parties if party.extra is not None])
+        for party in parties:
+            if party.extra is None:
+                party.extra = _('N/A')
+
+        context['coalition'] = [party for party in parties if party.is_coalition]
+        context['opposition'] = [party for party in parties if not party.is_coalition]
 
         context['title'] = _('Parties by %s') % dict(self.pages)[info]
         # prepare data for graphs. We'll be doing loops instead of list
@@ -805,14 +660,7 @@ def member_auto_complete(request):
     if not 'query' in request.GET:
         raise Http404
 
-    _suggestions = list(Member.objects.values('name', 'id', 'img_url', 'gender', 'is_current').filter(
-        name__icontains=request.GET['query'], is_current=True)[:30])
-
-    def _add_value(serialized_member):
-        result = {'value': serialized_member['name'], 'data': serialized_member}
-        return result
-
-    suggestions = map(lambda x: _add_value(x), _suggestions)
+    suggestions = member_autocomplete.search(request.GET['query'], 30)
     result = {'query': request.GET['query'], 'suggestions': suggestions}
 
     return HttpResponse(json.dumps(result), mimetype='application/json')
@@ -0,0 +1,207 @@
+# encoding: utf-8
+"""
+Notification digests of many users at once.
+
+Instead of scanning the activity stream of every followed actor for every
+user, the follows and LastSent rows of a batch of users are loaded with one
+query each, the new Actions of all the actors they follow are fanned out
+into per-actor buckets with one query per content type (and chunk of
+actors), and every action, actor header and agenda update is rendered only
+once, however many users follow it. Each user's email is then assembled
+from these shared fragments, and LastSent is updated in bulk.
+"""
+import datetime
+import logging
+from collections import defaultdict
+
+from actstream.models import Follow, Action
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.template import Context
+from django.template.loader import render_to_string, select_template
+
+from agendas.models import Agenda
+from mks.models import Member
+from notify.models import LastSent
+
+logger = logging.getLogger("open-knesset.notify.digest")
+
+ACTORS_CHUNK_SIZE = 500
+
+
+def _render(template_names, context):
+    """Render the first existing template of template_names"""
+    return select_template(template_names).render(Context(context))
+
+
+class Digests(object):
+    """
+    The updates to send to a batch of users about the actors they follow.
+
+    update_models are the models whose updates get a section of their own
+    (the updates of any other model go to the None section). Updates are
+    the actions since the update last sent to a user about an actor, or of
+    the last days_back days if none was sent.
+    """
+
+    def __init__(self, users, update_models, domain, days_back, now=None):
+        self.users = list(users)
+        self.update_models = update_models
+        self.domain = domain
+        self.now = now or datetime.datetime.now()
+        self.default_since = self.now - datetime.timedelta(days_back)
+        # user id -> [actor key, ...], an actor key being (content type id, object pk)
+        self.follows = {}
+        # (user id, actor key) -> (LastSent id, time)
+        self.last_sent = {}
+        # actor key -> followed object
+        self.actors = {}
+        # actor key -> [Action, ...], latest first
+        self.streams = defaultdict(list)
+        self._fragments = {}
+        self._sent = []
+        self._new = []
+        self._load()
+
+    def _load(self):
+        user_ids = [user.id for user in self.users]
+        for user_id in user_ids:
+            self.follows[user_id] = []
+        # sometime a user follows something several times. we want to filter that out
+        seen = set()
+        for user_id, content_type_id, object_id in Follow.objects.filter(user__in=user_ids).order_by('id').values_list(
+                'user', 'content_type', 'object_id'):
+            key = (content_type_id, unicode(object_id))
+            if (user_id, key) not in seen:
+                seen.add((user_id, key))
+                self.follows[user_id].append(key)
+        for last_sent_id, user_id, content_type_id, object_pk, time in LastSent.objects.filter(
+                user__in=user_ids).values_list('id', 'user', 'content_type', 'object_pk', 'time'):
+            self.last_sent[(user_id, (content_type_id, object_pk))] = (last_sent_id, time)
+
+        # the earliest update any follower needs, per actor
+        since = {}
+        for user_id, keys in self.follows.iteritems():
+            for key in keys:
+                user_since = self.since(user_id, key)
+                if key not in since or user_since < since[key]:
+                    since[key] = user_since
+        by_content_type = defaultdict(list)
+        for content_type_id, object_pk in sorted(since):
+            by_content_type[content_type_id].append(object_pk)
+
+        for content_type_id, object_pks in by_content_type.iteritems():
+            model = ContentType.objects.get_for_id(content_type_id).model_class()
+            if model is None:
+                logger.warning('follows of a missing model (content type %d). ignoring' % content_type_id)
+                continue
+            for i in range(0, len(object_pks), ACTORS_CHUNK_SIZE):
+                chunk = object_pks[i:i + ACTORS_CHUNK_SIZE]
+                for pk, actor in model._default_manager.in_bulk(chunk).iteritems():
+                    self.actors[(content_type_id, unicode(pk))] = actor
+                actions = Action.objects.filter(
+                    actor_content_type=content_type_id, actor_object_id__in=chunk,
+                    timestamp__gt=min(since[(content_type_id, pk)] for pk in chunk),
+                ).order_by('-timestamp').prefetch_related('target')
+                for action in actions:
+                    key = (content_type_id, action.actor_object_id)
+                    if key in self.actors and action.timestamp > since[key]:
+                        # the actor is already at hand, spare the templates a query
+                        setattr(action, Action.actor.cache_attr, self.actors[key])
+                        self.streams[key].append(action)
+
+    def since(self, user_id, key):
+        """The time of the last update sent to user_id about the actor key"""
+        last_sent = self.last_sent.get((user_id, key))
+        return last_sent[1] if last_sent else self.default_since
+
+    def _cached(self, key, render):
+        if key not in self._fragments:
+            self._fragments[key] = render()
+        return self._fragments[key]
+
+    def action_update(self, action):
+        """(text, html) of an action"""
+        def render():
+            verb = action.verb.replace(' ', '_')
+            return (_render(['activity/%s/action_email.txt' % verb, 'activity/action_email.txt'],
+                            {'action': action}),
+                    _render(['activity/%s/action_email.html' % verb, 'activity/action_email.html'],
+                            {'action': action, 'domain': self.domain}))
+        return self._cached(('action', action.id), render)
+
+    def actor_header(self, key):
+        """(text, html) header of the updates about the actor key"""
+        def render():
+            actor = self.actors[key]
+            model_template = actor.__class__.__name__.lower()
+            try:
+                model_name = actor.__class__._meta.verbose_name
+            except AttributeError:
+                logger.warning('follows %s has no __class__?' % actor.pk)
+                model_name = ""
+            return (_render(['notify/%s_header.txt' % model_template, 'notify/model_header.txt'],
+                            {'model': model_name, 'object': actor}),
+                    _render(['notify/%s_header.html' % model_template, 'notify/model_header.html'],
+                            {'model': model_name, 'object': actor, 'domain': self.domain}))
+        return self._cached(('header', key), render)
+
+    def agenda_update(self, agenda):
+        ''' generate the general update email for this agenda.
+            this will be added to the email if and only if there has been
+            some update in it's data.
+        '''
+        def render():
+            mks = agenda.selected_instances(Member)
+            template_name = 'notify/agenda_update'
+            return (render_to_string(template_name + '.txt', {'mks': mks, 'domain': self.domain}),
+                    render_to_string(template_name + '.html', {'mks': mks, 'domain': self.domain}))
+        return self._cached(('agenda', agenda.id), render)
+
+    def updates_for_user(self, user):
+        """
+        The updates to send to user, as two dicts (text and html) of update
+        model (or None) to a list of fragments. The LastSent of the actors
+        with updates (and of newly followed ones) are marked to be saved,
+        see save_last_sent.
+        """
+        updates = dict((model, []) for model in self.update_models)
+        updates_html = dict((model, []) for model in self.update_models)
+        for key in self.follows.get(user.id, []):
+            actor = self.actors.get(key)
+            if actor is None:
+                logger.warning('Follow object with None actor. ignoring')
+                continue
+            since = self.since(user.id, key)
+            stream = [action for action in self.streams[key] if action.timestamp > since]
+            last_sent = self.last_sent.get((user.id, key))
+            if last_sent is None:  # never updated about this actor
+                self._new.append(LastSent(user_id=user.id, content_type_id=key[0], object_pk=key[1],
+                                          time=self.now))
+            elif stream:
+                self._sent.append(last_sent[0])
+            if not stream:
+                continue
+            model_class = actor.__class__
+            model = model_class if model_class in updates else None
+            header, header_html = self.actor_header(key)
+            updates[model].append(header)
+            updates_html[model].append(header_html)
+            for action in stream:
+                txt, html = self.action_update(action)
+                updates[model].append(txt)
+                updates_html[model].append(html)
+            if model_class == Agenda:
+                txt, html = self.agenda_update(actor)
+                updates[model].append(txt)
+                updates_html[model].append(html)
+        return updates, updates_html
+
+    def save_last_sent(self):
+        """Save the LastSent times of the updates assembled so far"""
+        with transaction.atomic():
+            if self._sent:
+                LastSent.objects.filter(id__in=self._sent).update(time=self.now)
+            if self._new:
+                LastSent.objects.bulk_create(self._new, batch_size=ACTORS_CHUNK_SIZE)
+        self._sent, self._new = [], []
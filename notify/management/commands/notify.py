@@ -1,7 +1,5 @@
 from __future__ import absolute_import
 from django.core.management.base import NoArgsCommand
-from django.contrib.auth.models import User, Group
-from django.contrib.contenttypes.models import ContentType
 from django.contrib.sites.models import Site
 from django.utils.translation import ugettext as _
 from django.utils import translation
@@ -9,18 +7,18 @@ from django.template.loader import render_to_string
 from django.template import TemplateDoesNotExist
 from django.conf import settings
 from django.core.cache import cache
-import datetime
+from django.db import connection
+from multiprocessing.pool import ThreadPool
 from optparse import make_option
 import logging
 
 logger = logging.getLogger("open-knesset.notify")
 
-from actstream.models import Follow, Action
 from mailer import send_html_mail
 from mks.models import Member
 from laws.models import Bill, get_debated_bills
 from agendas.models import Agenda
-from notify.models import LastSent
+from notify.digest import Digests
 from user.models import UserProfile
 from committees.models import Topic
 
@@ -34,6 +32,7 @@ class Command(NoArgsCommand):
     from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', 'email@example.com')
     days_back = getattr(settings, 'DEFAULT_NOTIFICATION_DAYS_BACK', 10)
     lang = getattr(settings, 'LANGUAGE_CODE', 'he')
+    users_chunk_size = 200
 
     @property
     def domain(self):
@@ -41,26 +40,24 @@ class Command(NoArgsCommand):
             self._domain = Site.objects.get_current().domain
         return self._domain
 
+    @property
+    def model_headers(self):
+        if not hasattr(self, '_model_headers'):
+            self._model_headers = map(self.get_model_headers, self.update_models)
+        return self._model_headers
+
     option_list = NoArgsCommand.option_list + (
         make_option('--daily', action='store_true', dest='daily',
                     help="send notifications to users that requested a daily update"),
         make_option('--weekly', action='store_true', dest='weekly',
-                    help="send notifications to users that requested a weekly update"))
+                    help="send notifications to users that requested a weekly update"),
+        make_option('--workers', action='store', type='int', dest='workers', default=1,
+                    help="number of threads queueing the emails for sending"))
 
-    def agenda_update(self, agenda):
-        ''' generate the general update email for this agenda.
-            this will be called, and its output added to the email,
-            if and only if there has been some update in it's data.
-        '''
-        mks = agenda.selected_instances(Member)
-        template_name = 'notify/agenda_update'
-        update_txt = render_to_string(template_name + '.txt',
-                                      {'mks': mks,
-                                       'domain': self.domain})
-        update_html = render_to_string(template_name + '.html',
-                                       {'mks': mks,
-                                        'domain': self.domain})
-        return (update_txt, update_html)
+    def __init__(self, *args, **kwargs):
+        super(Command, self).__init__(*args, **kwargs)
+        self._party_num_members = {}
+        self._debated_bills = None
 
     @classmethod
     def get_model_headers(cls, model):
@@ -75,88 +72,47 @@ class Command(NoArgsCommand):
         except AttributeError:
             return (model, _('Other Updates'), '<h2>%s</h2>' % _('Other Updates'))
 
-    def get_email_for_user(self, user):
-        ''' return the body text and html for a user's email '''
-        updates = dict(zip(self.update_models, ([] for x in self.update_models)))  # will contain the updates to be sent
-        updates_html = dict(zip(self.update_models, ([] for x in self.update_models)))
-        follows = Follow.objects.filter(user=user)  # everything this user is following
-        # sometime a user follows something several times. we want to filter that out:
-        follows = set([f.actor for f in follows])
-        for f in follows:
-            if not f:
-                logger.warning('Follow object with None actor. ignoring')
-                continue
-            model_class = f.__class__
-            model_template = f.__class__.__name__.lower()
-            try:
-                model_name = f.__class__._meta.verbose_name
-            except AttributeError:
-                logger.warning('follows %d has no __class__?' % f.id)
-                model_name = ""
-            content_type = ContentType.objects.get_for_model(f)
-            if model_class in updates:
-                key = model_class
-            else:
-                key = None  # put all updates for 'other' classes at the 'None' group
-            try:  # get actions that happened since last update
-                last_sent = LastSent.objects.get(user=user, content_type=content_type, object_pk=f.id)
-                last_sent_time = last_sent.time
-                stream = Action.objects.filter(actor_content_type=content_type,
-                                               actor_object_id=f.id,
-                                               timestamp__gt=last_sent_time,
-                                               ).order_by('-timestamp')
-                if stream:  # if there are updates to be sent,
-                    last_sent.save()  # update timestamp of last sent
-            except LastSent.DoesNotExist:  # never updated about this actor, send some updates
-                stream = Action.objects.filter(actor_content_type=content_type,
-                                               actor_object_id=f.id,
-                                               timestamp__gt=datetime.datetime.now() - datetime.timedelta(
-                                                   self.days_back),
-                                               ).order_by('-timestamp')
-                last_sent = LastSent.objects.create(user=user, content_type=content_type, object_pk=f.id)
-            if stream:  # this actor has some updates
-                try:  # genereate the appropriate header for this actor class
-                    header = render_to_string(('notify/%(model)s_header.txt' % {'model': model_template}),
-                                              {'model': model_name, 'object': f})
-                except TemplateDoesNotExist:
-                    header = render_to_string(('notify/model_header.txt'), {'model': model_name, 'object': f})
-                try:
-                    header_html = render_to_string(('notify/%(model)s_header.html' % {'model': model_template}),
-                                                   {'model': model_name, 'object': f, 'domain': self.domain})
-                except TemplateDoesNotExist:
-                    header_html = render_to_string(('notify/model_header.html'),
-                                                   {'model': model_name, 'object': f, 'domain': self.domain})
-                updates[key].append(header)
-                updates_html[key].append(header_html)
-
-                for action_instance in stream:  # now generate the updates themselves
-                    try:
-                        action_output = render_to_string(
-                            ('activity/%(verb)s/action_email.txt' % {'verb': action_instance.verb.replace(' ', '_')}),
-                            {'action': action_instance}, None)
-                    except TemplateDoesNotExist:  # fallback to the generic template
-                        action_output = render_to_string(('activity/action_email.txt'), {'action': action_instance},
-                                                         None)
-                    try:
-                        action_output_html = render_to_string(
-                            ('activity/%(verb)s/action_email.html' % {'verb': action_instance.verb.replace(' ', '_')}),
-                            {'action': action_instance, 'domain': self.domain}, None)
-                    except TemplateDoesNotExist:  # fallback to the generic template
-                        action_output_html = render_to_string(('activity/action_email.html'),
-                                                              {'action': action_instance, 'domain': self.domain}, None)
-                        updates[key].append(action_output)
-                    updates_html[key].append(action_output_html)
-
-                if model_class == Agenda:
-                    txt, html = self.agenda_update(f)
-                    updates[key].append(txt)
-                    updates_html[key].append(html)
+    def get_digests(self, users):
+        return Digests(users, self.update_models, self.domain, self.days_back)
 
+    def party_membership(self, user, userprofile):
+        ''' return the text and html of the party membership section of a
+            user's email
+        '''
+        party = userprofile.party
+        if party:
+            num_members = self._party_num_members.get(party.id) or cache.get('party_num_members_%d' % party.id,
+                                                                             None)
+            if not num_members:
+                num_members = party.userprofile_set.count()
+                cache.set('party_num_members_%d' % party.id,
+                          num_members,
+                          settings.LONG_CACHE_TIME)
+            self._party_num_members[party.id] = num_members
+        else:
+            num_members = None
+        if self._debated_bills is None:
+            self._debated_bills = get_debated_bills() or []
+
+        template_name = 'notify/party_membership'
+        context = {'user': user,
+                   'userprofile': userprofile,
+                   'num_members': num_members,
+                   'bills': self._debated_bills,
+                   'domain': self.domain}
+        return (render_to_string(template_name + '.txt', context),
+                render_to_string(template_name + '.html', context))
+
+    def get_email_body(self, digests, user, userprofile=None):
+        ''' return the body text and html for a user's email, assembled
+            from the updates in digests
+        '''
+        updates, updates_html = digests.updates_for_user(user)
         email_body = []
         email_body_html = []
 
         # Add the updates for followed models
-        for (model_class, title, title_html) in map(self.get_model_headers, self.update_models):
+        for (model_class, title, title_html) in self.model_headers:
             if updates[model_class]:  # this model has some updates, add it to the email
                 email_body.append(title.format())
                 email_body.append('\n'.join(updates[model_class]))
@@ -164,44 +120,44 @@ class Command(NoArgsCommand):
                 email_body_html.append(''.join(updates_html[model_class]))
         if email_body or email_body_html:
             # Generate party membership section if needed
-            up = UserProfile.objects.filter(user=user).select_related('party')
-            if up:
-                up = up[0]
-                party = up.party
-                if party:
-                    num_members = cache.get('party_num_members_%d' % party.id,
-                                            None)
-                    if not num_members:
-                        num_members = party.userprofile_set.count()
-                        cache.set('party_num_members_%d' % party.id,
-                                  num_members,
-                                  settings.LONG_CACHE_TIME)
-                else:
-                    num_members = None
-                debated_bills = get_debated_bills() or []
-
-                template_name = 'notify/party_membership'
-                party_membership_txt = render_to_string(template_name + '.txt',
-                                                        {'user': user,
-                                                         'userprofile': up,
-                                                         'num_members': num_members,
-                                                         'bills': debated_bills,
-                                                         'domain': self.domain})
-                party_membership_html = render_to_string(template_name + '.html',
-                                                         {'user': user,
-                                                          'userprofile': up,
-                                                          'num_members': num_members,
-                                                          'bills': debated_bills,
-                                                          'domain': self.domain})
+            if userprofile is None:
+                userprofile = UserProfile.objects.filter(user=user).select_related('party').first()
+            if userprofile:
+                party_membership_txt, party_membership_html = self.party_membership(user, userprofile)
+                email_body.insert(0, party_membership_txt)
+                email_body_html.insert(0, party_membership_html)
             else:
                 logger.warning('Can\'t find user profile')
-        if email_body:
-            email_body.insert(0, party_membership_txt)
-        if email_body_html:
-            email_body_html.insert(0, party_membership_html)
 
         return (email_body, email_body_html)
 
+    def get_email_for_user(self, user):
+        ''' return the body text and html for a user's email '''
+        digests = self.get_digests([user])
+        email = self.get_email_body(digests, user)
+        digests.save_last_sent()
+        return email
+
+    def get_message(self, user, email_body, email_body_html):
+        ''' return the send_html_mail arguments of a user's email '''
+        header = render_to_string(('notify/header.txt'), {'user': user})
+        footer = render_to_string(('notify/footer.txt'), {'user': user, 'domain': self.domain})
+        header_html = render_to_string(('notify/header.html'), {'user': user})
+        footer_html = render_to_string(('notify/footer.html'), {'user': user, 'domain': self.domain})
+        return (_('Open Knesset Updates'), "%s\n%s\n%s" % (header, '\n'.join(email_body), footer),
+                "%s\n%s\n%s" % (header_html, ''.join(email_body_html), footer_html),
+                self.from_email,
+                [user.email])
+
+    @staticmethod
+    def send_messages(messages):
+        try:
+            for message in messages:
+                send_html_mail(*message)
+        finally:
+            # every worker thread opens a db connection of its own
+            connection.close()
+
     def handle_noargs(self, **options):
 
         daily = options.get('daily', False)
@@ -218,32 +174,30 @@ class Command(NoArgsCommand):
         if weekly:
             email_notification.append('W')
 
-        queued = 0
-        g = Group.objects.get(name='Valid Email')
-        for user in User.objects.filter(groups=g,
-                                        profiles__isnull=False) \
-                .exclude(email=''):
-            try:
-                user_profile = user.profiles.get()
-            except UserProfile.DoesNotExist:
-                logger.warn('can\'t access user %d userprofile' % user.id)
-                continue
-            if (user_profile.email_notification in email_notification):
-                # if this user has requested emails in the frequency we are
-                # handling now
-                email_body, email_body_html = self.get_email_for_user(user)
+        # users that requested emails in the frequency we are handling now
+        profiles = list(UserProfile.objects.filter(
+            user__groups__name='Valid Email', email_notification__in=email_notification).exclude(
+            user__email='').select_related('user', 'party').order_by('user'))
+        messages = []
+        for i in range(0, len(profiles), self.users_chunk_size):
+            chunk = profiles[i:i + self.users_chunk_size]
+            digests = self.get_digests([profile.user for profile in chunk])
+            for profile in chunk:
+                email_body, email_body_html = self.get_email_body(digests, profile.user, profile)
                 if email_body:  # there are some updates. generate email
-                    header = render_to_string(('notify/header.txt'), {'user': user})
-                    footer = render_to_string(('notify/footer.txt'), {'user': user, 'domain': self.domain})
-                    header_html = render_to_string(('notify/header.html'), {'user': user})
-                    footer_html = render_to_string(('notify/footer.html'), {'user': user, 'domain': self.domain})
-                    send_html_mail(_('Open Knesset Updates'), "%s\n%s\n%s" % (header, '\n'.join(email_body), footer),
-                                   "%s\n%s\n%s" % (header_html, ''.join(email_body_html), footer_html),
-                                   self.from_email,
-                                   [user.email],
-                                   )
-                    queued += 1
-
-        logger.info("%d email notifications queued for sending" % queued)
+                    messages.append(self.get_message(profile.user, email_body, email_body_html))
+            digests.save_last_sent()
+
+        workers = options.get('workers') or 1
+        if workers > 1 and len(messages) > 1:
+            pool = ThreadPool(workers)
+            pool.map(self.send_messages, [messages[i::workers] for i in range(workers)])
+            pool.close()
+            pool.join()
+        else:
+            for message in messages:
+                send_html_mail(*message)
+
+        logger.info("%d email notifications queued for sending" % len(messages))
 
         translation.deactivate()
@@ -14,6 +14,7 @@ from laws.models import  Vote
 from management.commands import notify
 from actstream import follow, action
 from models import LastSent
+from digest import Digests
 
 
 class SimpleTest(TestCase):
@@ -44,6 +45,29 @@ class SimpleTest(TestCase):
         email, email_html = cmd.get_email_for_user(self.jacob)
         self.assertEqual(email, [])
 
+    def test_digests(self):
+        joe = User.objects.create_user('joe', 'joe@example.com', 'JOE')
+        follow(self.jacob, self.mk_1)
+        follow(joe, self.mk_1)
+        follow(joe, self.agenda_1)
+        action.send(self.mk_1, verb='farted on', target=self.agenda_1)
+        digests = Digests([self.jacob, joe], [Member, Agenda, None], 'example.com', 10)
+        updates, updates_html = digests.updates_for_user(self.jacob)
+        self.assertIn(u'mk 1 farted on agenda 1', '\n'.join(updates[Member]))
+        self.assertEqual(updates[Agenda], [])
+        updates, updates_html = digests.updates_for_user(joe)
+        self.assertIn(u'mk 1 farted on agenda 1', '\n'.join(updates[Member]))
+        digests.save_last_sent()
+        self.assertEqual(LastSent.objects.count(), 3)
+
+        action.send(self.agenda_1, verb='supports', target=self.mk_1)
+        digests = Digests([self.jacob, joe], [Member, Agenda, None], 'example.com', 10)
+        updates, updates_html = digests.updates_for_user(self.jacob)
+        self.assertEqual(updates[Member], [])
+        updates, updates_html = digests.updates_for_user(joe)
+        self.assertEqual(updates[Member], [])
+        self.assertIn(u'supports mk 1', '\n'.join(updates[Agenda]))
+
     def test_LastsSent_unicode(self):
         dt = datetime(2013, 2, 3)
         lastsent = LastSent.objects.create(user = self.jacob, content_object = self.mk_1)
@@ -145,6 +145,16 @@ def tag_vote(vote):
 #     return res
 
 
+def invalidate_tags_names(sender, **kwargs):
+    # the tags used for suggestions are reloaded on next use
+    from ok_tag.tag_suggestions import invalidate_tags_names
+    invalidate_tags_names()
+
+
 post_save.connect(add_tags_to_related_objects, sender=TaggedItem)
 
 post_delete.connect(remove_tags_from_related_objects, sender=TaggedItem)
+
+for model in (Tag, TaggedItem):
+    post_save.connect(invalidate_tags_names, sender=model, dispatch_uid='invalidate_tags_names')
+    post_delete.connect(invalidate_tags_names, sender=model, dispatch_uid='invalidate_tags_names')
@@ -3,8 +3,11 @@
 from tagging.models import Tag, TaggedItem
 from django.contrib.contenttypes.models import ContentType
 from laws.models import Vote, Bill
-from committees.models import CommitteeMeeting
+from committees.models import CommitteeMeeting, ProtocolPart
+from knesset.exports import iterate_by_key
 
+from collections import defaultdict
+import json
 import operator
 
 
@@ -35,6 +38,7 @@ def sum_add_two_dictionaries(dict, dict_to_add):
 # A list of prefix charcters to use in tag extraction
 prefixes = [u'ב', u'ו', u'ה', u'מ', u'מה', u'ל', u'']
 _all_tags_names = []
+_tag_matcher = None
 
 
 def all_tags_names():
@@ -54,28 +58,73 @@ def all_tags_names():
     return _all_tags_names
 
 
+def invalidate_tags_names(**kwargs):
+    '''Forget the tags list, it is reloaded (and the matcher rebuilt) on
+    next use'''
+    global _all_tags_names, _tag_matcher
+    _all_tags_names = []
+    _tag_matcher = None
+
+
+class TagMatcher(object):
+    """Counts the tags found in a text in a single pass over its words.
+    A word matches a tag if it is the tag name, possibly with one of the
+    prefixes, so every word and its forms without a prefix are looked up
+    in the set of tag names, instead of comparing every word to every
+    variation of every tag."""
+
+    def __init__(self, names):
+        self.names = names
+        self._names = frozenset(names)
+        self._prefixes = [prefix for prefix in prefixes if prefix]
+
+    def count(self, text):
+        result = {}
+        if text is None:
+            return result
+        names = self._names
+        for word in text.split():
+            found = [word] if word in names else []
+            for prefix in self._prefixes:
+                if word.startswith(prefix):
+                    tag = word[len(prefix):]
+                    if tag in names and tag not in found:
+                        found.append(tag)
+            for tag in found:
+                result[tag] = result.get(tag, 0) + 1
+        return result
+
+
+def tag_matcher():
+    '''The matcher of the current tags list'''
+    global _tag_matcher
+    names = all_tags_names()
+    if _tag_matcher is None or _tag_matcher.names is not names:
+        _tag_matcher = TagMatcher(names)
+    return _tag_matcher
+
+
 def get_tags_in_text(text):
     """Returns a dictionary, the keys are tags found in text, and the values are the number of occurrences in text"""
+    return tag_matcher().count(text)
 
-    result_dict = {}
-    words = text.split() if text is not None else []
-
-    # look for tag in word
-    for tag in all_tags_names():
-        # create tag variations according to prefixes
-        tag_variations = [(p + tag) for p in prefixes]
 
-        # find number of occurences of tags for each word
-        occurence_count = 0
-        for word in words:
-            if word in tag_variations:
-                occurence_count += 1
+def count_tags(text_list):
+    '''Returns a dictionary of the tags found in the texts of text_list to
+        their number of occurrences'''
+    matcher = tag_matcher()
+    tags_occurrences = {}
+    for text_to_extract in text_list:
+        sum_add_two_dictionaries(tags_occurrences, matcher.count(text_to_extract))
+    return tags_occurrences
 
-        # if tag found more than once, add them
-        if occurence_count > 0:
-            result_dict[tag] = result_dict.get(tag, 0) + occurence_count
 
-    return result_dict
+def sort_suggested_tags(current_tags, tags_occurrences):
+    '''Returns the items of tags_occurrences without current_tags, sorted
+        from most occuring tags to least occuring tags'''
+    current_names = set(tag.name for tag in current_tags)
+    suggestions = [(name, count) for name, count in tags_occurrences.iteritems() if name not in current_names]
+    return sorted(suggestions, key=operator.itemgetter(1), reverse=True)
 
 
 def extract_suggested_tags(current_tags, text_list):
@@ -83,17 +132,24 @@ def extract_suggested_tags(current_tags, text_list):
         and the values are the number of occurrences in arguments text.
         current_tags are removed from final list.
         The list is sorted from most occuring tags to least occuring tags'''
-
-    tags_occurrences = {}
-
-    # find occurences of tags in text
-    for text_to_extract in text_list:
-        sum_add_two_dictionaries(tags_occurrences, get_tags_in_text(text_to_extract))
-
-    # remove tags that are already tagged
-    for tag in current_tags:
-        if tag.name in tags_occurrences:
-            del tags_occurrences[tag.name]
-
-    # sort suggestions
-    return sorted(tags_occurrences.iteritems(), key=operator.itemgetter(1), reverse=True)
+    return sort_suggested_tags(current_tags, count_tags(text_list))
+
+
+def update_meetings_tag_suggestions(meetings, chunk_size=100):
+    '''Count the tags in the topics and protocols of meetings (a queryset)
+        and store them in their suggested_tags, see
+        CommitteeMeeting.get_tag_suggestions. Returns the number of meetings
+        updated.'''
+    updated = 0
+    for pks, chunk in iterate_by_key(meetings, chunk_size):
+        texts = defaultdict(list)
+        for meeting_id, topics in chunk.values_list('id', 'topics'):
+            texts[meeting_id].append(topics)
+        for meeting_id, body in ProtocolPart.objects.filter(meeting__in=pks).order_by(
+                'meeting', 'order', 'id').values_list('meeting', 'body'):
+            texts[meeting_id].append(body)
+        for meeting_id in pks:
+            CommitteeMeeting.objects.filter(pk=meeting_id).update(
+                suggested_tags=json.dumps(count_tags(texts[meeting_id]).items()))
+        updated += len(pks)
+    return updated
@@ -1,3 +1,4 @@
+# encoding: utf-8
 from datetime import datetime
 
 from django.contrib.auth.models import User
@@ -8,7 +9,7 @@ from tagging.models import Tag
 
 import ok_tag.tag_suggestions
 from auxiliary.models import TagSuggestion
-from committees.models import CommitteeMeeting, Committee
+from committees.models import CommitteeMeeting, Committee, ProtocolPart
 from laws.models import Bill, Law
 from ok_tag.views import suggest_tag_post
 
@@ -77,3 +78,36 @@ class SuggestionsTestCase(TestCase):
         text = "tag1 ate the cat"
         tags_count = ok_tag.tag_suggestions.get_tags_in_text(text)
         self.assertEqual(tags_count['tag1'], 1)
+
+    def tearDown(self):
+        ok_tag.tag_suggestions.invalidate_tags_names()
+        super(SuggestionsTestCase, self).tearDown()
+
+    def test_prefixes(self):
+        ok_tag.tag_suggestions._all_tags_names = [u'חינוך', u'תקציב']
+        tags_count = ok_tag.tag_suggestions.get_tags_in_text(u'בחינוך והתקציב, חינוך וחינוכי')
+        self.assertEqual(tags_count, {u'חינוך': 2})
+        tags_count = ok_tag.tag_suggestions.get_tags_in_text(u'בחינוך מהתקציב חינוך וחינוכי')
+        self.assertEqual(tags_count, {u'חינוך': 2, u'תקציב': 1})
+
+    def test_meeting_suggestions(self):
+        committee = Committee.objects.create(name='committee')
+        meeting = CommitteeMeeting.objects.create(committee=committee, date=datetime.now(), topics=u'tag1 tag2')
+        ProtocolPart.objects.create(meeting=meeting, order=1, body=u'tag2 and tag2')
+        meeting.tags = 'tag1 tag2'
+        other_meeting = CommitteeMeeting.objects.create(committee=committee, date=datetime.now())
+        other_meeting.tags = 'tag2'
+        self.assertEqual(meeting.get_tag_suggestions(), [])
+        self.assertEqual(ok_tag.tag_suggestions.update_meetings_tag_suggestions(CommitteeMeeting.objects.all()), 2)
+        other_meeting = CommitteeMeeting.objects.get(pk=other_meeting.pk)
+        self.assertEqual(other_meeting.get_tag_suggestions(), [])
+        meeting = CommitteeMeeting.objects.get(pk=meeting.pk)
+        # the meeting is already tagged with both
+        self.assertEqual(meeting.get_tag_suggestions(), [])
+        meeting.tags = 'tag1'
+        self.assertEqual(meeting.get_tag_suggestions(), [(u'tag2', 3)])
+
+        # computed and stored on first use
+        new_meeting = CommitteeMeeting.objects.create(committee=committee, date=datetime.now(), topics=u'tag2')
+        self.assertEqual(new_meeting.get_tag_suggestions(), [(u'tag2', 1)])
+        self.assertIsNotNone(CommitteeMeeting.objects.get(pk=new_meeting.pk).suggested_tags)
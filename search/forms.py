@@ -0,0 +1,19 @@
+from django import forms
+from django.utils.translation import ugettext_lazy as _
+
+from search.indexer import KINDS
+
+
+class SearchForm(forms.Form):
+    q = forms.CharField(label=_('Search'))
+    kind = forms.MultipleChoiceField(choices=[(kind, kind) for kind in KINDS], required=False)
+    committee = forms.IntegerField(required=False)
+    speaker = forms.IntegerField(required=False)
+    date_from = forms.DateField(required=False)
+    date_to = forms.DateField(required=False)
+    page = forms.IntegerField(min_value=1, required=False)
+
+    def search_filters(self):
+        data = self.cleaned_data
+        return dict(kinds=data['kind'], committee=data['committee'], speaker=data['speaker'],
+                    date_from=data['date_from'], date_to=data['date_to'])
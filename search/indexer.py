@@ -0,0 +1,244 @@
+# encoding: utf-8
+"""
+The site search index.
+
+Protocol parts, bills, votes and members are indexed in two tables:
+SearchDocument holds what results are shown and filtered (faceted) by, and
+SearchTerm is an inverted index from the terms of a document (see
+search.tokenizer) to the document, weighted by their number of occurrences.
+The index lives in the site's own database, so it works the same on SQLite
+and PostgreSQL and needs no outside service.
+
+Objects are indexed when they are saved (see search.listeners), protocol
+parts also when a meeting's protocol is parsed (see index_meeting), and
+the whole index can be rebuilt with the rebuild_search_index command.
+"""
+import logging
+from collections import OrderedDict
+
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from committees.models import ProtocolPart
+from knesset.exports import iterate_by_key
+from laws.models import Bill, Vote
+from mks.models import Member
+from search.models import SearchDocument, SearchTerm
+from search.tokenizer import index_terms, query_terms
+
+logger = logging.getLogger("open-knesset.search.indexer")
+
+CHUNK_SIZE = 200
+EXCERPT_LENGTH = 300
+# a term in the title of a document counts as much as TITLE_WEIGHT
+# occurrences in its text
+TITLE_WEIGHT = 5
+TITLE_MAX_LENGTH = SearchDocument._meta.get_field('title').max_length
+PAGE_SIZE = 20
+
+
+def _excerpt(text):
+    text = u' '.join((text or u'').split())
+    if len(text) > EXCERPT_LENGTH:
+        text = text[:EXCERPT_LENGTH].rsplit(u' ', 1)[0] + u'...'
+    return text
+
+
+class SearchKind(object):
+    """How the objects of a model are indexed. Subclasses return the
+    document fields of an object from document()"""
+    name = None
+    model = None
+    related = ()
+
+    def queryset(self):
+        return self.model._default_manager.select_related(*self.related)
+
+    def document(self, obj):
+        raise NotImplementedError
+
+
+class ProtocolPartKind(SearchKind):
+    name = 'protocol'
+    model = ProtocolPart
+    related = ('meeting__committee',)
+
+    def document(self, part):
+        meeting = part.meeting
+        return dict(title=u'%s - %s' % (meeting.committee.name, meeting.date.strftime('%d/%m/%Y')),
+                    text=u'%s\n%s' % (part.header or u'', part.body or u''), excerpt=_excerpt(part.body),
+                    url=part.get_absolute_url(), date=meeting.date, committee_id=meeting.committee_id,
+                    speaker_id=part.speaker_id)
+
+
+class BillKind(SearchKind):
+    name = 'bill'
+    model = Bill
+
+    def document(self, bill):
+        return dict(title=bill.full_title or bill.title, text=u'%s\n%s' % (bill.title, bill.popular_name),
+                    excerpt=_excerpt(bill.popular_name), url=bill.get_absolute_url(), date=bill.stage_date)
+
+
+class VoteKind(SearchKind):
+    name = 'vote'
+    model = Vote
+
+    def document(self, vote):
+        return dict(title=vote.title, text=vote.summary or u'', excerpt=_excerpt(vote.summary),
+                    url=vote.get_absolute_url(), date=vote.time.date())
+
+
+class MemberKind(SearchKind):
+    name = 'member'
+    model = Member
+
+    def document(self, member):
+        return dict(title=member.name, text=member.current_role_descriptions or u'',
+                    excerpt=_excerpt(member.current_role_descriptions), url=member.get_absolute_url())
+
+
+KINDS = OrderedDict((kind.name, kind) for kind in (ProtocolPartKind(), BillKind(), VoteKind(), MemberKind()))
+
+
+def kind_of_model(model):
+    for kind in KINDS.itervalues():
+        if kind.model is model:
+            return kind
+    return None
+
+
+def _unindex(kind_name, object_ids):
+    documents = SearchDocument.objects.filter(kind=kind_name, object_id__in=object_ids)
+    SearchTerm.objects.filter(document__in=documents).delete()
+    documents.delete()
+
+
+def index_objects(kind_name, objects):
+    """(Re)index objects of the kind named kind_name"""
+    kind = KINDS[kind_name]
+    documents = OrderedDict()
+    terms = {}
+    for obj in objects:
+        fields = kind.document(obj)
+        text = fields.pop('text')
+        object_terms = index_terms(text)
+        object_terms.update(index_terms(fields['title'], TITLE_WEIGHT))
+        # bill full titles can be longer than the column
+        fields['title'] = fields['title'][:TITLE_MAX_LENGTH]
+        documents[obj.pk] = SearchDocument(kind=kind.name, object_id=obj.pk, **fields)
+        terms[obj.pk] = object_terms
+    if not documents:
+        return
+    with transaction.atomic():
+        _unindex(kind.name, documents.keys())
+        SearchDocument.objects.bulk_create(documents.values(), batch_size=CHUNK_SIZE)
+        ids = SearchDocument.objects.filter(kind=kind.name, object_id__in=documents.keys()).values_list(
+            'object_id', 'id')
+        SearchTerm.objects.bulk_create(
+            [SearchTerm(term=term, document_id=document_id, weight=weight)
+             for object_id, document_id in ids for term, weight in terms[object_id].iteritems()],
+            batch_size=CHUNK_SIZE * 10)
+
+
+def unindex_objects(kind_name, object_ids):
+    with transaction.atomic():
+        _unindex(kind_name, object_ids)
+
+
+def index_meeting(meeting):
+    """(Re)index the protocol parts of a committee meeting"""
+    kind = KINDS['protocol']
+    parts = kind.queryset().filter(meeting=meeting)
+    stale = set(SearchDocument.objects.filter(kind=kind.name, committee=meeting.committee_id,
+                                              date=meeting.date).values_list('object_id', flat=True))
+    for pks, chunk in iterate_by_key(parts, CHUNK_SIZE):
+        index_objects(kind.name, chunk)
+        stale.difference_update(pks)
+    # parts of a reparsed protocol that are gone, unless they belong to
+    # another meeting of the committee on the same day
+    stale.difference_update(ProtocolPart.objects.filter(id__in=stale).values_list('id', flat=True))
+    if stale:
+        unindex_objects(kind.name, stale)
+
+
+def rebuild(kind_names=None):
+    """Reindex all objects of the kinds named kind_names (all by default)"""
+    for kind_name in kind_names or KINDS.keys():
+        kind = KINDS[kind_name]
+        indexed = 0
+        for pks, chunk in iterate_by_key(kind.queryset(), CHUNK_SIZE):
+            index_objects(kind.name, chunk)
+            indexed += len(pks)
+        stale = set(SearchDocument.objects.filter(kind=kind.name).values_list('object_id', flat=True))
+        stale.difference_update(kind.model._default_manager.filter(pk__in=stale).values_list('pk', flat=True))
+        if stale:
+            unindex_objects(kind.name, stale)
+        logger.info('indexed %d %s objects' % (indexed, kind.name))
+
+
+FACETS = ('kind', 'committee')
+
+
+class SearchResults(object):
+    """
+    The results of a search: the documents of the requested page (with
+    a score attribute), the total number of results, and the facet counts,
+    a dict of facet (kind or committee) to a list of (value, count) pairs.
+    """
+
+    def __init__(self, terms, documents, count, facets):
+        self.terms = terms
+        self.documents = documents
+        self.count = count
+        self.facets = facets
+
+
+def _filter_documents(terms, kinds=None, committee=None, speaker=None, date_from=None, date_to=None):
+    documents = SearchDocument.objects.all()
+    if kinds:
+        documents = documents.filter(kind__in=kinds)
+    if committee:
+        documents = documents.filter(committee=committee)
+    if speaker:
+        documents = documents.filter(speaker=speaker)
+    if date_from:
+        documents = documents.filter(date__gte=date_from)
+    if date_to:
+        documents = documents.filter(date__lte=date_to)
+    # documents having all the terms
+    for term in terms:
+        documents = documents.filter(terms__term=term)
+    return documents
+
+
+def search(query, page=1, page_size=PAGE_SIZE, **filters):
+    """
+    Search the index for the documents having all the terms of query, best
+    matches first. filters are kinds (a list of kind names), committee and
+    speaker (ids), date_from and date_to.
+    Facet counts are computed without the facet's own filter.
+    """
+    terms = query_terms(query)
+    if not terms:
+        return SearchResults(terms, [], 0, dict((facet, []) for facet in FACETS))
+    documents = _filter_documents(terms, **filters)
+    count = documents.count()
+
+    offset = (max(page, 1) - 1) * page_size
+    scores = list(SearchTerm.objects.filter(term__in=terms, document__in=documents).values('document').annotate(
+        score=Sum('weight')).order_by('-score', '-document')[offset:offset + page_size])
+    results = SearchDocument.objects.in_bulk([row['document'] for row in scores])
+    page_documents = []
+    for row in scores:
+        document = results[row['document']]
+        document.score = row['score']
+        page_documents.append(document)
+
+    facets = {}
+    for facet, own_filter in (('kind', 'kinds'), ('committee', 'committee')):
+        facet_filters = dict(filters, **{own_filter: None})
+        facet_documents = _filter_documents(terms, **facet_filters).exclude(**{facet: None})
+        facets[facet] = [(row[facet], row['count']) for row in facet_documents.values(facet).annotate(
+            count=Count('id')).order_by('-count')]
+    return SearchResults(terms, page_documents, count, facets)
@@ -0,0 +1,20 @@
+from django.db.models.signals import post_save, post_delete
+
+from knesset.utils import disable_for_loaddata
+from search.indexer import KINDS, kind_of_model, index_objects, unindex_objects
+
+
+@disable_for_loaddata
+def handle_indexed_save(sender, instance, **kwargs):
+    index_objects(kind_of_model(sender).name, [instance])
+
+
+def handle_indexed_delete(sender, instance, **kwargs):
+    unindex_objects(kind_of_model(sender).name, [instance.pk])
+
+
+for kind in KINDS.itervalues():
+    post_save.connect(handle_indexed_save, sender=kind.model,
+                      dispatch_uid='search_index_%s' % kind.name)
+    post_delete.connect(handle_indexed_delete, sender=kind.model,
+                        dispatch_uid='search_unindex_%s' % kind.name)
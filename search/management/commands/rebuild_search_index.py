@@ -0,0 +1,15 @@
+# encoding: utf-8
+from django.core.management.base import BaseCommand, CommandError
+
+from search.indexer import KINDS, rebuild
+
+
+class Command(BaseCommand):
+    args = '[kind ...]'
+    help = "Rebuild the site search index of the given kinds (%s), all of them by default" % ', '.join(KINDS)
+
+    def handle(self, *args, **options):
+        for kind in args:
+            if kind not in KINDS:
+                raise CommandError('unknown kind %s, use one of %s' % (kind, ', '.join(KINDS)))
+        rebuild(args)
@@ -0,0 +1,42 @@
+from django.db import models
+from django.utils.translation import ugettext_lazy as _
+
+
+class SearchDocument(models.Model):
+    '''
+    An indexed object: a protocol part, bill, vote or member. kind names the
+    object's model (see search.indexer.KINDS), the other fields are what
+    results are shown and filtered by.
+    '''
+    kind = models.CharField(_('kind'), max_length=20, db_index=True)
+    object_id = models.PositiveIntegerField()
+    title = models.CharField(_('title'), max_length=1000)
+    excerpt = models.TextField(_('excerpt'), blank=True)
+    url = models.CharField(max_length=1000, blank=True)
+    date = models.DateField(_('date'), blank=True, null=True, db_index=True)
+    committee = models.ForeignKey('committees.Committee', blank=True, null=True, related_name='+')
+    speaker = models.ForeignKey('persons.Person', blank=True, null=True, related_name='+')
+
+    class Meta:
+        unique_together = (('kind', 'object_id'),)
+
+    def __unicode__(self):
+        return u'%s %d: %s' % (self.kind, self.object_id, self.title)
+
+
+class SearchTerm(models.Model):
+    ''' A term a document is indexed by, weighted by its number of
+        occurrences (in the title they count more)
+    '''
+    term = models.CharField(max_length=40)
+    document = models.ForeignKey(SearchDocument, related_name='terms')
+    weight = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        unique_together = (('term', 'document'),)
+
+    def __unicode__(self):
+        return u'%s %d' % (self.term, self.document_id)
+
+
+from listeners import *
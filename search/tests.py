@@ -0,0 +1,93 @@
+# encoding: utf-8
+import json
+from datetime import date, datetime
+
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from committees.models import Committee, ProtocolPart
+from laws.models import Bill, Vote
+from mks.models import Member
+from persons.models import Person
+from search.indexer import search, index_meeting, rebuild
+from search.models import SearchDocument
+from search.tokenizer import index_terms, query_terms
+
+
+class TokenizerTest(TestCase):
+    def test_prefixes(self):
+        terms = index_terms(u'והחוק של ח"כ כהן')
+        self.assertEqual(set(terms), set([u'והחוק', u'החוק', u'חוק', u'חכ', u'כהן', u'הן']))
+        self.assertEqual(query_terms(u'החוק החוק של'), [u'החוק'])
+
+
+class SearchTest(TestCase):
+    def setUp(self):
+        self.committee = Committee.objects.create(name=u'ועדת הכספים')
+        self.other_committee = Committee.objects.create(name=u'ועדת החינוך')
+        self.meeting = self.committee.meetings.create(date=date(2015, 3, 1), topics=u'תקציב')
+        self.other_meeting = self.other_committee.meetings.create(date=date(2015, 4, 1), topics=u'חינוך')
+        self.speaker = Person.objects.create(name=u'ישראל ישראלי')
+        self.part = ProtocolPart.objects.create(meeting=self.meeting, order=1, header=u'ישראל ישראלי',
+                                                body=u'אנחנו דנים היום בתקציב המדינה ובחוק ההסדרים',
+                                                speaker=self.speaker)
+        self.other_part = ProtocolPart.objects.create(meeting=self.other_meeting, order=1,
+                                                      body=u'תקציב החינוך של המדינה')
+        self.bill = Bill.objects.create(title=u'חוק ההסדרים', full_title=u'חוק ההסדרים במשק המדינה',
+                                        stage='1')
+        self.vote = Vote.objects.create(title=u'הצבעה על תקציב המדינה', time=datetime(2015, 3, 2),
+                                        summary=u'תקציב')
+        self.mk = Member.objects.create(name=u'משה כהן')
+
+    def test_index_on_save(self):
+        self.assertEqual(SearchDocument.objects.count(), 5)
+        results = search(u'ההסדרים')
+        self.assertEqual(results.count, 2)
+        # the bill has the term in its title
+        self.assertEqual([(d.kind, d.object_id) for d in results.documents],
+                         [('bill', self.bill.id), ('protocol', self.part.id)])
+        self.assertEqual(search(u'כהן').documents[0].url, self.mk.get_absolute_url())
+
+    def test_all_terms_match(self):
+        self.assertEqual(search(u'תקציב').count, 3)
+        self.assertEqual(search(u'תקציב חינוך').count, 1)
+        self.assertEqual(search(u'של').count, 0)
+
+    def test_filters_and_facets(self):
+        results = search(u'מדינה', kinds=['protocol'])
+        self.assertEqual(results.count, 2)
+        self.assertEqual(dict(results.facets['kind']), {'protocol': 2, 'bill': 1, 'vote': 1})
+        self.assertEqual(dict(results.facets['committee']), {self.committee.id: 1, self.other_committee.id: 1})
+        self.assertEqual(search(u'מדינה', committee=self.committee.id).count, 1)
+        self.assertEqual(search(u'מדינה', speaker=self.speaker.id).documents[0].object_id, self.part.id)
+        self.assertEqual(search(u'מדינה', date_from=date(2015, 3, 2)).count, 2)
+
+    def test_delete_and_rebuild(self):
+        self.vote.delete()
+        self.assertEqual(search(u'הצבעה').count, 0)
+        ProtocolPart.objects.filter(id=self.part.id).update(body=u'הנושא הבא')
+        index_meeting(self.meeting)
+        self.assertEqual(search(u'הנושא').count, 1)
+        SearchDocument.objects.all().delete()
+        rebuild()
+        self.assertEqual(SearchDocument.objects.count(), 4)
+
+    def test_long_title(self):
+        bill = Bill.objects.create(title=u'חוק', full_title=u'חוק ' * 500, stage='1')
+        document = SearchDocument.objects.get(kind='bill', object_id=bill.id)
+        self.assertEqual(len(document.title), SearchDocument._meta.get_field('title').max_length)
+
+    def test_json(self):
+        response = self.client.get(reverse('site-search-json'), {'q': u'תקציב', 'kind': 'vote'})
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        self.assertEqual(data['count'], 1)
+        self.assertEqual(data['results'][0]['id'], self.vote.id)
+        self.assertEqual(data['results'][0]['date'], '2015-03-02')
+        response = self.client.get(reverse('site-search-json'))
+        self.assertEqual(response.status_code, 400)
+
+    def test_search_page(self):
+        response = self.client.get(reverse('site-search'), {'q': u'תקציב'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['results'].count, 3)
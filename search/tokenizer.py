@@ -0,0 +1,73 @@
+# encoding: utf-8
+"""
+Hebrew aware tokenization for the search index.
+
+Hebrew attaches prepositions, conjunctions and the definite article to the
+following word as prefix letters (והחוק is "and the law"), so indexed words
+are also indexed without up to MAX_PREFIXES prefix letters, as long as
+MIN_STEM_LENGTH letters are left. Query words are looked up as they are,
+which makes a query for חוק match החוק and והחוק, but a query for בחירות
+(elections) not match חירות (freedom).
+"""
+import re
+from collections import Counter
+
+# hebrew points and cantillation marks
+NIQQUD_RE = re.compile(u'[\u0591-\u05c7]')
+# words may contain quotes and gershayim, as in abbreviations like ח"כ
+WORD_RE = re.compile(u'[^\\W_]+(?:["\'\u05f3\u05f4][^\\W_]+)*', re.UNICODE)
+QUOTES_RE = re.compile(u'["\'\u05f3\u05f4]')
+HEBREW_RE = re.compile(u'^[\u05d0-\u05ea]')
+
+PREFIXES = u'והבלמשכ'
+MAX_PREFIXES = 3
+MIN_STEM_LENGTH = 2
+MAX_TERM_LENGTH = 40
+
+STOP_WORDS = frozenset([
+    u'של', u'את', u'על', u'עם', u'זה', u'זו', u'זאת', u'הוא', u'היא', u'הם', u'הן', u'אני', u'אנחנו',
+    u'לא', u'כי', u'גם', u'אם', u'או', u'אבל', u'כל', u'יש', u'אין', u'מה', u'אל', u'עד', u'רק',
+    u'the', u'of', u'and', u'to', u'in', u'a', u'is', u'on', u'for',
+])
+
+
+def words(text):
+    """The normalized words of text, in order"""
+    if not text:
+        return []
+    text = NIQQUD_RE.sub(u'', unicode(text).lower())
+    result = []
+    for match in WORD_RE.finditer(text):
+        word = QUOTES_RE.sub(u'', match.group())[:MAX_TERM_LENGTH]
+        if (len(word) > 1 or word.isdigit()) and word not in STOP_WORDS:
+            result.append(word)
+    return result
+
+
+def variants(word):
+    """word and its forms without prefix letters"""
+    result = [word]
+    if HEBREW_RE.match(word):
+        for i in range(1, MAX_PREFIXES + 1):
+            if len(word) - i < MIN_STEM_LENGTH or word[i - 1] not in PREFIXES:
+                break
+            result.append(word[i:])
+    return result
+
+
+def index_terms(text, weight=1):
+    """A Counter of the terms to index text by, each weighted by weight"""
+    terms = Counter()
+    for word in words(text):
+        for term in variants(word):
+            terms[term] += weight
+    return terms
+
+
+def query_terms(query):
+    """The distinct terms of a search query, in order"""
+    terms = []
+    for word in words(query):
+        if word not in terms:
+            terms.append(word)
+    return terms
@@ -0,0 +1,8 @@
+from django.conf.urls import url, patterns
+
+from search.views import search, search_json
+
+searchurlpatterns = patterns('',
+                             url(r'^search/$', search, name='site-search'),
+                             url(r'^search/json/$', search_json, name='site-search-json'),
+                             )
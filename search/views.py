@@ -0,0 +1,74 @@
+import json
+
+from django.http import HttpResponse, HttpResponseBadRequest
+from django.shortcuts import render_to_response
+from django.template import RequestContext
+
+from committees.models import Committee
+from search.forms import SearchForm
+from search.indexer import search as search_index, PAGE_SIZE
+
+
+def _search(request):
+    ''' return the form and search results (None if the form is invalid)
+        of a search request, and the names of the committees in the facets
+    '''
+    form = SearchForm(request.GET)
+    if not form.is_valid():
+        return form, None, {}
+    results = search_index(form.cleaned_data['q'], page=form.cleaned_data['page'] or 1,
+                           **form.search_filters())
+    committees = dict(Committee.objects.filter(
+        id__in=[committee_id for committee_id, count in results.facets['committee']]).values_list('id', 'name'))
+    return form, results, committees
+
+
+def search(request):
+    form, results, committees = _search(request)
+    context = {
+        'form': form,
+        'query': request.GET.get('q'),
+        'results': results,
+        'has_search': True,
+    }
+    if results is not None:
+        page = form.cleaned_data['page'] or 1
+        query_string = request.GET.copy()
+        query_string.pop('page', None)
+        context.update({
+            'kind_facets': results.facets['kind'],
+            'committee_facets': [(committee_id, committees.get(committee_id), count)
+                                 for committee_id, count in results.facets['committee']],
+            'page': page,
+            'has_previous': page > 1,
+            'has_next': page * PAGE_SIZE < results.count,
+            'query_string': query_string.urlencode(),
+        })
+    return render_to_response('search/search.html', RequestContext(request, context))
+
+
+def search_json(request):
+    form, results, committees = _search(request)
+    if results is None:
+        return HttpResponseBadRequest(json.dumps(form.errors), content_type='application/json')
+    result = {
+        'query': form.cleaned_data['q'],
+        'count': results.count,
+        'page': form.cleaned_data['page'] or 1,
+        'page_size': PAGE_SIZE,
+        'results': [{'kind': document.kind,
+                     'id': document.object_id,
+                     'title': document.title,
+                     'excerpt': document.excerpt,
+                     'url': document.url,
+                     'date': document.date.isoformat() if document.date else None,
+                     'committee': document.committee_id,
+                     'speaker': document.speaker_id,
+                     'score': document.score} for document in results.documents],
+        'facets': {
+            'kind': [{'kind': kind, 'count': count} for kind, count in results.facets['kind']],
+            'committee': [{'id': committee_id, 'name': committees.get(committee_id), 'count': count}
+                          for committee_id, count in results.facets['committee']],
+        },
+    }
+    return HttpResponse(json.dumps(result), content_type='application/json')
@@ -5,26 +5,84 @@ import gzip
 import logging
 import os
 import re
+from collections import defaultdict
 
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
-from django.db.models import Max
+from django.db import transaction
+from django.utils.encoding import force_unicode
 from okscraper_django.management.base_commands import NoArgsDbLogCommand
 
-from laws.models import Vote, VoteAction
+from agendas.models import AgendaVote
+from knesset.activity import write_actions, pending_action
+from agendas.summaries import refresh_summary_bucket
+from laws.enums import VOTE_ACTION_TYPE_CHOICES
+from laws.models import Vote, VoteAction, PartyStatistics
 from links.models import Link
+from mks.intervals import get_party_index
 from mks.models import Member, Party, Membership
+from search.indexer import index_objects
 
 from simple.constants import CANONICAL_PARTY_ALIASES
 
 ENCODING = 'utf8'
 
+# votes and vote actions are created in chunks of about this size
+CHUNK_SIZE = 1000
+
 DATA_ROOT = getattr(settings, 'DATA_ROOT',
                     os.path.join(settings.PROJECT_ROOT, os.path.pardir, os.path.pardir, 'data'))
 
 logger = logging.getLogger(__name__)
 
 
+def gzip_lines(filename):
+    """The lines of a gzipped file in DATA_ROOT, read one at a time"""
+    f = gzip.open(os.path.join(DATA_ROOT, filename))
+    try:
+        for line in f:
+            yield line.rstrip('\n')
+    finally:
+        f.close()
+
+
+class LawIndex(object):
+    """
+    Finds the last law (in the laws file order) whose name is contained in
+    a vote title. Laws are indexed by the first KEY_LENGTH bytes of their
+    names, so every position of the title is compared only to the laws
+    whose names start there, instead of searching the title for every law.
+    """
+    KEY_LENGTH = 4
+
+    def __init__(self):
+        self.laws = []
+        self.by_key = defaultdict(list)
+        self.key_lengths = set()
+        # an empty name is contained in every title
+        self.contained_in_all = None
+
+    def add(self, name, explanation, link):
+        position = len(self.laws)
+        self.laws.append((explanation, link))
+        if not name:
+            self.contained_in_all = position
+            return
+        key = name[:self.KEY_LENGTH]
+        self.by_key[key].append((position, name))
+        self.key_lengths.add(len(key))
+
+    def find(self, title):
+        """(explanation, link) of the last law contained in title, or None"""
+        found = self.contained_in_all
+        for i in xrange(len(title)):
+            for length in self.key_lengths:
+                for position, name in self.by_key.get(title[i:i + length], ()):
+                    if (found is None or position > found) and title.startswith(name, i):
+                        found = position
+        return self.laws[found] if found is not None else None
+
+
 class Command(NoArgsDbLogCommand):
     help = "loading pre existing files to db"
 
@@ -45,12 +103,11 @@ class Command(NoArgsDbLogCommand):
     def load(self):
         self.update_members_from_file()
         self.update_db_from_files()
+        PartyStatistics.objects.refresh_stale()
 
     def update_members_from_file(self):
         logger.debug('update_members_from_file')
-        f = gzip.open(os.path.join(DATA_ROOT, 'members.tsv.gz'))
-        content = f.read().split('\n')
-        for line in content:
+        for line in gzip_lines('members.tsv.gz'):
             if len(line) <= 1:
                 continue
             (member_id, name, img_url, phone, fax, website, email,
@@ -135,87 +192,127 @@ class Command(NoArgsDbLogCommand):
     heb_months = ['ינואר', 'פברואר', 'מרץ', 'אפריל', 'מאי', 'יוני', 'יולי', 'אוגוסט', 'ספטמבר', 'אוקטובר', 'נובמבר',
                   'דצמבר']
 
+    def parse_vote(self, line, laws):
+        """An unsaved Vote of a line of votes.tsv.gz"""
+        (vote_id, vote_src_url, vote_label, vote_meeting_num, vote_num, vote_time_string, _, _, _,
+         _) = line.split('\t')
+        vote_time_string = vote_time_string.replace('&nbsp;', ' ')
+        for i in self.heb_months:
+            if i in vote_time_string:
+                month = self.heb_months.index(i) + 1
+        day = re.search("""(\d\d?)""", vote_time_string).group(1)
+        year = re.search("""(\d\d\d\d)""", vote_time_string).group(1)
+        vote_hm = datetime.datetime.strptime(vote_time_string.split(' ')[-1], "%H:%M")
+        vote_time = datetime.datetime(int(year), int(month), int(day), vote_hm.hour, vote_hm.minute)
+
+        v = Vote(title=vote_label, time_string=vote_time_string, importance=1, src_id=int(vote_id),
+                 time=vote_time)
+        try:
+            v.meeting_number = int(vote_meeting_num)
+        except:
+            pass
+        try:
+            v.vote_number = int(vote_num)
+        except:
+            pass
+        v.src_url = vote_src_url
+        law = laws.find(self.get_search_string(vote_label))
+        if law:
+            (v.summary, v.full_text_url) = law
+        return v
+
+    def save_votes(self, new_votes, votes):
+        """Create new_votes and the links to their laws, and add them to
+        votes (src id -> (id, time))"""
+        if not new_votes:
+            return
+        vote_ct = ContentType.objects.get_for_model(Vote)
+        with transaction.atomic():
+            Vote.objects.bulk_create(new_votes)
+            created = list(Vote.objects.filter(src_id__in=[v.src_id for v in new_votes]))
+            Link.objects.bulk_create([Link(title=u'מסמך הצעת החוק באתר הכנסת', url=v.full_text_url,
+                                           content_type=vote_ct, object_pk=str(v.id))
+                                      for v in created if v.full_text_url is not None])
+        # bulk_create sends no signals
+        index_objects('vote', created)
+        for v in created:
+            votes[v.src_id] = (v.id, v.time)
+        logger.debug('created %d votes' % len(created))
+
+    def save_vote_actions(self, vote_actions, vote_times):
+        """Create vote_actions and their activity stream actions"""
+        if not vote_actions:
+            return
+        type_names = dict(VOTE_ACTION_TYPE_CHOICES)
+        with transaction.atomic():
+            VoteAction.objects.bulk_create(vote_actions)
+            write_actions([pending_action(Member, va.member_id, 'voted', Vote, va.vote_id,
+                                          description=force_unicode(type_names.get(va.type, va.type)),
+                                          timestamp=vote_times[va.vote_id])
+                           for va in vote_actions])
+        logger.debug('created %d vote actions' % len(vote_actions))
+
     def update_db_from_files(self):
+        """Load the votes, and the members votes, in votes.tsv.gz and
+        results.tsv.gz. The files are read a line at a time, the existing
+        parties, members and memberships are read once, and the new votes and
+        vote actions are created in chunks, each chunk in a transaction.
+        Loading can be resumed after a failure: votes are found by src_id,
+        and votes that have vote actions are complete (results are grouped by
+        vote and a chunk holds whole votes), so they are skipped."""
         logger.debug("Update DB From Files")
 
         try:
-            laws = []  # of lists: [name,name_for_search,explanation,link]
-            f = gzip.open(os.path.join(DATA_ROOT, 'laws.tsv.gz'))
-            content = f.read().split('\n')
-            for line in content:
+            laws = LawIndex()
+            for line in gzip_lines('laws.tsv.gz'):
                 law = line.split('\t')
                 if len(law) == 3:
-                    name_for_search = self.get_search_string(law[0])
-                    law.insert(1, name_for_search)
-                    laws.append(law)
-            f.close()
-
-            parties = dict()  # key: party-name; value: Party
-            members = dict()  # key: member-name; value: Member
-            votes = dict()  # key: id; value: Vote
-            memberships = dict()  # key: (member.id,party.id)
-            current_max_src_id = Vote.objects.aggregate(Max('src_id'))['src_id__max']
-            if current_max_src_id == None:  # the db contains no votes, meaning its empty
-                current_max_src_id = 0
+                    laws.add(self.get_search_string(law[0]), law[1], law[2])
 
             logger.debug("processing votes data")
-            f = gzip.open(os.path.join(DATA_ROOT, 'votes.tsv.gz'))
-            content = f.read().split('\n')
-            for line in content:
+            existing = dict((src_id, (vote_id, time)) for (src_id, vote_id, time) in
+                            Vote.objects.filter(src_id__isnull=False).values_list('src_id', 'id', 'time'))
+            existing_ids = set(vote_id for (vote_id, time) in existing.itervalues())
+            votes = dict()  # key: src id of votes in the file; value: (id, time)
+            new_votes = []
+            new_src_ids = set()
+            for line in gzip_lines('votes.tsv.gz'):
                 if len(line) <= 1:
                     continue
-                (vote_id, vote_src_url, vote_label, vote_meeting_num, vote_num, vote_time_string, _, _, _,
-                 _) = line.split('\t')
-                # if vote_id < current_max_src_id: # skip votes already parsed.
-                #    continue
-                vote_time_string = vote_time_string.replace('&nbsp;', ' ')
-                for i in self.heb_months:
-                    if i in vote_time_string:
-                        month = self.heb_months.index(i) + 1
-                day = re.search("""(\d\d?)""", vote_time_string).group(1)
-                year = re.search("""(\d\d\d\d)""", vote_time_string).group(1)
-                vote_hm = datetime.datetime.strptime(vote_time_string.split(' ')[-1], "%H:%M")
-                vote_date = datetime.date(int(year), int(month), int(day))
-                vote_time = datetime.datetime(int(year), int(month), int(day), vote_hm.hour, vote_hm.minute)
-                vote_label_for_search = self.get_search_string(vote_label)
-
-                # if vote_date < datetime.date(2009, 02, 24): # vote before 18th knesset
-                #    continue
-
-                try:
-                    v = Vote.objects.get(src_id=vote_id)
-                    created = False
-                except:
-                    v = Vote(title=vote_label, time_string=vote_time_string, importance=1, src_id=vote_id,
-                             time=vote_time)
-                    try:
-                        vote_meeting_num = int(vote_meeting_num)
-                        v.meeting_number = vote_meeting_num
-                    except:
-                        pass
-                    try:
-                        vote_num = int(vote_num)
-                        v.vote_number = vote_num
-                    except:
-                        pass
-                    v.src_url = vote_src_url
-                    for law in laws:
-                        (_, law_name_for_search, law_exp, law_link) = law
-                        if vote_label_for_search.find(law_name_for_search) >= 0:
-                            v.summary = law_exp
-                            v.full_text_url = law_link
-                    v.save()
-                    if v.full_text_url != None:
-                        l = Link(title=u'מסמך הצעת החוק באתר הכנסת', url=v.full_text_url,
-                                 content_type=ContentType.objects.get_for_model(v), object_pk=str(v.id))
-                        l.save()
-                votes[int(vote_id)] = v
-            f.close()
+                vote_id = int(line.split('\t', 1)[0])
+                if vote_id in existing:
+                    votes[vote_id] = existing[vote_id]
+                    continue
+                if vote_id in new_src_ids:
+                    continue
+                new_votes.append(self.parse_vote(line, laws))
+                new_src_ids.add(vote_id)
+                if len(new_votes) >= CHUNK_SIZE:
+                    self.save_votes(new_votes, votes)
+                    new_votes = []
+            self.save_votes(new_votes, votes)
+            del existing
 
             logger.debug("processing member votes data")
-            f = gzip.open(os.path.join(DATA_ROOT, 'results.tsv.gz'))
-            content = f.read().split('\n')
-            for line in content:
+            parties = dict()  # key: party-name; value: Party
+            for party in Party.objects.order_by('-id'):
+                parties[party.name.encode(ENCODING)] = party
+            members = dict()  # key: member-name; value: Member. with several people with the same name, the younger
+            for member in Member.objects.order_by('date_of_birth'):
+                members[member.name.encode(ENCODING)] = member
+            memberships = dict(((ms.member_id, ms.party_id), ms) for ms in Membership.objects.all())
+            changed_parties = set()
+            changed_members = set()
+            changed_memberships = set()
+            voted = set(VoteAction.objects.values_list('vote', flat=True).distinct())
+            vote_times = dict(votes.itervalues())
+            party_index = get_party_index()
+            vote_actions = []
+            vote_action_keys = set()
+            acted_votes = set()
+            acted_members = set()
+            last_vote = None
+            for line in gzip_lines('results.tsv.gz'):
                 if len(line) < 2:
                     continue
                 s = line.split('\t')  # (id,voter,party,vote)
@@ -231,86 +328,95 @@ class Command(NoArgsDbLogCommand):
                 vote = s[3]
 
                 try:
-                    v = votes[vote_id]
+                    (v_id, v_time) = votes[vote_id]
                 except KeyError:  # this vote was skipped in this read, also skip voteactions and members
                     continue
-                vote_date = v.time.date()
+                vote_date = v_time.date()
 
                 # create/get the party appearing in this vote
                 if voter_party in parties:
                     party = parties[voter_party]
-                    created = False
                 else:
-                    party, created = Party.objects.get_or_create(name=voter_party)
+                    party = Party(name=voter_party, start_date=vote_date, end_date=vote_date)
+                    party.save()  # so it would have an id
                     parties[voter_party] = party
-                    # if created: # this is magic needed because of unicode chars. if you don't do this, the object p will have gibrish as its name.
-                    # only when it comes back from the db it has valid unicode chars.
 
                 # use this vote's time to update the party's start date and end date
                 if (party.start_date is None) or (party.start_date > vote_date):
                     party.start_date = vote_date
+                    changed_parties.add(voter_party)
                 if (party.end_date is None) or (party.end_date < vote_date):
                     party.end_date = vote_date
-                if created:  # save on first time, so it would have an id, be able to link, etc. all other updates are saved in the end
-                    party.save()
+                    changed_parties.add(voter_party)
 
-                # create/get the member voting
-                if voter in members:
+                # get the member voting
+                try:
                     member = members[voter]
-                    created = False
-                else:
-                    try:
-                        member = Member.objects.get(name=voter)
-                    except:  # if there are several people with same age,
-                        member = Member.objects.filter(name=voter).order_by('-date_of_birth')[
-                            0]  # choose the younger. TODO: fix this
-                    members[voter] = member
+                except KeyError:
+                    logger.warning('unknown member %s in results of vote %d' % (voter.decode(ENCODING), vote_id))
+                    continue
 
                 # use this vote's date to update the member's dates.
                 if (member.start_date is None) or (member.start_date > vote_date):
                     member.start_date = vote_date
+                    changed_members.add(voter)
                 if (member.end_date is None) or (member.end_date < vote_date):
                     member.end_date = vote_date
-                # if created: # save on first time, so it would have an id, be able to link, etc. all other updates are saved in the end
-                #    m.save()
-
+                    changed_members.add(voter)
 
                 # create/get the membership (connection between member and party)
-                if ((member.id, party.id) in memberships):
+                if (member.id, party.id) in memberships:
                     ms = memberships[(member.id, party.id)]
-                    created = False
                 else:
-                    ms, created = Membership.objects.get_or_create(member=member, party=party)
+                    ms = Membership(member=member, party=party, start_date=vote_date, end_date=vote_date)
+                    ms.save()
                     memberships[(member.id, party.id)] = ms
-                # if created: # again, unicode magic
-                #    ms = Membership.objects.get(member=m,party=p)
                 # again, update the dates on the membership
                 if (ms.start_date is None) or (ms.start_date > vote_date):
                     ms.start_date = vote_date
+                    changed_memberships.add((member.id, party.id))
                 if (ms.end_date is None) or (ms.end_date < vote_date):
                     ms.end_date = vote_date
-                if created:  # save on first time, so it would have an id, be able to link, etc. all other updates are saved in the end
-                    ms.save()
-
-                # add the current member's vote
+                    changed_memberships.add((member.id, party.id))
 
-                va, created = VoteAction.objects.get_or_create(vote=v, member=member, type=vote,
-                                                               party=member.current_party)
-                if created:
-                    va.save()
+                # add the current member's vote, unless the vote was loaded before
+                if v_id in voted:
+                    continue
+                if v_id != last_vote and len(vote_actions) >= CHUNK_SIZE:
+                    self.save_vote_actions(vote_actions, vote_times)
+                    vote_actions = []
+                    vote_action_keys = set()
+                last_vote = v_id
+                key = (v_id, member.id, vote)
+                if key in vote_action_keys:
+                    continue
+                vote_action_keys.add(key)
+                acted_votes.add(v_id)
+                acted_members.add(member.id)
+                party_id = member.current_party_id or party_index.party_id_at(member.id, vote_date)
+                vote_actions.append(VoteAction(vote_id=v_id, member_id=member.id, type=vote, party_id=party_id))
+            self.save_vote_actions(vote_actions, vote_times)
 
             logger.debug("done")
             logger.debug(
-                "saving data: %d parties, %d members, %d memberships " % (len(parties), len(members), len(memberships)))
-            for party in parties:
+                "saving data: %d parties, %d members, %d memberships " % (
+                    len(changed_parties), len(changed_members), len(changed_memberships)))
+            for party in changed_parties:
                 parties[party].save()
-            for member in members:
+            for member in changed_members:
                 members[member].save()
-            for ms in memberships:
+            for ms in changed_memberships:
                 memberships[ms].save()
 
+            # what the vote actions listeners do for each vote action. new
+            # votes are not ascribed to agendas yet
+            if acted_members:
+                PartyStatistics.objects.mark_stale(party__members__in=acted_members)
+            for agenda_id, vote_time in AgendaVote.objects.filter(vote__in=acted_votes & existing_ids).values_list(
+                    'agenda', 'vote__time'):
+                refresh_summary_bucket(agenda_id, vote_time)
+
             logger.debug("done")
-            f.close()
         except Exception:
 
             logger.exception('Update db from file exception')
@@ -8,6 +8,7 @@ from django.db import transaction
 from django.contrib.auth.models import User
 from user.models import UserProfile
 from actstream.models import Follow
+from knesset.utils import suppress_signals
 
 OUT_DB = 'dev'
 
@@ -36,6 +37,10 @@ class Command(NoArgsCommand):
     COMMIT_EVERY = 30
 
     def handle_noargs(self, **options):
+        with suppress_signals():
+            self.sync(**options)
+
+    def sync(self, **options):
         call_command('syncdb', database=self.DB, interactive=False,
                      migrate_all=True)
 
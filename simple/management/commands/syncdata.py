@@ -10,6 +10,7 @@ import time
 import traceback
 import urllib
 import urllib2
+from collections import defaultdict
 from cStringIO import StringIO
 from optparse import make_option
 
@@ -20,10 +21,13 @@ from okscraper_django.management.base_commands import NoArgsDbLogCommand
 from pyth.plugins.rtf15.reader import Rtf15Reader
 
 from committees.models import Committee, CommitteeMeeting
-from knesset.utils import cannonize
+from knesset.text_index import PatternIndex
+from knesset.utils import bulk_add_m2m, cannonize
 from knesset.utils import send_chat_notification
+from laws.bill_stages import update_stages
+from laws.dedup import merge_duplicates
 from laws.models import (Vote, Bill, Law, PrivateProposal,
-                         KnessetProposal, GovProposal, GovLegislationCommitteeDecision)
+                         KnessetProposal, GovProposal, GovLegislationCommitteeDecision, PartyStatistics)
 from links.models import Link
 from mks.models import Member, WeeklyPresence, Knesset
 
@@ -70,7 +74,11 @@ class Command(NoArgsDbLogCommand):
         make_option('--update', action='store_true', dest='update',
                     help="online update of data."),
         make_option('--update-run-only', action='store', dest='update-run-only',
-                    help="only run update for the provided functions. Should contain comma-seperated list of functions to run.")
+                    help="only run update for the provided functions. Should contain comma-seperated list of functions to run."),
+        make_option('--proposals-cms-days', action='store', type='int', dest='proposals_cms_days', default=60,
+                    help="look for proposals in committee meetings of the last given days (0 for all meetings)"),
+        make_option('--votes-in-cms-days', action='store', type='int', dest='votes_in_cms_days', default=7,
+                    help="look for votes in protocols downloaded in the last given days (0 for all protocols)")
     )
     help = "Downloads data from sources, parses it and loads it to the Django DB."
 
@@ -80,6 +88,8 @@ class Command(NoArgsDbLogCommand):
 
     last_downloaded_vote_id = 0
     last_downloaded_member_id = 0
+    proposals_cms_days = 60
+    votes_in_cms_days = 7
 
     def _handle_noargs(self, **options):
         global logger
@@ -92,6 +102,10 @@ class Command(NoArgsDbLogCommand):
         update = options.get('update', False)
         laws = options.get('laws', False)
         presence = options.get('presence', False)
+        if options.get('proposals_cms_days') is not None:
+            self.proposals_cms_days = options['proposals_cms_days']
+        if options.get('votes_in_cms_days') is not None:
+            self.votes_in_cms_days = options['votes_in_cms_days']
 
         if all_options:
             process = True
@@ -128,6 +142,7 @@ class Command(NoArgsDbLogCommand):
                          'update_presence',
                          'parse_laws',
                          'find_proposals_in_other_data',
+                         'find_votes_in_cms',
                          'merge_duplicate_laws',
                          'update_mk_role_descriptions',
                          'update_mks_is_current',
@@ -376,17 +391,32 @@ class Command(NoArgsDbLogCommand):
 
             logger.exception(u'Exception in find synced protocol: vote id: %s search_text= %s' % (vote.pk, search_text))
 
-    def check_vote_mentioned_in_cm(self, vote, cm):
-        m = vote.title[vote.title.find(' - ') + 2:]
-        v_search_text = self.get_search_string(m.encode('utf8'))
-        cm_search_text = self.get_search_string(cm.protocol_text.encode('utf8')).replace('\n', '')
-        if cm_search_text.find(v_search_text) >= 0:
-            cm.votes_mentioned.add(vote)
+    def _vote_search_string(self, title):
+        return self.get_search_string(title[title.find(' - ') + 2:])
 
     def find_votes_in_cms(self):
-        for cm in CommitteeMeeting.objects.all():
-            for v in Vote.objects.all():
-                self.check_vote_mentioned_in_cm(v, cm)
+        """
+        Find votes mentioned in committee meeting protocols, and link them with votes_mentioned.
+        All vote titles are matched against each (normalized once) protocol in a single pass. Unless
+        votes_in_cms_days is 0, only protocols downloaded in the last votes_in_cms_days are looked through.
+        """
+        index = PatternIndex((self._vote_search_string(title), vote_id)
+                             for vote_id, title in Vote.objects.values_list('id', 'title').iterator())
+        cms = CommitteeMeeting.objects.exclude(protocol_text=None)
+        if self.votes_in_cms_days:
+            d = datetime.date.today() - datetime.timedelta(self.votes_in_cms_days)
+            cms = cms.filter(protocol_text_update_date__gte=d)
+
+        found = set()
+        added = 0
+        for cm_id, protocol_text in cms.values_list('id', 'protocol_text').iterator():
+            cm_search_text = self.get_search_string(protocol_text).replace('\n', '')
+            found.update((cm_id, vote_id) for vote_id in index.matches(cm_search_text))
+            if len(found) >= 5000:
+                added += len(bulk_add_m2m(CommitteeMeeting, 'votes_mentioned', found))
+                found = set()
+        added += len(bulk_add_m2m(CommitteeMeeting, 'votes_mentioned', found))
+        logger.info('found %d new votes mentioned in committee meetings' % added)
 
     def get_approved_bill_text(self, url):
         """Retrieve the RTL file in the given url, assume approved bill file
@@ -443,20 +473,31 @@ class Command(NoArgsDbLogCommand):
         except IOError:
             logger.error('Can\'t find presence file')
             return
+        self.import_presence(presence, valid_weeks)
+        logger.info('Finished updating presence')
+
+    def import_presence(self, presence, valid_weeks):
+        """
+        Create the missing WeeklyPresence rows of the current members from parsed presence data
+        (see parse_presence), with bulk inserts, and then recalculate the members average presence once.
+        Existing rows are left as they are.
+        """
+        if not presence:
+            return
+        valid_weeks = set(valid_weeks)
         todays_timestamp = datetime.date.today().isocalendar()[:2]
-        c = [b[0][0] for b in presence.values()]
-        c.sort()
-        min_timestamp = c[0]
-        c = None
+        min_timestamp = min(b[0][0] for b in presence.values())
 
-        for member in Member.current_members.all():
-            logger.info("Trying to update presence for %s" % member.pk)
+        members = list(Member.current_members.all())
+        existing = set(WeeklyPresence.objects.filter(member__in=members).values_list('member_id', 'date'))
+        new_presence = []
+        updated_member_ids = []
+        for member in members:
             if member.id not in presence:
                 logger.error('member %s (id=%d) not found in presence data', member.name, member.id)
                 continue
-            member_presence = dict(zip([b[0] for b in presence[member.id]], [b[1] for b in presence[member.id]]))
-
-            end_timestamp = todays_timestamp
+            updated_member_ids.append(member.id)
+            member_presence = dict(presence[member.id])
 
             start_date = member.start_date or datetime.datetime.utcnow()
             current_timestamp = (start_date + datetime.timedelta(7)).isocalendar()[
@@ -464,21 +505,19 @@ class Command(NoArgsDbLogCommand):
             if current_timestamp < min_timestamp:  # we don't have info in the current file that goes back so far
                 current_timestamp = min_timestamp
 
-            while current_timestamp <= end_timestamp:  # loop over weeks
-                if current_timestamp in valid_weeks:  # if we have valid data for this week
-                    if current_timestamp in member_presence:  # if this member was present this week
-                        hours = member_presence[current_timestamp]  # check how many hours
-                    else:
-                        hours = 0.0  # not present at all this week = 0 hours
-                    date = iso_to_gregorian(*current_timestamp, iso_day=0)  # get real date of the week's monday
-                    (wp, created) = WeeklyPresence.objects.get_or_create(member=member, date=date,
-                                                                         defaults={'hours': hours})
-                    wp.save()
-                else:
-                    date = iso_to_gregorian(*current_timestamp, iso_day=0)
+            while current_timestamp <= todays_timestamp:  # loop over weeks
+                date = iso_to_gregorian(*current_timestamp, iso_day=0)  # get real date of the week's monday
+                if current_timestamp in valid_weeks and (member.id, date) not in existing:
+                    # not present at all this week = 0 hours
+                    hours = member_presence.get(current_timestamp, 0.0)
+                    new_presence.append(WeeklyPresence(member_id=member.id, date=date, hours=hours))
                 current_timestamp = (date + datetime.timedelta(8)).isocalendar()[:2]
-        logger.info('Finished updating presence')
 
+        WeeklyPresence.objects.bulk_create(new_presence, batch_size=1000)
+        logger.info('added %d weekly presence records' % len(new_presence))
+        Member.objects.recalc_average_weekly_presence_hours(updated_member_ids)
+        PartyStatistics.objects.mark_stale(party__members__in=updated_member_ids)
+        PartyStatistics.objects.refresh_stale()
 
     def update_private_proposal_content_html(self, pp):
         html = parse_remote.rtf(pp.source_url)
@@ -727,107 +766,88 @@ class Command(NoArgsDbLogCommand):
         self.find_proposals_in_committee_meetings(gps, kps, pps)
         self.find_proposals_in_votes(gps, kps, pps)
 
+    def _proposals_pattern_index(self, gps, kps, pps, keys):
+        """
+        A PatternIndex of the given canonical names (keys) of all proposals, whose matches are
+        (proposal model, proposal id) pairs.
+        """
+        index = PatternIndex()
+        for model, proposals in ((GovProposal, gps), (KnessetProposal, kps), (PrivateProposal, pps)):
+            for p in proposals:
+                for key in keys:
+                    index.add(p[key], (model, p['id']))
+        return index
+
+    def _bill_ids_of_proposals(self, model, proposal_ids):
+        """returns a dict of proposal id -> bill id for the proposals that have a bill"""
+        proposal_ids = sorted(proposal_ids)
+        bill_ids = {}
+        for i in range(0, len(proposal_ids), 500):
+            bill_ids.update(model.objects.filter(id__in=proposal_ids[i:i + 500], bill__isnull=False).values_list(
+                'id', 'bill_id'))
+        return bill_ids
+
     def find_proposals_in_committee_meetings(self, gps, kps, pps):
         """
-        Find Private proposals and Knesset proposals in committee meetings. update bills that are connected.
-        kps and pps are dicts computed by find_proposals_in_other_data with canonical names.
+        Find Gov, Knesset and Private proposals in committee meetings. update bills that are connected.
+        gps, kps and pps are dicts computed by find_proposals_in_other_data with canonical names.
+        Every protocol is matched against all the proposals in one pass, and the new links are inserted in bulk.
         """
+        index = self._proposals_pattern_index(gps, kps, pps, ('c1', 'c2'))
+        cms = CommitteeMeeting.objects.filter(committee__type='committee').exclude(protocol_text=None)
+        if self.proposals_cms_days:
+            # by default only look through cms in last 60 days.
+            d = datetime.date.today() - datetime.timedelta(self.proposals_cms_days)
+            cms = cms.filter(date__gt=d)
+
+        found = defaultdict(set)
+        for cm_id, protocol_text in cms.values_list('id', 'protocol_text').iterator():
+            for model, proposal_id in index.matches(cannonize(protocol_text)):
+                found[model].add((proposal_id, cm_id))
+
+        bills_to_update = set()
+        for model, pairs in found.iteritems():
+            added = bulk_add_m2m(model, 'committee_meetings', pairs)
+            if not added:
+                continue
+            logger.debug('%d new %s links to committee meetings' % (len(added), model.__name__))
+            bill_ids = self._bill_ids_of_proposals(model, set(proposal_id for proposal_id, cm_id in added))
+            # private proposals are discussed in the first committee stage, gov and knesset proposals in the second
+            bill_field = 'first_committee_meetings' if model is PrivateProposal else 'second_committee_meetings'
+            bulk_add_m2m(Bill, bill_field, [(bill_ids[proposal_id], cm_id) for proposal_id, cm_id in added
+                                            if proposal_id in bill_ids])
+            bills_to_update.update(bill_ids.values())
 
-        d = datetime.date.today() - datetime.timedelta(60)  # only look through cms in last 60 days.
-        for cm in CommitteeMeeting.objects.filter(date__gt=d, committee__type='committee').exclude(protocol_text=None):
-            c = cannonize(cm.protocol_text)
-            for gp in gps:
-                if c.find(gp['c1']) >= 0 or c.find(gp['c2']) >= 0:
-                    p = GovProposal.objects.get(pk=gp['id'])
-                    if cm not in p.committee_meetings.all():
-                        p.committee_meetings.add(cm)
-                        if p.bill:
-                            p.bill.second_committee_meetings.add(cm)
-                            p.bill.update_stage()
-                        logger.debug('gov proposal %d found in cm %d' % (p.id, cm.id))
-            for kp in kps:
-                if c.find(kp['c1']) >= 0 or c.find(kp['c2']) >= 0:
-                    p = KnessetProposal.objects.get(pk=kp['id'])
-                    if cm not in p.committee_meetings.all():
-                        p.committee_meetings.add(cm)
-                        if p.bill:
-                            p.bill.second_committee_meetings.add(cm)
-                            p.bill.update_stage()
-
-            for pp in pps:
-                if c.find(pp['c1']) >= 0 or c.find(pp['c2']) >= 0:
-                    p = PrivateProposal.objects.get(pk=pp['id'])
-                    if cm not in p.committee_meetings.all():
-                        p.committee_meetings.add(cm)
-                        if p.bill:
-                            p.bill.first_committee_meetings.add(cm)
-                            p.bill.update_stage()
+        update_stages(Bill.objects.filter(id__in=bills_to_update))
 
     def find_proposals_in_votes(self, gps, kps, pps):
         """
-        Find Private proposals and Knesset proposals in votes. update bills that are connected.
-        kps and pps are dicts computed by find_proposals_in_other_data with canonical names.
+        Find Gov, Knesset and Private proposals in votes. update bills that are connected.
+        gps, kps and pps are dicts computed by find_proposals_in_other_data with canonical names.
         """
-        votes = Vote.objects.filter(title__contains='חוק').values('id', 'title')
-
-        for v in votes:
-            v['c'] = cannonize(v['title'])
-
-            for gp in gps:
-                if v['c'].find(gp['c1']) >= 0:
-                    p = GovProposal.objects.get(pk=gp['id'])
-                    this_v = Vote.objects.get(pk=v['id'])
-                    if this_v not in p.votes.all():
-                        p.votes.add(this_v)
-                        if p.bill:
-                            p.bill.update_votes()
-                        logger.debug('gov proposal %d found in vote %s' % (p.id, this_v.title))
-
-            for kp in kps:
-                if v['c'].find(kp['c1']) >= 0:
-                    p = KnessetProposal.objects.get(pk=kp['id'])
-                    this_v = Vote.objects.get(pk=v['id'])
-                    if this_v not in p.votes.all():
-                        p.votes.add(this_v)
-                        # print "add KP %d to Vote %d" % (kp['id'], this_v.id)
-                        if p.bill:
-                            p.bill.update_votes()
-
-            for pp in pps:
-                if v['c'].find(pp['c1']) >= 0:
-                    p = PrivateProposal.objects.get(pk=pp['id'])
-                    this_v = Vote.objects.get(pk=v['id'])
-                    if this_v not in p.votes.all():
-                        p.votes.add(this_v)
-
-                        if p.bill:
-                            p.bill.update_votes()
+        index = self._proposals_pattern_index(gps, kps, pps, ('c1',))
+        votes = Vote.objects.filter(title__contains='חוק').values_list('id', 'title')
+
+        found = defaultdict(set)
+        for vote_id, title in votes.iterator():
+            for model, proposal_id in index.matches(cannonize(title)):
+                found[model].add((proposal_id, vote_id))
+
+        bills_to_update = set()
+        for model, pairs in found.iteritems():
+            added = bulk_add_m2m(model, 'votes', pairs)
+            if not added:
+                continue
+            logger.debug('%d new %s links to votes' % (len(added), model.__name__))
+            bills_to_update.update(
+                self._bill_ids_of_proposals(model, set(proposal_id for proposal_id, vote_id in added)).values())
+
+        for bill in Bill.objects.filter(id__in=bills_to_update):
+            bill.update_votes()
 
     def merge_duplicate_laws(self):
         """Find and merge duplicate laws, and identical bills of each law"""
-
-        laws = Law.objects.values('id', 'title', 'merged_into')
-
-        for l in laws:
-            l['c'] = cannonize(l['title'])
-
-        for (i, l) in enumerate(laws):
-            for j in range(i + 1, len(laws)):
-                l2 = laws[j]
-                if l2['c'] == l['c'] and l2['merged_into'] == None and None == l['merged_into']:
-                    law1 = Law.objects.get(pk=l['id'])
-                    law2 = Law.objects.get(pk=l2['id'])
-                    if law1.bills.count() > law2.bills.count():
-                        law1.merge(law2)
-                    else:
-                        law2.merge(law1)
-
-        for l in Law.objects.all():
-            bills = l.bills.all()
-            for (i, b) in enumerate(bills):
-                for i2 in range(i + 1, len(bills)):
-                    if cannonize(b.title) == cannonize(bills[i2].title):
-                        b.merge(bills[i2])
+        merge_duplicates()
 
     def correct_votes_matching(self):
         """tries to find votes that are matched to bills in incorrect places
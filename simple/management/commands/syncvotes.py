@@ -13,11 +13,8 @@ class Command(NoArgsCommand):
         viewObj = VoteCsvView()
         viewReq = HttpRequest()
 
-        # execute request
-        viewRes = viewObj.dispatch(viewReq)
-
         # write result to media file
-        outputFile = ContentFile(viewRes.content)
+        outputFile = ContentFile(''.join(viewObj.csv_content(viewReq)))
         filewithpath = VoteCsvView.filename
 
         # remove existing file
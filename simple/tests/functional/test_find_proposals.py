@@ -0,0 +1,68 @@
+# encoding: utf-8
+import datetime
+
+from django.test import TestCase
+
+from committees.models import Committee, CommitteeMeeting
+from laws.models import Law, Bill, PrivateProposal, GovProposal, Vote
+from simple.management.commands.syncdata import Command
+
+
+class FindProposalsTest(TestCase):
+    def setUp(self):
+        self.law = Law.objects.create(title=u'חוק החשמל')
+        self.bill = Bill.objects.create(title=u'חוק החשמל (תיקון)', law=self.law, stage='1')
+        self.private_proposal = PrivateProposal.objects.create(title=u'(תיקון)', law=self.law, bill=self.bill,
+                                                               date=datetime.date.today())
+        self.gov_proposal = GovProposal.objects.create(title=u'(תיקון - מים)', law=Law.objects.create(
+            title=u'חוק המים'), date=datetime.date.today())
+        committee = Committee.objects.create(name='committee')
+        self.cm = CommitteeMeeting.objects.create(
+            committee=committee, date=datetime.date.today(),
+            protocol_text=u'סדר היום: הצעת חוק החשמל (תיקון), של חבר הכנסת')
+        self.old_cm = CommitteeMeeting.objects.create(
+            committee=committee, date=datetime.date.today() - datetime.timedelta(100),
+            protocol_text=u'הצעת חוק החשמל (תיקון)')
+        self.vote = Vote.objects.create(title=u'הצעת חוק המים (תיקון - מים) - קריאה ראשונה',
+                                        time=datetime.datetime.now())
+
+    def test_find_proposals_in_other_data(self):
+        command = Command()
+        command.find_proposals_in_other_data()
+        self.assertEqual(list(self.private_proposal.committee_meetings.all()), [self.cm])
+        self.assertEqual(list(self.bill.first_committee_meetings.all()), [self.cm])
+        self.assertEqual(list(self.gov_proposal.committee_meetings.all()), [])
+        self.assertEqual(list(self.gov_proposal.votes.all()), [self.vote])
+
+        # a second run adds nothing, a run over the full archive finds the old meeting too
+        command.find_proposals_in_other_data()
+        self.assertEqual(self.private_proposal.committee_meetings.count(), 1)
+        command.proposals_cms_days = 0
+        command.find_proposals_in_other_data()
+        self.assertEqual(set(self.bill.first_committee_meetings.all()), set([self.cm, self.old_cm]))
+
+
+class FindVotesInCmsTest(TestCase):
+    def setUp(self):
+        committee = Committee.objects.create(name='committee')
+        self.vote = Vote.objects.create(title=u'חוק המים - קריאה ראשונה', time=datetime.datetime.now())
+        self.other_vote = Vote.objects.create(title=u'הצעת חוק החשמל - קריאה שנייה',
+                                              time=datetime.datetime.now())
+        self.cm = CommitteeMeeting.objects.create(
+            committee=committee, date=datetime.date.today(), protocol_text_update_date=datetime.date.today(),
+            protocol_text=u'דיון לקראת קריאה\nראשונה של החוק')
+        self.old_cm = CommitteeMeeting.objects.create(
+            committee=committee, date=datetime.date.today(),
+            protocol_text_update_date=datetime.date.today() - datetime.timedelta(30),
+            protocol_text=u'אחרי הקריאה ראשונה')
+
+    def test_find_votes_in_cms(self):
+        command = Command()
+        command.find_votes_in_cms()
+        self.assertEqual(list(self.cm.votes_mentioned.all()), [self.vote])
+        self.assertEqual(list(self.old_cm.votes_mentioned.all()), [])
+
+        command.votes_in_cms_days = 0
+        command.find_votes_in_cms()
+        self.assertEqual(list(self.cm.votes_mentioned.all()), [self.vote])
+        self.assertEqual(list(self.old_cm.votes_mentioned.all()), [self.vote])
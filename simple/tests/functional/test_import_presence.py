@@ -0,0 +1,32 @@
+# encoding: utf-8
+import datetime
+
+from django.test import TestCase
+
+from mks.models import Knesset, Party, Member, WeeklyPresence
+from simple.management.commands.syncdata import Command
+
+
+def week_timestamp(weeks_ago):
+    return (datetime.date.today() - datetime.timedelta(weeks=weeks_ago)).isocalendar()[:2]
+
+
+class ImportPresenceTest(TestCase):
+    def setUp(self):
+        self.knesset = Knesset.objects.create(number=1,
+                                              start_date=datetime.date.today() - datetime.timedelta(weeks=10))
+        party = Party.objects.create(name='party', knesset=self.knesset)
+        self.member = Member.objects.create(name='mk', current_party=party, is_current=True,
+                                            start_date=datetime.date.today() - datetime.timedelta(weeks=6))
+        self.presence = {self.member.id: [(week_timestamp(4), 10.0), (week_timestamp(3), 20.0)]}
+        self.valid_weeks = [week_timestamp(4), week_timestamp(3), week_timestamp(2)]
+
+    def test_import_presence(self):
+        command = Command()
+        command.import_presence(self.presence, self.valid_weeks)
+        self.assertEqual(sorted(WeeklyPresence.objects.values_list('hours', flat=True)), [0.0, 10.0, 20.0])
+        self.assertEqual(Member.objects.get(pk=self.member.pk).average_weekly_presence_hours, 10.0)
+
+        # existing weeks are not added again
+        command.import_presence(self.presence, self.valid_weeks)
+        self.assertEqual(WeeklyPresence.objects.count(), 3)
@@ -0,0 +1,25 @@
+# encoding: utf-8
+import datetime
+
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase
+
+from laws.models import Vote
+from laws.views import VoteCsvView
+
+
+class SyncvotesCommandTest(TestCase):
+    def setUp(self):
+        self.vote = Vote.objects.create(title=u'vote on the budget', time=datetime.datetime(2015, 1, 1))
+
+    def tearDown(self):
+        if default_storage.exists(VoteCsvView.filename):
+            default_storage.delete(VoteCsvView.filename)
+
+    def test_syncvotes(self):
+        call_command('syncvotes')
+        with default_storage.open(VoteCsvView.filename) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].startswith('vote on the budget,'))
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*
+import unittest
+
+from simple.management.commands.load_file_data import LawIndex
+
+
+class TestLawIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.laws = LawIndex()
+        self.laws.add('חוקהתקציב', 'budget', 'http://example.com/1')
+        self.laws.add('התקציב', 'short', 'http://example.com/2')
+        self.laws.add('חוקהחינוך', 'education', 'http://example.com/3')
+
+    def test_last_contained_law(self):
+        self.assertEqual(self.laws.find('הצבעהעלחוקהתקציב'), ('short', 'http://example.com/2'))
+        self.assertEqual(self.laws.find('חוקהחינוךהתשעה'), ('education', 'http://example.com/3'))
+
+    def test_no_law(self):
+        self.assertIsNone(self.laws.find('חוקהבריאות'))
+        self.assertIsNone(self.laws.find(''))
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*
+import unittest
+
+from knesset.text_index import PatternIndex
+
+
+class TestPatternIndex(unittest.TestCase):
+
+    def test_matches(self):
+        index = PatternIndex([(u'חוקהחשמל', 1), (u'חוקהחשמלתיקון', 2), (u'חוקהמים', 3), (u'ab', 4)])
+        self.assertEqual(index.matches(u'דיוןבחוקהחשמלתיקוןמס3'), set([1, 2]))
+        self.assertEqual(index.matches(u'xxabחוקהמים'), set([3, 4]))
+        self.assertEqual(index.matches(u'חוקהחשמ'), set())
+        self.assertEqual(index.matches(u''), set())
+
+    def test_patterns_sharing_a_value(self):
+        index = PatternIndex()
+        index.add(u'first name of a proposal', 'p')
+        index.add(u'second name of a proposal', 'p')
+        index.add(u'', 'empty')
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.matches(u'the second name of a proposal'), set(['p']))